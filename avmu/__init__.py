@@ -2,6 +2,13 @@
 from .avmu_exceptions import *
 from .avmu_library    import *
 from .avmu_utils      import *
+from .streaming       import *
+from .cluster         import *
+from .profiles        import *
+
+import sys as _sys
+if _sys.version_info >= (3, 7):
+	from .async_interface import *
 
 ##
 #  \addtogroup Python-API
@@ -0,0 +1,304 @@
+'''
+# #########################################################################
+
+Cross-unit frame alignment for multi-AVMU acquisitions.
+
+Each AVMU numbers its own sweeps and frames. When a sweep is dropped (e.g. due
+to a socket overrun), the only indication is a jump in those counters, so frames
+from different units that were acquired in the same cycle can silently end up
+paired with the wrong frames. :class:`FrameAligner` joins per-unit frames on their
+frame counters instead, and reports any gaps.
+
+# #########################################################################
+'''
+
+import collections
+import logging
+
+import numpy as np
+
+
+AlignedFrame = collections.namedtuple('AlignedFrame', ['index', 'units', 'missing'])
+
+
+class FrameAligner(object):
+	'''
+	Join frames from several units on their frame counters.
+
+	Frames are passed in per unit with :func:`push()`, in the order each unit acquired
+	them (frames from different units can arrive in any interleaving). Each frame is
+	assigned an index from its metadata:
+
+		- ``frame_num``     The ``frame_num`` field of the frame's first path.
+		- ``sweep_number``  The ``sweep_number`` field of the frame's first path, divided
+		  by the number of paths in the frame.
+
+	Counters are unwrapped, so wrapping at ``2**counter_bits`` is handled transparently. A
+	counter that steps back by more than ``reorder_window`` frames means the unit restarted,
+	and its counter is re-seeded to carry on from its last frame (or from the oldest index
+	not yet resolved, if the other units have moved past that).
+
+	A frame index is resolved once every unit has delivered a frame with that index or later
+	(so it can no longer arrive), or once any unit is ``reorder_window`` frames ahead of it.
+	Resolved frames are emitted in index order. If some units have no frame for a resolved
+	index, it is a gap, and depending on ``gap_policy``:
+
+		- ``drop``  The partial frame is discarded, and only counted. Every emitted frame is complete.
+		- ``fill``  The partial frame is emitted, with the missing units' data filled with NaN
+		  and metadata zeroed (using the shape of the unit's last frame, or ``None`` if the
+		  unit has not delivered any frames yet), and the missing units listed in ``missing``.
+
+	Frames whose paths span more sweep numbers than the frame has paths (i.e. a sweep was
+	dropped in the middle of the frame) are discarded as torn, and treated as missing.
+
+	Every frame is handled a constant number of times, and a run of indices no unit has a
+	frame for is skipped in one step, however long it is, so the cost per frame is O(1)
+	amortized (for a fixed number of units).
+
+	Args:
+		unit_ids (list): Identifiers for the units (e.g. ``AVMU_IDX`` values).
+		reorder_window (int): Number of frames a unit can lag the others before its
+		                      missing frames are declared gaps.
+		key (str): ``frame_num`` or ``sweep_number``.
+		gap_policy (str): ``drop`` or ``fill``.
+		counter_bits (int): Width of the hardware counters.
+	'''
+
+	def __init__(self, unit_ids, reorder_window=8, key='frame_num', gap_policy='drop', counter_bits=32):
+		assert unit_ids, "At least one unit is required!"
+		assert reorder_window > 0, "The reorder window must be at least one frame!"
+		assert key in ('frame_num', 'sweep_number'), "Invalid alignment key: '%s'" % (key, )
+		assert gap_policy in ('drop', 'fill'), "Invalid gap policy: '%s'" % (gap_policy, )
+
+		self.log = logging.getLogger("Main.Dll.Alignment")
+
+		self.unit_ids       = list(unit_ids)
+		self.reorder_window = reorder_window
+		self.key            = key
+		self.gap_policy     = gap_policy
+
+		self.__modulus = 2 ** counter_bits
+
+		self.__pending    = {}
+		self.__next_index = None
+
+		# Per-unit state.
+		self.__last_raw   = {uid : None for uid in self.unit_ids}
+		self.__last_index = {uid : None for uid in self.unit_ids}
+		self.__templates  = {uid : None for uid in self.unit_ids}
+
+		self.__stats = {}
+		self.reset()
+
+	def reset(self):
+		'''
+		Discard all buffered frames and counters.
+		'''
+		self.__pending    = {}
+		self.__next_index = None
+		for uid in self.unit_ids:
+			self.__last_raw[uid]   = None
+			self.__last_index[uid] = None
+			self.__templates[uid]  = None
+
+		self.__stats = {
+			'frames_in'       : {uid : 0 for uid in self.unit_ids},
+			'missing'         : {uid : 0 for uid in self.unit_ids},
+			'restarts'        : {uid : 0 for uid in self.unit_ids},
+			'complete_frames' : 0,
+			'gap_frames'      : 0,
+			'late_frames'     : 0,
+			'duplicate_frames': 0,
+			'torn_frames'     : 0,
+		}
+
+	def getStatistics(self):
+		'''
+		Returns:
+			A dict containing:
+
+				- ``frames_in``        dict of ``unit -> frames pushed``.
+				- ``missing``          dict of ``unit -> frame indices the unit was missing from``.
+				- ``restarts``         dict of ``unit -> times the unit's counter was re-seeded``.
+				- ``complete_frames``  Frames emitted with every unit present.
+				- ``gap_frames``       Resolved frame indices with at least one unit missing.
+				- ``late_frames``      Frames that arrived after their index had been resolved.
+				- ``duplicate_frames`` Frames with the same index as one already buffered for that unit.
+				- ``torn_frames``      Frames with a dropped sweep inside the frame.
+				- ``pending_frames``   Frame indices currently buffered.
+		'''
+		ret = dict(self.__stats)
+		ret['frames_in'] = dict(ret['frames_in'])
+		ret['missing']   = dict(ret['missing'])
+		ret['restarts']  = dict(ret['restarts'])
+		ret['pending_frames'] = len(self.__pending)
+		return ret
+
+	def __unwrap(self, uid, raw, scale):
+		last = self.__last_raw[uid]
+		if last is None:
+			self.__last_raw[uid] = (raw, raw)
+			return raw
+
+		last_raw, last_value = last
+		delta = (raw - last_raw) % self.__modulus
+		if delta > self.__modulus // 2:
+			delta -= self.__modulus
+
+		if delta < -self.reorder_window * scale:
+			# Further back than any reordering: the unit restarted. Continue its numbering
+			# from its last frame, or from the oldest unresolved index if that is later.
+			index = last_value // scale + 1
+			if self.__next_index is not None:
+				index = max(index, self.__next_index)
+			value = index * scale
+			self.__last_raw[uid] = (raw, value)
+			self.__stats['restarts'][uid] += 1
+			self.log.warning("Unit %s counter went back from %s to %s, re-seeding it", uid, last_raw, raw)
+			return value
+
+		# Only move the reference forwards, so a single stale frame
+		# doesn't shift the unwrapping for the rest of the stream.
+		value = last_value + delta
+		if delta > 0:
+			self.__last_raw[uid] = (raw, value)
+		return value
+
+	def __frame_index(self, uid, meta):
+		scale = len(meta) if self.key == 'sweep_number' else 1
+		return self.__unwrap(uid, int(meta[0][self.key]), scale) // scale
+
+	def __is_torn(self, meta):
+		if len(meta) < 2:
+			return False
+		# The sweeps in a frame are contiguous, so they must span fewer sweep
+		# numbers than there are paths. Ordering within the frame isn't assumed.
+		rel = (meta['sweep_number'].astype(np.int64) - int(meta[0]['sweep_number'])) % self.__modulus
+		rel[rel > self.__modulus // 2] -= self.__modulus
+		return bool(rel.max() - rel.min() >= len(meta))
+
+	def push(self, unit_id, data, meta):
+		'''
+		Add a frame from one unit.
+
+		Args:
+			unit_id: Which unit the frame is from.
+			data (numpy array): Frame data, of shape ``(paths, receivers, points)``.
+			meta (numpy array): Structured frame metadata, of shape ``(paths, )``.
+
+		Returns:
+			List of :data:`AlignedFrame` 3-tuples of ``(index, units, missing)``, that were
+			resolved by this frame (often empty). ``units`` is an OrderedDict of
+			``unit_id -> (data, meta)``, in the order of ``unit_ids``, and ``missing`` is a
+			list of the unit ids with no frame at that index.
+		'''
+		stats = self.__stats
+		stats['frames_in'][unit_id] += 1
+
+		if self.__is_torn(meta):
+			stats['torn_frames'] += 1
+			self.log.warning("Torn frame from unit %s (sweep numbers %s)", unit_id, meta['sweep_number'])
+			return []
+
+		index = self.__frame_index(unit_id, meta)
+
+		if self.__next_index is None:
+			self.__next_index = index
+
+		if index < self.__next_index:
+			stats['late_frames'] += 1
+			return []
+
+		slot = self.__pending.setdefault(index, {})
+		if unit_id in slot:
+			stats['duplicate_frames'] += 1
+			return []
+
+		slot[unit_id] = (data, meta)
+		self.__templates[unit_id] = (data, meta)
+
+		last = self.__last_index[unit_id]
+		if last is None or index > last:
+			self.__last_index[unit_id] = index
+
+		return self.__resolve()
+
+	def flush(self):
+		'''
+		Resolve every buffered frame index, irrespective of the reorder window.
+		Used at the end of an acquisition.
+
+		Returns:
+			List of :data:`AlignedFrame` instances, as for :func:`push()`.
+		'''
+		ret = []
+		while self.__pending:
+			if self.__next_index not in self.__pending:
+				self.__skip_to(min(self.__pending))
+			ret.extend(self.__emit(self.__next_index))
+		return ret
+
+	def __resolve(self):
+		ret = []
+		last_indices = [self.__last_index[uid] for uid in self.unit_ids]
+		newest = max(tmp for tmp in last_indices if tmp is not None)
+		if any(tmp is None for tmp in last_indices):
+			oldest = None
+		else:
+			oldest = min(last_indices)
+
+		# Indices up to this one are resolved, whether or not any unit has them.
+		resolved = newest - self.reorder_window
+		if oldest is not None:
+			resolved = max(resolved, oldest)
+
+		while self.__pending:
+			idx = self.__next_index
+			if idx not in self.__pending:
+				# No unit has this index. Skip it, and every index after it that no unit has,
+				# up to the first buffered one, as far as they are resolved.
+				target = min(min(self.__pending), resolved + 1)
+				if target <= idx:
+					break
+				self.__skip_to(target)
+				continue
+			complete = len(self.__pending[idx]) == len(self.unit_ids)
+			if not (complete or idx <= resolved):
+				break
+			ret.extend(self.__emit(idx))
+		return ret
+
+	def __skip_to(self, idx):
+		# Every index from the next one up to ``idx`` was dropped by all units.
+		span = idx - self.__next_index
+		self.__next_index = idx
+		self.__stats['gap_frames'] += span
+		for uid in self.unit_ids:
+			self.__stats['missing'][uid] += span
+
+	def __emit(self, idx):
+		self.__next_index = idx + 1
+		present = self.__pending.pop(idx)
+		missing = [uid for uid in self.unit_ids if uid not in present]
+		if not missing:
+			self.__stats['complete_frames'] += 1
+			return [AlignedFrame(idx, collections.OrderedDict((uid, present[uid]) for uid in self.unit_ids), [])]
+
+		self.__stats['gap_frames'] += 1
+		for uid in missing:
+			self.__stats['missing'][uid] += 1
+		self.log.debug("Frame %s is missing units %s", idx, missing)
+
+		if self.gap_policy == 'drop':
+			return []
+
+		units = collections.OrderedDict()
+		for uid in self.unit_ids:
+			if uid in present:
+				units[uid] = present[uid]
+			elif self.__templates[uid] is not None:
+				data, meta = self.__templates[uid]
+				units[uid] = (np.full_like(data, np.nan), np.zeros_like(meta))
+			else:
+				units[uid] = None
+		return [AlignedFrame(idx, units, missing)]
@@ -0,0 +1,200 @@
+'''
+# #########################################################################
+
+asyncio wrapper for :class:`~avmu.avmu_library.AvmuInterface`.
+
+The blocking DLL calls (``initialize()``, ``measure()``, ``utilPingUnit()``, etc...)
+are run on an executor, so a single event loop can drive many AVMUs at once.
+By default the event loop's default executor is used, which is a bounded thread
+pool shared by every unit, rather than a thread per call.
+
+Requires Python 3.7 or newer.
+
+# #########################################################################
+'''
+
+import asyncio
+import functools
+
+from . import avmu_library
+from . import avmu_exceptions
+from . import streaming
+
+
+class AsyncAvmuInterface(object):
+	'''
+	Awaitable interface to a single AVMU.
+
+	Calls for a given unit are serialized (the underlying :class:`~avmu.avmu_library.AvmuInterface`
+	is not threadsafe), but calls to different units run concurrently.
+
+	Configuration calls that do not talk to the hardware (``setIPAddress()``, ``setHopRate()``,
+	``addPathToMeasure()``, etc...) can be made directly on the wrapped interface, via the
+	``interface`` attribute. Do not call them while :func:`frames()` is being iterated.
+
+	If a task awaiting :func:`measure()` or :func:`measureBatch()` is cancelled, the
+	in-progress measurement is interrupted with ``interruptMeasurement()``. As the DLL call
+	cannot be abandoned, the cancellation completes once the DLL call has returned.
+
+	Args:
+		interface (AvmuInterface): The interface to wrap. If ``None``, a new
+		                           :class:`~avmu.avmu_library.AvmuInterface` is created.
+		executor (concurrent.futures.Executor): Executor to run the blocking calls on.
+		                                        ``None`` uses the event loop's default executor.
+	'''
+
+	def __init__(self, interface=None, executor=None):
+		if interface is None:
+			interface = avmu_library.AvmuInterface()
+		self.interface = interface
+		self.executor  = executor
+
+		# Created on first use, so it is bound to the running loop.
+		self.__lock = None
+
+	def __repr__(self):
+		return "<{} wrapping {!r}>".format(self.__class__.__name__, self.interface)
+
+	def __get_lock(self):
+		if self.__lock is None:
+			self.__lock = asyncio.Lock()
+		return self.__lock
+
+	async def __run(self, func, *args, interruptible=False, **kwargs):
+		loop = asyncio.get_running_loop()
+		async with self.__get_lock():
+			fut = loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+			try:
+				return await asyncio.shield(fut)
+			except asyncio.CancelledError:
+				if interruptible:
+					try:
+						self.interface.interruptMeasurement()
+					except avmu_exceptions.Avmu_Exception:
+						pass
+
+				# The DLL call is still running on the executor. Wait for it to
+				# finish before releasing the interface to any other callers.
+				await asyncio.wait([fut])
+				if not fut.cancelled():
+					fut.exception()
+				raise
+
+	async def call(self, method_name, *args, **kwargs):
+		'''
+		Run an arbitrary :class:`~avmu.avmu_library.AvmuInterface` method on the executor.
+
+		Args:
+			method_name (str): Name of the method to call.
+			*args, **kwargs: Passed through to the method.
+
+		Returns:
+			The method's return value.
+		'''
+		return await self.__run(getattr(self.interface, method_name), *args, **kwargs)
+
+	async def initialize(self):
+		'''
+		Awaitable ``initialize()``. This can take upwards of 30 seconds.
+		'''
+		return await self.__run(self.interface.initialize)
+
+	async def utilPingUnit(self, tries=5):
+		'''
+		Awaitable ``utilPingUnit()``.
+		'''
+		return await self.__run(self.interface.utilPingUnit, tries)
+
+	async def start(self):
+		'''
+		Awaitable ``start()``.
+		'''
+		return await self.__run(self.interface.start)
+
+	async def stop(self):
+		'''
+		Awaitable ``stop()``.
+		'''
+		return await self.__run(self.interface.stop)
+
+	async def beginAsync(self):
+		'''
+		Awaitable ``beginAsync()``.
+		'''
+		return await self.__run(self.interface.beginAsync)
+
+	async def haltAsync(self):
+		'''
+		Awaitable ``haltAsync()``.
+		'''
+		return await self.__run(self.interface.haltAsync)
+
+	async def getState(self):
+		'''
+		Awaitable ``getState()``.
+		'''
+		return await self.__run(self.interface.getState)
+
+	async def measure(self):
+		'''
+		Awaitable ``measure()``. Cancelling the awaiting task interrupts the measurement.
+		'''
+		return await self.__run(self.interface.measure, interruptible=True)
+
+	async def extractAllPaths(self):
+		'''
+		Awaitable ``extractAllPaths()``.
+		'''
+		return await self.__run(self.interface.extractAllPaths)
+
+	async def measureBatch(self, frames, out=None, meta_out=None):
+		'''
+		Awaitable ``measureBatch()``. Cancelling the awaiting task interrupts the measurement.
+		'''
+		return await self.__run(self.interface.measureBatch, frames, out, meta_out, interruptible=True)
+
+	async def frames(self, capacity=64, policy=streaming.DROP_OLDEST):
+		'''
+		Asynchronously iterate over frames acquired by a background :class:`~avmu.streaming.AvmuStream`.
+
+		Usage: ``async for data, meta in device.frames(): ...``
+
+		The stream runs ``measure()`` on its own dedicated acquisition thread, so the socket
+		is drained irrespective of how quickly the loop body runs. The task must be in the
+		``TASK_STARTED`` state. The stream is stopped (interrupting any in-progress
+		measurement) when the iteration ends, whether by ``break``, an exception or
+		cancellation of the iterating task.
+
+		Args:
+			capacity (int): Number of frames the stream's ring buffer can hold.
+			policy (str): Ring-full policy. See :class:`~avmu.streaming.AvmuStream`.
+
+		Yields:
+			2-tuples of ``(data, meta)`` arrays. See :class:`~avmu.streaming.AvmuStream`.
+
+		Raises:
+			Any exception that stops the acquisition thread.
+		'''
+		loop = asyncio.get_running_loop()
+		wake = asyncio.Event()
+
+		def notify():
+			loop.call_soon_threadsafe(wake.set)
+
+		async with self.__get_lock():
+			stream = streaming.AvmuStream(self.interface, capacity=capacity, policy=policy)
+			stream.setFrameCallback(notify)
+			await loop.run_in_executor(self.executor, stream.start)
+			try:
+				while True:
+					wake.clear()
+					running = stream.isRunning()
+					frame   = stream.get(timeout=0)
+					if frame is not None:
+						yield frame
+					elif not running:
+						return
+					else:
+						await wake.wait()
+			finally:
+				await loop.run_in_executor(self.executor, stream.stop)
@@ -15,6 +15,9 @@ class Avmu_Exception(Exception):
 	Base exception class that all library exceptions inherit from. This
 	can be used to easily catch all exceptions that are specifically
 	thrown by the ``avmu`` library.
+
+	Exceptions raised for a failed DLL call carry a ``flight_record`` attribute, a
+	:class:`~avmu.flight_recorder.FlightRecord` of the task's most recent DLL calls.
 	'''
 	pass
 
@@ -15,16 +15,88 @@ Author: Connor Wolf <cwolf@akelainc.com>
 '''
 
 import logging
+import os
+import threading
+import time
 import traceback
 import numpy as np
 from . import dll_loader
 from . import avmu_exceptions
+from . import telemetry
+from . import instrumentation
+from . import tracing
+from . import flight_recorder
+from . import replay
+from . import sweep_cache
+
+
+def sweep_meta_dtype(serial_buf_sz=0):
+	'''
+	Build the numpy structured dtype used for batched sweep metadata.
+
+	Each record holds the contents of one ``SweepDataStruct`` (less the I/Q data),
+	plus the path description from ``addPathToMeasure()``. Paths with no
+	transmitting unit/port specified are stored as -1.
+
+	Args:
+		serial_buf_sz (int): Size of the serial buffer configured with ``setSerialPortFeature()``.
+		                     If nonzero, a ``serial_data_bytes`` field of that many ``uint8``
+		                     values is included.
+
+	Returns:
+		``numpy.dtype`` instance.
+	'''
+	fields = [
+		('who_is_transmitting',  np.int16),
+		('port_is_transmitting', np.int16),
+		('tx_port',              np.int8),
+		('rx_port',              np.int8),
+		('sweep_number',         np.uint32),
+		('frame_num',            np.uint32),
+		('packet_num',           np.uint32),
+		('timestamp_ticks',      np.uint32),
+		('timestamp_seconds',    np.float64),
+		('shaft_encoder_left',   np.uint32),
+		('shaft_encoder_right',  np.uint32),
+		('serial_data_age',      np.uint32),
+	]
+	if serial_buf_sz:
+		fields.append(('serial_data_bytes', np.uint8, (serial_buf_sz, )))
+	return np.dtype(fields)
+
+
+class _SweepScratch(object):
+	'''
+	Preallocated extraction target for ``extractSweepData()``.
+
+	The DLL writes I and Q into separate contiguous double arrays, so
+	every extraction lands in ``buf`` (shape ``receivers x 2 x points``)
+	and is then copied out. The cffi struct and pointer arrays are built once,
+	and reused until the point count, receiver set or serial buffer size changes.
+	'''
+	def __init__(self, ffi, point_num, receivers, serial_buf_sz):
+		self.key       = (point_num, tuple(receivers), serial_buf_sz)
+		self.point_num = point_num
+		self.receivers = list(receivers)
+
+		self.buf  = np.zeros((len(receivers), 2, point_num), dtype=np.float64)
+		self.iarr = ffi.new("double*[]", [ffi.cast("double *", self.buf[idx, 0].ctypes.data) for idx in range(len(receivers))])
+		self.qarr = ffi.new("double*[]", [ffi.cast("double *", self.buf[idx, 1].ctypes.data) for idx in range(len(receivers))])
+
+		self.serial      = ffi.new("unsigned char [{size}]".format(size=serial_buf_sz))
+		self.serial_view = np.frombuffer(ffi.buffer(self.serial), dtype=np.uint8)
+
+		self.sdat = ffi.new("SweepDataStruct *")
+		self.sdat.points.I = self.iarr
+		self.sdat.points.Q = self.qarr
+		self.sdat.serial_data_bytes = self.serial
+
 
 class AvmuInterface(object):
 
 
 
-	def __init__(self, share_from_interface = None):
+	def __init__(self, share_from_interface = None, debug = False, flight_recorder_size = 1024):
 		'''
 		Create the base AVMU interface class.
 
@@ -51,6 +123,16 @@ class AvmuInterface(object):
 		if the internal task handle has been corrupted. As such, this particular exception will not be explicitly
 		enumerated for every possible call.
 
+		Args:
+			share_from_interface (AvmuInterface): Existing interface to share the
+				underlying communication objects with, or None.
+			debug (bool): If True, every call into the DLL is logged (arguments and
+				return value) to the ``Main.Dll`` logger at debug level. Logging is
+				installed as a wrapper on the call table, so when this is False the
+				DLL calls carry no logging overhead at all.
+			flight_recorder_size (int): Number of DLL calls kept by the flight recorder
+				(see :func:`getFlightRecord()`), or 0 to disable it.
+
 		'''
 
 
@@ -67,13 +149,50 @@ class AvmuInterface(object):
 		self.log.debug("Constructing constant mapping tables.")
 		self.___construct_map_tables()
 
+		# Cached task configuration/state values. See getTaskConfiguration().
+		self.__config_cache = {}
+
 		self.task_handle = self.__createTask(share_from_interface)
 
+		# Per-task DLL call table, with the task handle pre-bound.
+		self.task_dll = dll_loader.TaskBinding(self.dll, self.task_handle)
+		self.ERR_OK   = self.dll.ERR_OK
+
+		# Installed first, so it is the innermost wrapper, and its timings
+		# don't include any of the optional instrumentation.
+		self.flight_recorder = None
+		self.__error_name_map = None
+		self.flight_recorder_dir = os.environ.get("AVMU_FLIGHT_RECORDER_DIR")
+		self.__flight_dump_count = 0
+		self.__flight_dump_last  = None
+		if flight_recorder_size:
+			self.flight_recorder = flight_recorder.FlightRecorder(flight_recorder_size)
+			self.task_dll.add_wrapper('flight_recorder', self.flight_recorder.wrap)
+
+		if debug:
+			self.task_dll.add_wrapper('debug', self.__debug_call_wrapper)
+
+		self.telemetry = telemetry.AcquisitionTelemetry(self.dll.ERR_OK, self.dll.ERR_BYTES, self.dll.ERR_NO_RESPONSE)
+		self.call_instrumentation = None
+		self.recorder = None
+
 		self.measured_paths = []
+		self.__measured_path_enums = []
 
 		self.serial_buf_sz = 0
 		self.active_receivers = [0]
 
+		self.__sweep_scratch   = None
+		self.__batch_pool      = None
+		self.__metadata_format = 'dict'
+		self.__output_dtype    = np.dtype(np.complex128)
+
+		# See setSweepPlanCache(). The key is that of the sweep plan currently set
+		# by utilGenerateLinearSweep(), so its frame time can be recorded.
+		self.__sweep_plan_cache = None
+		self.__sweep_plan_key   = None
+		self.__exclusion_bands  = []
+
 	def __del__(self):
 		try:
 			self.__deleteTask(self.task_handle)
@@ -97,11 +216,9 @@ class AvmuInterface(object):
 
 
 	def __getRawTaskHandle(self):
-		self.log.debug("__getRawTaskHandle call")
 		return self.task_handle
 
 	def __createTask(self, fromtask):
-		self.log.debug("__createTask call")
 		# Signature: TaskHandle createTask();
 		self.log.debug("Creating task.")
 		if fromtask:
@@ -112,7 +229,6 @@ class AvmuInterface(object):
 		return th
 
 	def __deleteTask(self, task_handle):
-		self.log.debug("__deleteTask call")
 		# Signature: void deleteTask(TaskHandle t);
 		self.log.info("Destroying task.")
 		self.dll.deleteTask(task_handle)
@@ -123,7 +239,6 @@ class AvmuInterface(object):
 
 
 
-		self.log.debug("___construct_map_tables call")
 		self.errors = {
 			self.dll.ERR_OK                                 : None,
 			self.dll.ERR_BAD_ATTEN                          : avmu_exceptions.Avmu_Exception_Bad_Atten,
@@ -360,8 +475,26 @@ class AvmuInterface(object):
 		}
 
 
+	def __debug_call_wrapper(self, name, func):
+		log = self.log
+		def wrapped(*args):
+			ret = func(*args)
+			log.debug("DLL call: %s%s -> %s", name, args, ret)
+			return ret
+		return wrapped
+
 	def __check_ret(self, ret_val):
-		self.log.debug("__check_ret call")
+		# Callers only invoke this for return values other than ERR_OK, so
+		# the state query below is only paid on the error path.
+		if ret_val == self.ERR_OK:
+			return
+
+		# Snapshot the call history before the state query below adds to it.
+		record = self.getFlightRecord()
+
+		# Failed calls can leave the task in a different state than we
+		# think it is in, so always re-query the state here.
+		self.__config_cache.pop('state', None)
 		try:
 			state = self.getState()
 		except Exception:
@@ -371,13 +504,307 @@ class AvmuInterface(object):
 		assert ret_val in self.errors, "Unknown returned error code: %s. Current state: %s" % (ret_val, state)
 		err = self.errors[ret_val]
 		if err:
-			raise err("Call returned error value: %s. Current state: %s" % (ret_val, state))
+			exc = err("Call returned error value: %s. Current state: %s" % (ret_val, state))
+			if record is not None:
+				record.context['state'] = state
+				record.context['ret']   = ret_val
+				exc.flight_record = record
+				self.__save_flight_record(record, err.__name__)
+			raise exc
+
+	def __save_flight_record(self, record, name):
+		if not self.flight_recorder_dir:
+			return
+
+		# Only the first error of a burst is written, as the records of the
+		# errors that follow it mostly repeat its history.
+		now = time.monotonic()
+		if self.__flight_dump_last is not None and now - self.__flight_dump_last < flight_recorder.DUMP_INTERVAL:
+			return
+		self.__flight_dump_last   = now
+		self.__flight_dump_count += 1
+
+		wall = time.time()
+		path = os.path.join(self.flight_recorder_dir, "avmu-flight-%s.%06d-%s-%s-%s.npz" % (
+				time.strftime("%Y%m%d-%H%M%S", time.localtime(wall)), int(wall % 1 * 1e6), os.getpid(),
+				self.__flight_dump_count, name))
+
+		# Written off the calling (usually acquisition) thread.
+		thread = threading.Thread(target=self.__write_flight_record, args=(record, name, path), name="AvmuFlightRecord")
+		thread.daemon = True
+		thread.start()
+
+	def __write_flight_record(self, record, name, path):
+		try:
+			record.save(path)
+			self.log.warning("Flight record for %s written to %s", name, path)
+		except (IOError, OSError) as e:
+			self.log.error("Failed to write flight record to %s: %s", path, e)
 
+	def getFlightRecord(self):
+		'''
+		Get the recent history of DLL calls made by this task.
+
+		Every call made through the task (function, return code, sweep number for
+		extraction calls, start time and duration) is kept in a fixed-size ring, sized by the
+		``flight_recorder_size`` constructor argument. When a call fails, a snapshot
+		is also attached to the raised exception as ``flight_record``, and, if the
+		``AVMU_FLIGHT_RECORDER_DIR`` environment variable (or the ``flight_recorder_dir``
+		attribute) is set, written to that directory as a ``.npz`` file, from a background
+		thread. Only the first failure in any ``flight_recorder.DUMP_INTERVAL`` seconds is
+		written, so a burst of errors produces one file.
+
+		Returns:
+			A :class:`~avmu.flight_recorder.FlightRecord`, or None if the flight recorder is disabled.
+		'''
+		if self.flight_recorder is None:
+			return None
+		context = {
+			'avmu_ip'     : self.__config_cache.get('ip'),
+			'avmu_port'   : self.__config_cache.get('port'),
+			'error_names' : self.__error_names(),
+		}
+		return self.flight_recorder.snapshot(context)
+
+	def __error_names(self):
+		if self.__error_name_map is None:
+			self.__error_name_map = {getattr(self.dll, name) : name for name in dir(self.dll) if name.startswith("ERR_")}
+		return self.__error_name_map
+
+
+	def __invalidate_config(self, *keys):
+		'''
+		Drop cached configuration values. With no arguments, the entire cache is dropped.
+		'''
+		if not keys:
+			self.__config_cache.clear()
+			return
+		for key in keys:
+			self.__config_cache.pop(key, None)
+
+	def invalidateConfigurationCache(self):
+		'''
+		Discard all cached task configuration and state values, forcing them to be
+		re-read from the DLL on next use.
+
+		The cache is maintained automatically by every setter and state-transition method
+		in this class, so this is only needed if the task has been modified through some
+		other means (e.g. by calling the DLL directly).
+		'''
+		self.__invalidate_config()
+
+	def getTaskConfiguration(self):
+		'''
+		Get a snapshot of the task's configuration and state.
+
+		Values are cached by the interface, and only re-read from the DLL after
+		the setters or state-transition methods that can change them
+		(``setFrequencies()``, ``utilGenerateLinearSweep()``, ``setEnabledReceivers()``,
+		``setIPAddress()``, ``start()``, ``stop()``, etc...) have been called.
+		As such, this is cheap to call repeatedly.
+
+		Returns:
+			A dict with the keys ``npts``, ``receivers``, ``ip``, ``port``, ``hop_rate``,
+			``measurement_type``, ``timeout`` and ``state``.
+		'''
+		return {
+			'npts'             : self.getNumberOfFrequencies(),
+			'receivers'        : list(self.getEnabledReceivers()),
+			'ip'               : self.getIPAddress(),
+			'port'             : self.getIPPort(),
+			'hop_rate'         : self.getHopRate(),
+			'measurement_type' : self.getMeasurementType(),
+			'timeout'          : self.getTimeout(),
+			'state'            : self.getState(),
+		}
 
 	#################################################################################
 	#        Configuration
 	#################################################################################
 
+	def getTelemetry(self):
+		'''
+		Get a snapshot of this task's acquisition health counters.
+
+		Frames received, byte errors, timeouts and dropped sweeps (from gaps in the
+		``sweep_number`` sequence) are counted as ``measure()`` and the extraction calls run,
+		along with rolling ``measure()`` wait, cycle and extraction times. The timing values
+		are also normalized against ``getPreciseTimePerFrame()``, so a unit that is drifting
+		towards a socket overrun (``load`` approaching 1) can be spotted before it starts
+		losing data.
+
+		Returns:
+			A dict. See :func:`avmu.telemetry.AcquisitionTelemetry.snapshot()` for the contents.
+		'''
+		frame_time = self.getPreciseTimePerFrame()
+		return self.telemetry.snapshot(frame_time if frame_time > 0 else None)
+
+	def resetTelemetry(self):
+		'''
+		Zero the counters returned by :func:`getTelemetry()`.
+		'''
+		self.telemetry.reset()
+
+	def enableCallInstrumentation(self, enable=True, labels=None):
+		'''
+		Enable or disable per-call latency histograms for every DLL call made by this task.
+
+		While enabled, the duration of every call through the task's DLL call table
+		(``initialize()``, ``start()``, ``measure()``, ``extractSweepData()``, etc...)
+		is recorded into a log-bucketed histogram for that function. Recording is
+		per-thread, and takes no locks. When disabled, the DLL calls are not wrapped,
+		and there is no overhead.
+
+		The recorded statistics are kept when instrumentation is disabled, and
+		recording resumes into the same histograms if it is re-enabled.
+
+		Args:
+			enable (bool): Enable or disable recording.
+			labels (dict): Labels attached to the exported statistics. If not
+			               specified, ``version`` is set to the DLL's ``versionString()``.
+
+		Returns:
+			The :class:`~avmu.instrumentation.CallInstrumentation` instance, or None if disabled.
+		'''
+		if not enable:
+			self.task_dll.remove_wrapper('latency')
+			return None
+
+		if self.call_instrumentation is None:
+			if labels is None:
+				labels = {'version' : self.versionString()}
+			self.call_instrumentation = instrumentation.CallInstrumentation(labels)
+		elif labels is not None:
+			self.call_instrumentation.labels = dict(labels)
+
+		self.task_dll.add_wrapper('latency', self.call_instrumentation.wrap)
+		return self.call_instrumentation
+
+	def getCallStatistics(self, include_buckets=False):
+		'''
+		Get the per-function call counts and latency statistics recorded since
+		:func:`enableCallInstrumentation()` was called.
+
+		Args:
+			include_buckets (bool): Include the raw histogram buckets.
+
+		Returns:
+			A dict. See :func:`avmu.instrumentation.CallInstrumentation.snapshot()`.
+			If instrumentation was never enabled, ``functions`` is empty.
+		'''
+		if self.call_instrumentation is None:
+			return {'labels' : {}, 'functions' : {}}
+		return self.call_instrumentation.snapshot(include_buckets=include_buckets)
+
+	def exportCallStatistics(self, fmt='json'):
+		'''
+		Export the call statistics as text.
+
+		Args:
+			fmt (str): ``json``, or ``prometheus`` for the Prometheus text exposition format.
+
+		Returns:
+			The exported statistics, as a string.
+		'''
+		assert fmt in ('json', 'prometheus'), "Invalid export format: '%s'" % (fmt, )
+		inst = self.call_instrumentation or instrumentation.CallInstrumentation()
+		if fmt == 'prometheus':
+			return inst.toPrometheus()
+		return inst.toJson()
+
+	def resetCallStatistics(self):
+		'''
+		Zero the recorded call statistics.
+		'''
+		if self.call_instrumentation is not None:
+			self.call_instrumentation.reset()
+
+	def enableTracing(self, enable=True, tracer=None, label=None):
+		'''
+		Record a timeline span for every DLL call made by this task.
+
+		Spans are recorded into ``tracer`` (the default :mod:`avmu.tracing` tracer if not
+		specified, which is enabled if needed), alongside any user-defined stages
+		recorded with :func:`avmu.tracing.span()`. Use :func:`avmu.tracing.Tracer.dump()`
+		to write a Chrome Trace Event file.
+
+		When disabled, the DLL calls are not wrapped, and there is no overhead.
+
+		Args:
+			enable (bool): Enable or disable tracing for this task.
+			tracer (Tracer): Tracer to record into.
+			label (str): Value of the ``unit`` argument attached to every span. Defaults to
+			             the current IP address.
+
+		Returns:
+			The :class:`~avmu.tracing.Tracer` in use, or None if disabled.
+		'''
+		if not enable:
+			self.task_dll.remove_wrapper('trace')
+			return None
+
+		if tracer is None:
+			tracer = tracing.enable()
+		if label is None:
+			label = self.getIPAddress() or hex(id(self))
+
+		self.task_dll.add_wrapper('trace', tracer.wrapper({'unit' : label}))
+		return tracer
+
+	def startRecording(self, path, info=None):
+		'''
+		Record every DLL call made by this task to ``path``, for later replay with the
+		``replay`` backend (see :mod:`avmu.replay`).
+
+		The recording contains the timing and return code of every ``measure()`` call,
+		the data and metadata of every extracted sweep, every other call with its
+		arguments, and a snapshot of the task configuration (``getTaskConfiguration()``,
+		plus ``hardware``, ``freqs``, ``frame_time``, ``paths`` and ``serial_buf_sz``)
+		at the start of the recording and after each ``initialize()`` and ``start()``.
+
+		Args:
+			path (str): Output file path. Existing files are overwritten.
+			info (dict): Extra values to store in the recording header.
+
+		Returns:
+			The :class:`~avmu.replay.SessionRecorder`.
+		'''
+		self.stopRecording()
+		header = {'library_version' : self.versionString()}
+		header.update(info or {})
+		self.recorder = replay.SessionRecorder(
+				path        = path,
+				ffi         = self.ffi,
+				err_ok      = self.ERR_OK,
+				err_names   = self.__error_names(),
+				tx_names    = self.tx_paths_enum_str,
+				rx_names    = self.rx_paths_enum_str,
+				config_func = self.__recording_config,
+				info        = header,
+			)
+		self.recorder.recordConfig()
+		self.task_dll.add_wrapper('recorder', self.recorder.wrap)
+		return self.recorder
+
+	def stopRecording(self):
+		'''
+		Stop recording, and close the recording file. Does nothing if not recording.
+		'''
+		if self.recorder is None:
+			return
+		recorder, self.recorder = self.recorder, None
+		self.task_dll.remove_wrapper('recorder')
+		recorder.close()
+
+	def __recording_config(self):
+		config = self.getTaskConfiguration()
+		config['hardware']      = self.getHardwareDetails()
+		config['freqs']         = self.getFrequencies()
+		config['frame_time']    = self.getPreciseTimePerFrame()
+		config['serial_buf_sz'] = self.serial_buf_sz
+		config['paths']         = [(self.tx_paths_enum_str[tx], self.rx_paths_enum_str[rx]) for tx, rx in self.__measured_path_enums]
+		return config
+
 	def addPathToMeasure(self, tx_path, rx_path, who_is_transmitting=None, port_is_transmitting=None):
 		'''
 		Add a path to measure.
@@ -404,7 +831,6 @@ class AvmuInterface(object):
 			:class:`~avmu.avmu_exceptions.Avmu_Exception_Bad_Path`:   if a path value specified is invalid.
 
 		'''
-		self.log.debug("addPathToMeasure call")
 		# Signature: ErrCode addPathToMeasure(TaskHandle t, RFPath path);
 		if not tx_path in self.tx_paths: raise avmu_exceptions.Avmu_Exception_Bad_Path("Invalid TX Path: '%s'" % (tx_path, ))
 		if not rx_path in self.rx_paths: raise avmu_exceptions.Avmu_Exception_Bad_Path("Invalid RX Path: '%s'" % (rx_path, ))
@@ -422,8 +848,11 @@ class AvmuInterface(object):
 
 		self.log.debug("Adding path to measure: %s -> %s (transmiting:  %s -> %s)", tx_path, rx_path, who_is_transmitting, port_is_transmitting)
 		self.measured_paths.append((who_is_transmitting, port_is_transmitting, self.tx_paths_int[tx_path], self.rx_paths_int[rx_path]))
-		ret = self.dll.addPathToMeasure(self.task_handle, self.tx_paths[tx_path], self.rx_paths[rx_path])
-		self.__check_ret(ret)
+		self.__measured_path_enums.append((self.tx_paths[tx_path], self.rx_paths[rx_path]))
+		self.__invalidate_config('frame_time')
+		ret = self.task_dll.addPathToMeasure(self.tx_paths[tx_path], self.rx_paths[rx_path])
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	def clearMeasuredPaths(self):
 		'''
@@ -433,12 +862,14 @@ class AvmuInterface(object):
 			Nothing
 
 		'''
-		self.log.debug("clearMeasuredPaths call")
 		# Signature: ErrCode clearMeasuredPaths(TaskHandle t);
 		self.log.debug("Clearing measured paths")
 		self.measured_paths = []
-		ret = self.dll.clearMeasuredPaths(self.task_handle)
-		self.__check_ret(ret)
+		self.__measured_path_enums = []
+		self.__invalidate_config('frame_time')
+		ret = self.task_dll.clearMeasuredPaths()
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -459,13 +890,28 @@ class AvmuInterface(object):
 
 
 		'''
-		self.log.debug("getFrequencies call")
+		return self.getFrequencyArray().tolist()
+
+	def getFrequencyArray(self):
+		'''
+		Get the frequencies returned by :func:`getFrequencies()`, as a read-only
+		numpy array. The array is cached until the sweep changes, so repeated calls
+		do not copy anything.
+
+		Returns:
+			float64 numpy array of frequencies, in MHz
+		'''
 		# Signature: ErrCode getFrequencies(TaskHandle t, double* freqs, int pts_in_freqs);
-		npts = self.getNumberOfFrequencies()
-		freq_arr = self.ffi.new("double[] ", [0] * npts)
-		ret = self.dll.getFrequencies(self.task_handle, freq_arr, npts)
-		self.__check_ret(ret)
-		return list(freq_arr)
+		if 'freqs' not in self.__config_cache:
+			npts = self.getNumberOfFrequencies()
+			freq_arr = self.ffi.new("double[]", npts)
+			ret = self.task_dll.getFrequencies(freq_arr, npts)
+			if ret != self.ERR_OK:
+				self.__check_ret(ret)
+			freqs = np.frombuffer(self.ffi.buffer(freq_arr), dtype=np.float64).copy()
+			freqs.setflags(write=False)
+			self.__config_cache['freqs'] = freqs
+		return self.__config_cache['freqs']
 
 	def setFrequencies(self, freqs):
 		'''
@@ -482,7 +928,8 @@ class AvmuInterface(object):
 		generated.
 
 		Args:
-			freqs (list): array of frequencies to sample, in MHz
+			freqs (list): array of frequencies to sample, in MHz. A float64 numpy
+			              array is passed to the DLL without conversion.
 
 		Returns:
 			Nothing
@@ -495,11 +942,16 @@ class AvmuInterface(object):
 			                                beyond the allowed min/max. (You can get the min and max from \
 			                                the HardwareDetails struct returned by :func:`getHardwareDetails()`)
 		'''
-		self.log.debug("setFrequencies call")
 		# Signature: ErrCode setFrequencies(TaskHandle t, const double* freqs, const unsigned int N);
-		freq_arr = self.ffi.new("double[] ", freqs)
-		ret = self.dll.setFrequencies(self.task_handle, freq_arr, len(freqs))
-		self.__check_ret(ret)
+		if isinstance(freqs, np.ndarray) and freqs.dtype == np.float64 and freqs.flags.c_contiguous:
+			freq_arr = self.ffi.from_buffer("double[]", freqs)
+		else:
+			freq_arr = self.ffi.new("double[] ", list(freqs))
+		self.__invalidate_config('npts', 'freqs', 'frame_time')
+		self.__sweep_plan_key = None
+		ret = self.task_dll.setFrequencies(freq_arr, len(freqs))
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -512,12 +964,14 @@ class AvmuInterface(object):
 			Current hop rate as a string.
 		'''
 
-		self.log.debug("getHopRate call")
 		# Signature: HopRate getHopRate(TaskHandle t);
-		ret = self.dll.getHopRate(self.task_handle)
+		if 'hop' in self.__config_cache:
+			return self.__config_cache['hop']
+		ret = self.task_dll.getHopRate()
 		for key, value in self.hops.items():
 			if value == ret:
 				self.log.debug("Current hop rate: %s", key)
+				self.__config_cache['hop'] = key
 				return key
 		raise avmu_exceptions.Avmu_Exception_Missing_Hop("getHopRate() returned an unknown hop-rate value: %s" % ret)
 
@@ -536,13 +990,14 @@ class AvmuInterface(object):
 			 :class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State` if the Task is not in the ``TASK_UNINITIALIZED`` or ``TASK_STOPPED`` state
 		'''
 
-		self.log.debug("setHopRate call")
 		# Signature: ErrCode setHopRate(TaskHandle t, const HopRate rate);
 		self.log.debug("Setting hop rate to: %s", hop_str)
 		assert hop_str != "HOP_UNDEFINED", "You cannot set the hop rate to undefined!"
 		assert hop_str in self.hops, "Invalid hop rate: '%s'!" % hop_str
-		ret = self.dll.setHopRate(self.task_handle, self.hops[hop_str])
-		self.__check_ret(ret)
+		self.__invalidate_config('hop', 'frame_time')
+		ret = self.task_dll.setHopRate(self.hops[hop_str])
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -556,15 +1011,17 @@ class AvmuInterface(object):
 			string of the current remote IP. If the IP is unset, returns ``None``
 		'''
 
-		self.log.debug("getIPAddress call")
 		# Signature: const char* getIPAddress(TaskHandle t);
-		ret = self.dll.getIPAddress(self.task_handle)
+		if 'ip' in self.__config_cache:
+			return self.__config_cache['ip']
+		ret = self.task_dll.getIPAddress()
 
 		if ret == self.ffi.NULL:
 			self.log.debug("Null remote IP!")
 			return None
 		ret = self.ffi.string(ret).decode("ascii")
 		self.log.debug("Current remote IP address: %s", ret)
+		self.__config_cache['ip'] = ret
 		return ret
 
 	def setIPAddress(self, ip_address):
@@ -581,12 +1038,13 @@ class AvmuInterface(object):
 			 :class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State`if the Task is not in the ``TASK_UNINITIALIZED`` or ``TASK_STOPPED`` state
 
 		'''
-		self.log.debug("setIPAddress call")
 		# Signature: ErrCode setIPAddress(TaskHandle t, const char* ipv4);
 		assert ip_address.strip("0123456789.") == "", "Invalid characters in IP: '%s' (full string: '%s')" % (ip_address.strip("0123456789."), ip_address)
 		self.log.debug("Setting remote IP address to: %s", ip_address)
-		ret = self.dll.setIPAddress(self.task_handle, ip_address.encode("ascii"))
-		self.__check_ret(ret)
+		self.__invalidate_config('ip', 'state')
+		ret = self.task_dll.setIPAddress(ip_address.encode("ascii"))
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -594,10 +1052,12 @@ class AvmuInterface(object):
 		'''
 		Get the current port for IP communications. When uninitialized, this will default to 0.
 		'''
-		self.log.debug("getIPPort call")
 		# Signature: int getIPPort(TaskHandle t);
-		port = self.dll.getIPPort(self.task_handle)
+		if 'port' in self.__config_cache:
+			return self.__config_cache['port']
+		port = self.task_dll.getIPPort()
 		self.log.debug("Current remote IP port: %s", port)
+		self.__config_cache['port'] = port
 		return port
 
 	def setIPPort(self, port):
@@ -619,11 +1079,12 @@ class AvmuInterface(object):
 			 :class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State`if the Task is not in the ``TASK_UNINITIALIZED`` or ``TASK_STOPPED`` state
 		'''
 
-		self.log.debug("setIPPort call")
 		# Signature: ErrCode setIPPort(TaskHandle t, const int port);
 		self.log.debug("Setting remote IP port to: %s", port)
-		ret = self.dll.setIPPort(self.task_handle, port)
-		self.__check_ret(ret)
+		self.__invalidate_config('port', 'state')
+		ret = self.task_dll.setIPPort(port)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -634,12 +1095,14 @@ class AvmuInterface(object):
 		Returns:
 			(str) Current measurement type.
 		'''
-		self.log.debug("getMeasurementType call")
 		# Signature: ProgramType getMeasurementType(TaskHandle t);
-		prog = self.dll.getMeasurementType(self.task_handle)
+		if 'prog' in self.__config_cache:
+			return self.__config_cache['prog']
+		prog = self.task_dll.getMeasurementType()
 
 		for prog_name, prog_val in self.prog_type.items():
 			if prog_val == prog:
+				self.__config_cache['prog'] = prog_name
 				return prog_name
 
 		raise avmu_exceptions.Avmu_Exception_Wrong_Program_Type("Unknown program type value (%s)!" % prog)
@@ -652,12 +1115,13 @@ class AvmuInterface(object):
 		Args:
 			measure_type (str) One of the ProgramType types (``PROG_ASYNC`` or ``PROG_SYNC``).
 		'''
-		self.log.debug("setMeasurementType call")
 		# Signature: ErrCode setMeasurementType(TaskHandle t, const ProgramType type);
 		assert measure_type in self.prog_type, "Invalid measurement type!"
 		measurement_type_code = self.prog_type[measure_type]
-		ret = self.dll.setMeasurementType(self.task_handle, measurement_type_code)
-		self.__check_ret(ret)
+		self.__invalidate_config('prog')
+		ret = self.task_dll.setMeasurementType(measurement_type_code)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -676,13 +1140,13 @@ class AvmuInterface(object):
 			 :class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State` if the task is either UNINITIALIZED or STOPPED.
 
 		'''
-		self.log.debug("setGainSetting call")
 		# ErrCode getIfGain(TaskHandle t, IfGain* new_gain);
 		assert gain_setting in self.if_gain_settings, "Invalid gain value!"
 		new_if_gain_enum = self.if_gain_settings[gain_setting]
 		# print("Specified gain: %s, %s" % (gain_setting, new_if_gain_enum))
-		ret = self.dll.setIfGain(self.task_handle, new_if_gain_enum)
-		self.__check_ret(ret)
+		ret = self.task_dll.setIfGain(new_if_gain_enum)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 
 	def getGainSetting(self):
@@ -692,11 +1156,11 @@ class AvmuInterface(object):
 		Returns:
 			(str) Current IF gain settings.
 		'''
-		self.log.debug("getGainSetting call")
 		# ErrCode setIfGain(TaskHandle t, IfGain new_gain);
 		current_gain_setting = self.ffi.new("int *", 0)
-		ret = self.dll.getIfGain(self.task_handle, current_gain_setting)
-		self.__check_ret(ret)
+		ret = self.task_dll.getIfGain(current_gain_setting)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 		if current_gain_setting[0] in self.if_gain_inverse:
 			return self.if_gain_inverse[current_gain_setting[0]]
@@ -712,12 +1176,12 @@ class AvmuInterface(object):
 		Args:
 			insert_pad (bool): Whether the pad is inserted.
 		'''
-		self.log.debug("setReceiver12dBPad call")
 		# ErrCode getIfGain(TaskHandle t, IfGain* new_gain);
 		assert isinstance(insert_pad, bool), "insert_pad must be a boolean!"
 
-		ret = self.dll.setReceiver12dBPad(self.task_handle, insert_pad)
-		self.__check_ret(ret)
+		ret = self.task_dll.setReceiver12dBPad(insert_pad)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	def getReceiver12dBPad(self):
 		'''
@@ -728,11 +1192,11 @@ class AvmuInterface(object):
 		Returns:
 			(bool) True if pad is enabled.
 		'''
-		self.log.debug("getReceiver12dBPad call")
 		# ErrCode setIfGain(TaskHandle t, IfGain new_gain);
 		is_inserted = self.ffi.new("bool *", False)
-		ret = self.dll.getReceiver12dBPad(self.task_handle, is_inserted)
-		self.__check_ret(ret)
+		ret = self.task_dll.getReceiver12dBPad(is_inserted)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 		return is_inserted[0]
 
@@ -750,9 +1214,11 @@ class AvmuInterface(object):
 			(int) Number of frequency points in the current sweep.
 
 		'''
-		self.log.debug("getNumberOfFrequencies call")
 		# Signature: unsigned int getNumberOfFrequencies(TaskHandle t);
-		freqNum = self.dll.getNumberOfFrequencies(self.task_handle)
+		if 'npts' in self.__config_cache:
+			return self.__config_cache['npts']
+		freqNum = self.task_dll.getNumberOfFrequencies()
+		self.__config_cache['npts'] = freqNum
 		return freqNum
 
 
@@ -770,6 +1236,11 @@ class AvmuInterface(object):
 		mode, as it will repeatedly sample the same frequency for the duration of the
 		sweep. This is a valid operating mode.
 
+		If a sweep plan cache is set (see :func:`setSweepPlanCache()`), and it holds the
+		plan for this unit, sweep and set of exclusion bands, the cached frequencies are
+		set directly with :func:`setFrequencies()`. Otherwise, the generated frequencies
+		are added to the cache.
+
 		Args:
 			startF_mhz (float) Start frequency of sweep in Mhz
 			stopF_mhz (float) End frequency of sweep in Mhz
@@ -783,10 +1254,72 @@ class AvmuInterface(object):
 			                                beyond the allowed min/max. (You can get the min and max from \
 			                                the HardwareDetails struct returned by :func:`getHardwareDetails()`)
 		'''
-		self.log.debug("utilGenerateLinearSweep call")
 		# Signature: ErrCode utilGenerateLinearSweep(TaskHandle t, const double startFreq, const double endFreq, const unsigned int N);
-		ret = self.dll.utilGenerateLinearSweep(self.task_handle, startF_mhz, stopF_mhz, points)
-		self.__check_ret(ret)
+		key = None
+		if self.__sweep_plan_cache is not None:
+			key = sweep_cache.sweep_plan_key(self.__serial_number(), startF_mhz, stopF_mhz, points, self.__exclusion_bands)
+			plan = self.__sweep_plan_cache.get(key)
+			if plan is not None:
+				self.setFrequencies(plan.frequencies)
+				self.__config_cache['npts']  = len(plan.frequencies)
+				self.__config_cache['freqs'] = plan.frequencies
+				self.__sweep_plan_key = key
+				return
+
+		self.__invalidate_config('npts', 'freqs', 'frame_time')
+		self.__sweep_plan_key = None
+		ret = self.task_dll.utilGenerateLinearSweep(startF_mhz, stopF_mhz, points)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
+
+		if key is not None:
+			self.__sweep_plan_cache.put(key, self.getFrequencyArray())
+			self.__sweep_plan_key = key
+
+	def setSweepPlanCache(self, cache):
+		'''
+		Set the :class:`~avmu.sweep_cache.SweepPlanCache` used by :func:`utilGenerateLinearSweep()`
+		and :func:`utilFixLinearSweepLimits()`. The frame time of cached plans is recorded (for
+		the current hop rate and number of measured paths) when it is read with
+		:func:`getPreciseTimePerFrame()`.
+
+		A cache can be shared by any number of interfaces, as plans are keyed by the unit's
+		serial number.
+
+		Args:
+			cache (SweepPlanCache): The cache, or ``None`` to stop using one.
+
+		Returns:
+			Nothing
+		'''
+		self.__sweep_plan_cache = cache
+		self.__sweep_plan_key   = None
+
+	def getSweepPlanCache(self):
+		'''
+		Get the cache set with :func:`setSweepPlanCache()`.
+
+		Returns:
+			The :class:`~avmu.sweep_cache.SweepPlanCache`, or ``None``.
+		'''
+		return self.__sweep_plan_cache
+
+	def getSweepPlan(self):
+		'''
+		Get the cached plan for the sweep most recently set with :func:`utilGenerateLinearSweep()`.
+
+		Returns:
+			The :class:`~avmu.sweep_cache.SweepPlan`, or ``None`` if there is no cache, or the
+			sweep has been changed since by other means.
+		'''
+		if self.__sweep_plan_cache is None or self.__sweep_plan_key is None:
+			return None
+		return self.__sweep_plan_cache.get(self.__sweep_plan_key)
+
+	def __serial_number(self):
+		if 'serial' not in self.__config_cache:
+			self.__config_cache['serial'] = self.getHardwareDetails()['serial_number']
+		return self.__config_cache['serial']
 
 	###############################################################
 
@@ -797,10 +1330,12 @@ class AvmuInterface(object):
 		Returns:
 			(int) socket timeout, in milliseconds.
 		'''
-		self.log.debug("getTimeout call")
 		# Signature: unsigned int getTimeout(TaskHandle t);
-		timeout = self.dll.getTimeout(self.task_handle)
+		if 'timeout' in self.__config_cache:
+			return self.__config_cache['timeout']
+		timeout = self.task_dll.getTimeout()
 		self.log.debug("Current timeout value: %s ms", timeout)
+		self.__config_cache['timeout'] = timeout
 		return timeout
 
 	def setTimeout(self, timeout_ms):
@@ -819,11 +1354,12 @@ class AvmuInterface(object):
 		Returns:
 			Nothing
 		'''
-		self.log.debug("setTimeout call")
 		# Signature: ErrCode setTimeout(TaskHandle t, const unsigned int timeout);
 		self.log.debug("Setting socket timeout to: %s ms", timeout_ms)
-		ret = self.dll.setTimeout(self.task_handle, timeout_ms)
-		self.__check_ret(ret)
+		self.__invalidate_config('timeout')
+		ret = self.task_dll.setTimeout(timeout_ms)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -834,11 +1370,11 @@ class AvmuInterface(object):
 		Returns:
 			True if the hardware supports a serial port, False if not.
 		'''
-		self.log.debug("isSerialPortPresent call")
 		# Signature: ErrCode isSerialPortPresent(TaskHandle t, bool* present);
 		present = self.ffi.new("bool *", False)
-		ret = self.dll.isSerialPortPresent(self.task_handle, present)
-		self.__check_ret(ret)
+		ret = self.task_dll.isSerialPortPresent(present)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 		return present[0]
 
 	def setSerialPortFeature(self, enable, buffer_size = 128):
@@ -856,12 +1392,12 @@ class AvmuInterface(object):
 			    does not have a serial port.
 
 		'''
-		self.log.debug("setSerialPortFeature call")
 		# Signature: ErrCode setSerialPortFeature(TaskHandle t, const bool enable, const unsigned int buffer_size);
 		assert (buffer_size < 256)
 		self.serial_buf_sz = buffer_size
-		ret = self.dll.setSerialPortFeature(self.task_handle, enable, buffer_size)
-		self.__check_ret(ret)
+		ret = self.task_dll.setSerialPortFeature(enable, buffer_size)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -873,11 +1409,11 @@ class AvmuInterface(object):
 			(bool) whether the connected AVMU has support for encoders
 
 		'''
-		self.log.debug("isShaftEncoderPresent call")
 		# Signature: ErrCode isShaftEncoderPresent(TaskHandle t, bool* present);
 		present = self.ffi.new("bool *", False)
-		ret = self.dll.isShaftEncoderPresent(self.task_handle, present)
-		self.__check_ret(ret)
+		ret = self.task_dll.isShaftEncoderPresent(present)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 		return present[0]
 
 	def setShaftEncoderFeature(self, enable, resetOnStart=True):
@@ -899,10 +1435,10 @@ class AvmuInterface(object):
 
 
 		'''
-		self.log.debug("setShaftEncoderFeature call")
 		# Signature: ErrCode setShaftEncoderFeature(TaskHandle t, const bool enable);
-		ret = self.dll.setShaftEncoderFeature(self.task_handle, enable, resetOnStart)
-		self.__check_ret(ret)
+		ret = self.task_dll.setShaftEncoderFeature(enable, resetOnStart)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -923,10 +1459,8 @@ class AvmuInterface(object):
 				rx2               = 0,
 				rx2_to_tx         = 0,
 			):
-		self.log.debug("configureTddSettings call")
 		# Signature: ErrCode setShaftEncoderFeature(TaskHandle t, const bool enable);
-		ret = self.dll.configureTddSettings(
-			self.task_handle,
+		ret = self.task_dll.configureTddSettings(
 			bool(tddActive),
 			bool(tddEnabled),
 			bool(nullingEnabled),
@@ -941,7 +1475,8 @@ class AvmuInterface(object):
 			int(rx1_to_rx2),
 			int(rx2),
 			int(rx2_to_tx))
-		self.__check_ret(ret)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	###############################################################
 
@@ -954,11 +1489,13 @@ class AvmuInterface(object):
 			(str) One of 'TASK_RUNNING', 'TASK_STARTED', 'TASK_STOPPED' or 'TASK_UNINITIALIZED'.
 
 		'''
-		self.log.debug("getState call")
 		# Signature: TaskState getState(TaskHandle t);
-		state = self.dll.getState(self.task_handle)
+		if 'state' in self.__config_cache:
+			return self.__config_cache['state']
+		state = self.task_dll.getState()
 		for state_name, state_val in self.run_state.items():
 			if state_val == state:
+				self.__config_cache['state'] = state_name
 				return state_name
 
 		raise avmu_exceptions.Avmu_Exception_Wrong_State("State value returned is not known (%s)!" % state)
@@ -981,7 +1518,6 @@ class AvmuInterface(object):
 			If the Task has not yet been initialized, the returned dict has all values set to 0.
 
 		'''
-		self.log.debug("getHardwareDetails call")
 
 		swbd_lut = {
 			0 : "NO_SWITCH_BOARD",
@@ -993,7 +1529,7 @@ class AvmuInterface(object):
 		}
 
 		# Signature: HardwareDetails getHardwareDetails(TaskHandle t);
-		hardwareDetails = self.dll.getHardwareDetails(self.task_handle)
+		hardwareDetails = self.task_dll.getHardwareDetails()
 		# print("Deets:", hardwareDetails.hardware_features)
 
 		ret = {
@@ -1050,11 +1586,10 @@ class AvmuInterface(object):
 			:class:`~avmu.avmu_exceptions.Avmu_Exception_Missing_Port` if no port has been set
 
 		'''
-		self.log.debug("utilPingUnit call")
 		# Signature: ErrCode utilPingUnit(TaskHandle t);
-		ret = self.dll.utilPingUnit(self.task_handle, tries)
-		self.__check_ret(ret)
-		self.log.debug("utilPingUnit return")
+		ret = self.task_dll.utilPingUnit(tries)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 		return True
 
 	def versionString(self):
@@ -1064,7 +1599,6 @@ class AvmuInterface(object):
 		Returns:
 			String describing the AVMU DLL components and version numbers.
 		'''
-		self.log.debug("versionString call")
 		# Signature: const char* versionString();
 		ret = self.dll.versionString()
 		return self.ffi.string(ret).decode("ascii")
@@ -1105,13 +1639,21 @@ class AvmuInterface(object):
 			                                the HardwareDetails struct returned by :func:`getHardwareDetails()`)
 
 		'''
-		self.log.debug("utilFixLinearSweepLimits call")
 		# Signature: ErrCode utilFixLinearSweepLimits(TaskHandle t, double* startFreq, double* endFreq, const unsigned int N);
-		startF = self.ffi.new("double *", startF)
-		endF   = self.ffi.new("double *", endF)
-		ret = self.dll.utilFixLinearSweepLimits(self.task_handle, startF, endF, npts)
-		self.__check_ret(ret)
-		return startF[0], endF[0]
+		if self.__sweep_plan_cache is not None:
+			limits = self.__sweep_plan_cache.getLimits(self.__serial_number(), startF, endF, npts)
+			if limits is not None:
+				return limits
+
+		start_p = self.ffi.new("double *", startF)
+		end_p   = self.ffi.new("double *", endF)
+		ret = self.task_dll.utilFixLinearSweepLimits(start_p, end_p, npts)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
+
+		if self.__sweep_plan_cache is not None:
+			self.__sweep_plan_cache.putLimits(self.__serial_number(), startF, endF, npts, (start_p[0], end_p[0]))
+		return start_p[0], end_p[0]
 
 	def utilNearestLegalFreq(self, freq):
 		'''
@@ -1131,11 +1673,11 @@ class AvmuInterface(object):
 			                                the HardwareDetails struct returned by :func:`getHardwareDetails()`)
 
 		'''
-		self.log.debug("utilNearestLegalFreq call")
 		# Signature: ErrCode utilNearestLegalFreq(TaskHandle t, double* freq);
 		freq   = self.ffi.new("double *", freq)
-		ret = self.dll.utilNearestLegalFreq(self.task_handle, freq)
-		self.__check_ret(ret)
+		ret = self.task_dll.utilNearestLegalFreq(freq)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 		return freq[0]
 
 	#################################################################################
@@ -1157,11 +1699,12 @@ class AvmuInterface(object):
 
 
 		'''
-		self.log.debug("initialize call")
 		# Signature: ErrCode initialize(TaskHandle t, progress_callback callback, void* user);
 		self.log.debug("Initializing remote device.")
-		ret = self.dll.initialize(self.task_handle, self.ffi.NULL, self.ffi.NULL)
-		self.__check_ret(ret)
+		self.__invalidate_config()
+		ret = self.task_dll.initialize(self.ffi.NULL, self.ffi.NULL)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 		self.log.debug("Remote device initialized.")
 
 
@@ -1174,10 +1717,12 @@ class AvmuInterface(object):
 		Note that once beginAsync() has been called, you MUST then call measure()
 		periodically so that the UDP recieve buffer will not overflow.
 		'''
-		self.log.debug("beginAsync call")
 		# Signature: ErrCode beginAsync(TaskHandle t);
-		ret = self.dll.beginAsync(self.task_handle)
-		self.__check_ret(ret)
+		self.__invalidate_config('state')
+		self.telemetry.recordRestart()
+		ret = self.task_dll.beginAsync()
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	def broadcastBeginCommand(self, handles=[]):
 		'''
@@ -1197,12 +1742,15 @@ class AvmuInterface(object):
 			:class:`~avmu.avmu_exceptions.Avmu_Exception_Task_Array_Invalid` if the passed list is empty (handle_count == 0)
 
 		'''
-		self.log.debug("broadcastBeginCommand call")
 		# Signature: ErrCode beginAsync(TaskHandle t);
+		for other in handles:
+			other.__invalidate_config('state')
+		self.__invalidate_config('state')
 		handles = [other.__getRawTaskHandle() for other in handles]
 		# print("Handles:", handles)
 		ret = self.dll.broadcastBeginCommand(handles, len(handles))
-		self.__check_ret(ret)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	def haltAsync(self):
 		'''
@@ -1215,10 +1763,11 @@ class AvmuInterface(object):
 		To resume async data collection after calling haltAsync(),
 		simply call beginAsync().
 		'''
-		self.log.debug("haltAsync call")
 		# Signature: ErrCode haltAsync(TaskHandle t);
-		ret = self.dll.haltAsync(self.task_handle)
-		self.__check_ret(ret)
+		self.__invalidate_config('state')
+		ret = self.task_dll.haltAsync()
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	def interruptMeasurement(self):
 		'''
@@ -1232,10 +1781,10 @@ class AvmuInterface(object):
 		Raises:
 			:class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State` if the Task is not in the TASK_STARTED state
 		'''
-		self.log.debug("interruptMeasurement call")
 		# Signature: ErrCode interruptMeasurement(TaskHandle t);
-		ret = self.dll.interruptMeasurement(self.task_handle)
-		self.__check_ret(ret)
+		ret = self.task_dll.interruptMeasurement()
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	def start(self):
 		'''
@@ -1253,11 +1802,13 @@ class AvmuInterface(object):
 			:class:`~avmu.avmu_exceptions.Avmu_Exception_Prog_Overflow` if the size of the program is too large for the hardware's memory \
 				(this can happen if there are too many frequencies)
 		'''
-		self.log.debug("start call")
 		# Signature: ErrCode start(TaskHandle t);
 		self.log.info("Starting task.")
-		ret = self.dll.start(self.task_handle)
-		self.__check_ret(ret)
+		self.__invalidate_config('state', 'frame_time')
+		self.telemetry.recordRestart()
+		ret = self.task_dll.start()
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 
 	def stop(self):
@@ -1268,11 +1819,12 @@ class AvmuInterface(object):
 			:class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State`  if the Task is not in the TASK_STARTED state
 
 		'''
-		self.log.debug("stop call")
 		# Signature: ErrCode stop(TaskHandle t);
 		self.log.info("Stopping task.")
-		ret = self.dll.stop(self.task_handle)
-		self.__check_ret(ret)
+		self.__invalidate_config('state', 'frame_time')
+		ret = self.task_dll.stop()
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 
 
@@ -1332,25 +1884,26 @@ class AvmuInterface(object):
 		running a network hub?).
 
 		'''
-		self.log.debug("measure call")
 		# Signature: ErrCode measure(TaskHandle t);
-		ret = self.dll.measure(self.task_handle)
-		self.__check_ret(ret)
+		start = time.perf_counter()
+		ret = self.task_dll.measure()
+		self.telemetry.recordMeasure(start, time.perf_counter(), ret)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 
 	def getnumberOfEnabledReceivers(self):
 		'''
 		Returns the number of receivers in the AVMU.
 		'''
-		self.log.debug("getnumberOfEnabledReceivers call")
 		# ErrCode getnumberOfEnabledReceivers(TaskHandle t, int*  num_receivers_enabled);
 		present = self.ffi.new("int *", 0)
-		ret = self.dll.getnumberOfEnabledReceivers(self.task_handle, present)
-		self.__check_ret(ret)
+		ret = self.task_dll.getnumberOfEnabledReceivers(present)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 		return present[0]
 
 	def __decodeEnabledReceivers(self, enable_bitmap):
-		self.log.debug("__decodeEnabledReceivers call")
 
 		# We remap the receiver numbers because the way they work now is confusing as hell.
 		rx_map = {
@@ -1373,22 +1926,26 @@ class AvmuInterface(object):
 		'''
 		Returns a list describing which of the AVMU's receivers will return data.
 		'''
-		self.log.debug("getEnabledReceivers call")
+		if 'receivers' in self.__config_cache:
+			return self.__config_cache['receivers']
 		# ErrCode getEnabledReceivers(TaskHandle t,         char* enabled_receivers_mask);
 		# Use an int8_t because it casts to char cleanly, but
 		# doesn't try to act like a bytes character everywhere.
 		enable_mask = self.ffi.new("int8_t *", 0)
-		ret = self.dll.getEnabledReceivers(self.task_handle, self.ffi.cast("char *", enable_mask))
-		self.__check_ret(ret)
+		ret = self.task_dll.getEnabledReceivers(self.ffi.cast("char *", enable_mask))
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 		self.active_receivers = self.__decodeEnabledReceivers(enable_mask[0])
+		self.__config_cache['receivers'] = self.active_receivers
 		return self.active_receivers
 
 	def __setEnabledReceivers(self, enable_mask):
-		self.log.debug("__setEnabledReceivers call")
 		# ErrCode setEnabledReceivers(TaskHandle t,         char  enabled_receivers_mask);
-		ret = self.dll.setEnabledReceivers(self.task_handle, chr(enable_mask).encode("ascii"))
-		self.__check_ret(ret)
+		self.__invalidate_config('receivers')
+		ret = self.task_dll.setEnabledReceivers(chr(enable_mask).encode("ascii"))
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 		# Query and update the enabled recievers config
 		self.getEnabledReceivers()
@@ -1397,7 +1954,6 @@ class AvmuInterface(object):
 		'''
 		Configure which of the receivers in the AVMU will return data.
 		'''
-		self.log.debug("setEnabledReceivers call")
 		valid_receivers = [0, 1, 2, 3, 4]
 		assert(all([tmp in valid_receivers for tmp in enable_list]))
 
@@ -1419,47 +1975,56 @@ class AvmuInterface(object):
 		print("Bitmap ", mask)
 		self.__setEnabledReceivers(mask)
 
-	def __extract_sweep_data_int(self, tx_p_enum, rx_p_enum):
-		self.log.debug("__extract_sweep_data_int call")
-
+	def __get_sweep_scratch(self):
+		'''
+		Return the extraction scratch buffers for the current configuration,
+		rebuilding them only if the point count, receiver set or serial buffer
+		size has changed.
+		'''
 		point_num = self.getNumberOfFrequencies()
 		recs      = self.getEnabledReceivers()
 
-		# print("getEnabledReceivers: ", self.getEnabledReceivers())
-
-		sdat_struct = self.ffi.new("SweepDataStruct *")
-		sdat_struct.serial_data_bytes = self.ffi.new("unsigned char [{size}]".format(size=self.serial_buf_sz))
-
-		receiver_arrs = [
-				(np.zeros(point_num, dtype=np.float64), np.zeros(point_num, dtype=np.float64))
-			for
-				dummy
-			in
-				range(len(recs))
-		]
-
-		i_initializer = [self.ffi.cast("double *", tup[0].ctypes.data) for tup in receiver_arrs]
-		q_initializer = [self.ffi.cast("double *", tup[1].ctypes.data) for tup in receiver_arrs]
-
-		iarr = self.ffi.new("double*[]", i_initializer)
-		qarr = self.ffi.new("double*[]", q_initializer)
-
-		sdat_struct.points.I = iarr
-		sdat_struct.points.Q = qarr
-
-		ret = self.dll.extractSweepData(self.task_handle, sdat_struct, tx_p_enum, rx_p_enum)
-		self.__check_ret(ret)
+		scratch = self.__sweep_scratch
+		if scratch is None or scratch.key != (point_num, tuple(recs), self.serial_buf_sz):
+			self.log.debug("Rebuilding sweep scratch buffers (%s points, receivers %s)", point_num, recs)
+			scratch = _SweepScratch(self.ffi, point_num, recs, self.serial_buf_sz)
+			self.__sweep_scratch = scratch
+		return scratch
 
-		# There's an extra copy here I don't like. Not sure how to work around it, though.
+	def __extract_sweep_data_int(self, tx_p_enum, rx_p_enum):
 
+		scratch     = self.__get_sweep_scratch()
+		sdat_struct = scratch.sdat
+		point_num   = scratch.point_num
+		recs        = scratch.receivers
+
+		start = time.perf_counter()
+		ret = self.task_dll.extractSweepData(sdat_struct, tx_p_enum, rx_p_enum)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
+
+		# The DLL writes I and Q into separate arrays, so we still need one copy
+		# into the interleaved complex output. This is also where the conversion to
+		# the output dtype happens, for every receiver at once.
+		out = np.empty((len(recs), point_num), dtype=self.__output_dtype)
+		out.real = scratch.buf[:, 0]
+		out.imag = scratch.buf[:, 1]
 		result = {}
 		for x in range(len(recs)):
-			result[recs[x]] = np.empty(point_num, dtype=np.complex128)
+			result[recs[x]] = out[x]
 
-			result[recs[x]].real = receiver_arrs[x][0]
-			result[recs[x]].imag = receiver_arrs[x][1]
+		self.telemetry.recordExtraction(time.perf_counter() - start)
+		try:
+			path_idx = self.__measured_path_enums.index((tx_p_enum, rx_p_enum))
+			self.telemetry.recordSweepNumber(sdat_struct.sweep_number, path_idx, len(self.__measured_path_enums))
+		except ValueError:
+			pass
 
-		# print("ExtractAllPaths I mean: {}, Q mean: {}".format(np.mean(i), np.mean(q)))
+		if self.__metadata_format == 'record':
+			result_meta = np.zeros(1, dtype=sweep_meta_dtype(self.serial_buf_sz))[0]
+			path_desc = (None, None, self.tx_paths_enum_int[tx_p_enum], self.rx_paths_enum_int[rx_p_enum])
+			self.__fill_meta_record(result_meta, path_desc, sdat_struct, scratch)
+			return result, result_meta
 
 		result_meta = {
 			'avmu_ip' : self.getIPAddress(),
@@ -1484,7 +2049,6 @@ class AvmuInterface(object):
 
 
 	def __extract_sweep_data_int_old(self, tx_p_enum, rx_p_enum, did_transmit):
-		self.log.debug("__extract_sweep_data_int_old call")
 		# Signature: ErrCode extractSweepData(TaskHandle t, RFPath path, SweepDataStruct* data);
 
 		point_num = self.getNumberOfFrequencies()
@@ -1498,8 +2062,9 @@ class AvmuInterface(object):
 		sdat_struct.points.I = self.ffi.cast("double *", i.ctypes.data)
 		sdat_struct.points.Q = self.ffi.cast("double *", q.ctypes.data)
 
-		ret = self.dll.extractSweepData(self.task_handle, sdat_struct, tx_p_enum, rx_p_enum, did_transmit)
-		self.__check_ret(ret)
+		ret = self.task_dll.extractSweepData(sdat_struct, tx_p_enum, rx_p_enum, did_transmit)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 		result = np.empty(point_num, dtype=np.complex128)
 
@@ -1539,7 +2104,7 @@ class AvmuInterface(object):
 
 		Returns:
 			- A 2-tuple of containing (data, metadata)
-			    data is a numpy complex array with the dimensions of 1 x ``getNumberOfFrequencies()``,
+			    data is a numpy complex array (of the dtype set with :func:`setOutputDtype()`) with the dimensions of 1 x ``getNumberOfFrequencies()``,
 			      where each value bin corresponds to the associated frequency bin in ``getFrequencies()``.
 			    metadata is a dict containing the sweep metadata associated with the sweep ``data``.
 			      It contains the following key-> value pairs:
@@ -1558,11 +2123,15 @@ class AvmuInterface(object):
 				- ``serial_data_age`` Age of the serial port data. If serial is not enabled, will return 0.
 				- ``serial_data_bytes`` Serial data itself, as a bytes array. If not enabled, will be an empty bytes object.
 
+			If the metadata format has been set to ``record`` (see :func:`setMetadataFormat()`),
+			metadata is instead a single numpy structured record with the dtype from
+			:func:`sweep_meta_dtype()`. Port names and the AVMU IP are not stored in the
+			record, but are available from :func:`getMetadataLookupTable()`.
+
 		raises:
 			:class:`~avmu.avmu_exceptions.Avmu_Exception_Bad_Path`:   if a path value specified is invalid.
 
 		'''
-		self.log.debug("extractSweepData call")
 		# Signature: ErrCode extractSweepData(TaskHandle t, RFPath path, SweepDataStruct* data);
 		assert tx_path in self.tx_paths, "Invalid path!"
 		assert rx_path in self.rx_paths, "Invalid path!"
@@ -1572,7 +2141,6 @@ class AvmuInterface(object):
 		return self.__extract_sweep_data_int(tx_p, rx_p)
 
 	def __extractSweepDataIntPath(self, tx_path_int, rx_path_int):
-		self.log.debug("__extractSweepDataIntPath call")
 		# Signature: ErrCode extractSweepData(TaskHandle t, RFPath path, SweepDataStruct* data);
 		assert tx_path_int in self.tx_paths_int_enum, "Invalid path!"
 		assert rx_path_int in self.rx_paths_int_enum, "Invalid path!"
@@ -1614,12 +2182,22 @@ class AvmuInterface(object):
 				- ``meta`` The sweep's metadata. This is directly the ``metadata`` return component from
 				  the ``extractSweepData()`` call.
 
+			If the metadata format has been set to ``record`` (see :func:`setMetadataFormat()`),
+			the return value is instead a 2-tuple of ``(data, meta)`` arrays for a single
+			frame, with the same layout as one frame of :func:`allocateFrameBuffer()`
+			(i.e. ``data`` has the shape ``(paths, receivers, points)``, and ``meta``
+			is a structured array of shape ``(paths, )``).
+
 		raises:
 			:class:`~avmu.avmu_exceptions.Avmu_Exception_Path_Has_No_Data`:   if you didn't call ``measure()``
 
 		'''
-		self.log.debug("extractAllPaths call")
 		# Python-only convenience function.
+		if self.__metadata_format == 'record':
+			data, meta = self.allocateFrameBuffer(1)
+			self.extractFramesInto(data, meta, 0)
+			return data[0], meta[0]
+
 		ret = []
 		# print("extractAllPaths() for radar ", self.getIPAddress())
 		for who_is_transmitting, port_is_transmitting, tx_path, rx_path in self.measured_paths:
@@ -1642,6 +2220,274 @@ class AvmuInterface(object):
 				))
 		return ret
 
+	def setMetadataFormat(self, metadata_format):
+		'''
+		Select how sweep metadata is returned by :func:`extractSweepData()` and
+		:func:`extractAllPaths()`.
+
+		The default, ``dict``, returns a dict of values for every extracted path. For long
+		captures, the per-path dicts (and the strings in them) can use far more memory
+		and GC time than the sweep data itself. In ``record`` mode, the metadata for each
+		path is instead written into a fixed-dtype numpy structured record (see
+		:func:`sweep_meta_dtype()`), and constant strings such as port names are only
+		available once per capture, via :func:`getMetadataLookupTable()`.
+
+		Note that :func:`extractFramesInto()` and :func:`measureBatch()` always use
+		structured metadata, irrespective of this setting.
+
+		Args:
+			metadata_format (str): Either ``dict`` or ``record``.
+
+		Returns:
+			Nothing
+		'''
+		assert metadata_format in ('dict', 'record'), "Invalid metadata format: '%s'!" % (metadata_format, )
+		self.__metadata_format = metadata_format
+
+	def getMetadataFormat(self):
+		'''
+		Get the current metadata format, as set by :func:`setMetadataFormat()`.
+
+		Returns:
+			(str) ``dict`` or ``record``.
+		'''
+		return self.__metadata_format
+
+	def setOutputDtype(self, dtype):
+		'''
+		Select the complex dtype of the sweep data returned by :func:`extractSweepData()`,
+		:func:`extractAllPaths()`, :func:`measureBatch()`, and the buffers from
+		:func:`allocateFrameBuffer()` (and therefore :class:`~avmu.streaming.AvmuStream`).
+
+		The DLL always returns double precision values. With ``complex64``, they are
+		converted to single precision as they are copied out of the extraction buffers, so
+		there is no extra pass over the data, and the returned arrays take half the memory.
+		Single precision carries about 7 significant digits (over 140 dB of dynamic range),
+		which is more than the AVMU's receivers deliver.
+
+		Args:
+			dtype (numpy dtype): ``np.complex64`` or ``np.complex128`` (the default).
+
+		Returns:
+			Nothing
+		'''
+		dtype = np.dtype(dtype)
+		assert dtype in (np.dtype(np.complex64), np.dtype(np.complex128)), "Invalid output dtype: '%s'!" % (dtype, )
+		self.__output_dtype = dtype
+
+	def getOutputDtype(self):
+		'''
+		Get the sweep data dtype, as set by :func:`setOutputDtype()`.
+
+		Returns:
+			``numpy.dtype`` instance.
+		'''
+		return self.__output_dtype
+
+	def getMetadataLookupTable(self):
+		'''
+		Get the values that are constant across a capture, for interpreting
+		structured metadata records.
+
+		Returns:
+			A dict containing:
+
+				- ``avmu_ip``        IP address of the AVMU.
+				- ``avmu_port``      IP port of the AVMU.
+				- ``tx_port_names``  dict mapping the ``tx_port`` integers in the records to
+				  port strings compatible with ``addPathToMeasure()``.
+				- ``rx_port_names``  dict mapping the ``rx_port`` integers in the records to
+				  port strings compatible with ``addPathToMeasure()``.
+				- ``paths``          List of ``(who_is_transmitting, port_is_transmitting, tx_port, rx_port)``
+				  tuples, in the same order as the ``paths`` axis of the batched arrays.
+				- ``receivers``      List of receivers, in the same order as the ``receivers`` axis
+				  of the batched arrays.
+				- ``dtype``          The metadata record dtype.
+		'''
+		return {
+			'avmu_ip'       : self.getIPAddress(),
+			'avmu_port'     : self.getIPPort(),
+			'tx_port_names' : {value : key for key, value in self.tx_paths_int.items()},
+			'rx_port_names' : {value : key for key, value in self.rx_paths_int.items()},
+			'paths'         : list(self.measured_paths),
+			'receivers'     : list(self.getEnabledReceivers()),
+			'dtype'         : sweep_meta_dtype(self.serial_buf_sz),
+		}
+
+	def allocateFrameBuffer(self, frames, dtype=None):
+		'''
+		Allocate a data array and a metadata array sized for ``frames`` frames of the
+		current configuration, suitable for passing to :func:`extractFramesInto()`.
+
+		The data array has the shape ``(frames, paths, receivers, points)``, where
+		``paths`` follows the order the paths were added with ``addPathToMeasure()``,
+		``receivers`` follows the order returned by ``getEnabledReceivers()``, and
+		``points`` corresponds to ``getFrequencies()``.
+
+		The metadata array has the shape ``(frames, paths)``, and the dtype returned by
+		:func:`sweep_meta_dtype()` for the current serial buffer size.
+
+		Note that the buffers must be reallocated if the sweep, receiver or path
+		configuration changes.
+
+		Args:
+			frames (int): Number of frames the buffers should hold.
+			dtype (numpy dtype): Complex dtype for the data array. Defaults to the
+			                     dtype set with :func:`setOutputDtype()`.
+
+		Returns:
+			2-tuple of ``(data, meta)`` numpy arrays.
+		'''
+		assert frames > 0, "You must allocate at least one frame!"
+		if dtype is None:
+			dtype = self.__output_dtype
+		scratch = self.__get_sweep_scratch()
+		data = np.zeros((frames, len(self.measured_paths), len(scratch.receivers), scratch.point_num), dtype=dtype)
+		meta = np.zeros((frames, len(self.measured_paths)), dtype=sweep_meta_dtype(self.serial_buf_sz))
+		return data, meta
+
+	def extractFramesInto(self, out, meta_out=None, frame_idx=0):
+		'''
+		Extract every measured path from the last ``measure()`` call directly into
+		preallocated arrays.
+
+		This is the batched equivalent of :func:`extractAllPaths()`. Rather than
+		building new arrays and dicts for every path, the I/Q data for each path and
+		receiver is written into ``out[frame_idx]``, and the sweep metadata into
+		``meta_out[frame_idx]``. Neither array is reallocated, so a capture loop
+		can run without any per-frame array allocation.
+
+		Use :func:`allocateFrameBuffer()` to create correctly sized arrays.
+
+		Args:
+			out (numpy array): Complex array of shape ``(frames, paths, receivers, points)``.
+			meta_out (numpy array): Optional structured array of shape ``(frames, paths)`` with
+			                        the dtype from :func:`sweep_meta_dtype()`. If ``None``,
+			                        metadata is not stored.
+			frame_idx (int): Index along the first axis of ``out`` and ``meta_out`` to write into.
+
+		Returns:
+			Nothing
+
+		raises:
+			:class:`~avmu.avmu_exceptions.Avmu_Exception_Path_Has_No_Data`:   if you didn't call ``measure()``
+		'''
+		scratch = self.__get_sweep_scratch()
+		sdat    = scratch.sdat
+		buf     = scratch.buf
+
+		expected = (len(self.measured_paths), len(scratch.receivers), scratch.point_num)
+		assert out.shape[1:] == expected, "Output array shape %s does not match the current configuration (%s)!" % (
+			out.shape[1:], expected)
+
+		frame = out[frame_idx]
+		meta  = meta_out[frame_idx] if meta_out is not None else None
+
+		start      = time.perf_counter()
+		path_count = len(self.__measured_path_enums)
+		for path_idx, (tx_p_enum, rx_p_enum) in enumerate(self.__measured_path_enums):
+			ret = self.task_dll.extractSweepData(sdat, tx_p_enum, rx_p_enum)
+			if ret != self.ERR_OK:
+				self.__check_ret(ret)
+			if path_idx == 0:
+				self.telemetry.recordSweepNumber(sdat.sweep_number, 0, path_count)
+
+			# Real and imag are strided views into `out`, so this copies
+			# straight into the caller's array.
+			path_data = frame[path_idx]
+			np.copyto(path_data.real, buf[:, 0])
+			np.copyto(path_data.imag, buf[:, 1])
+
+			if meta is not None:
+				self.__fill_meta_record(meta[path_idx], self.measured_paths[path_idx], sdat, scratch)
+
+		self.telemetry.recordExtraction(time.perf_counter() - start)
+
+	def __fill_meta_record(self, record, path_desc, sdat, scratch):
+		who_is_transmitting, port_is_transmitting, tx_path, rx_path = path_desc
+
+		record['who_is_transmitting']  = -1 if who_is_transmitting  is None else who_is_transmitting
+		record['port_is_transmitting'] = -1 if port_is_transmitting is None else port_is_transmitting
+		record['tx_port']              = tx_path
+		record['rx_port']              = rx_path
+		record['sweep_number']         = sdat.sweep_number
+		record['frame_num']            = sdat.frame_num
+		record['packet_num']           = sdat.packet_num
+		record['timestamp_ticks']      = sdat.timestamp_ticks
+		record['timestamp_seconds']    = sdat.timestamp_seconds
+		record['shaft_encoder_left']   = sdat.shaft_encoder_left
+		record['shaft_encoder_right']  = sdat.shaft_encoder_right
+		record['serial_data_age']      = sdat.serial_data_age
+		if scratch.key[2]:
+			record['serial_data_bytes'] = scratch.serial_view
+
+	def measureBatch(self, frames, out=None, meta_out=None):
+		'''
+		Acquire ``frames`` frames into a single contiguous array.
+
+		This calls ``measure()`` followed by :func:`extractFramesInto()` once per frame.
+		The acquisition must already be running (e.g. ``start()``, and ``beginAsync()``
+		if in ``PROG_ASYNC`` mode).
+
+		If ``out`` and ``meta_out`` are not passed, an internal pair of buffers is used.
+		These are allocated on the first call, and reused by subsequent calls with the
+		same frame count and configuration, so the returned arrays are overwritten by
+		the next ``measureBatch()`` call. Copy them if you need to keep them.
+
+		Args:
+			frames (int): Number of frames to acquire.
+			out (numpy array): Optional data array from :func:`allocateFrameBuffer()`,
+			                   with at least ``frames`` frames.
+			meta_out (numpy array): Optional metadata array from :func:`allocateFrameBuffer()`.
+
+		Returns:
+			2-tuple of ``(data, meta)`` arrays. See :func:`allocateFrameBuffer()` for the layout.
+
+		Raises:
+			Any exception that can be raised by ``measure()`` or :func:`extractFramesInto()`.
+		'''
+		if out is None:
+			pool = self.__batch_pool
+			scratch = self.__get_sweep_scratch()
+			pool_key = (frames, len(self.measured_paths), scratch.key, self.__output_dtype)
+			if pool is None or pool[0] != pool_key:
+				pool = (pool_key, ) + self.allocateFrameBuffer(frames)
+				self.__batch_pool = pool
+			out = pool[1]
+			if meta_out is None:
+				meta_out = pool[2]
+
+		assert out.shape[0] >= frames, "Output array only has space for %s frames (requested %s)!" % (out.shape[0], frames)
+
+		for frame_idx in range(frames):
+			self.measure()
+			self.extractFramesInto(out, meta_out, frame_idx)
+
+		return out, meta_out
+
+	def startStreaming(self, capacity=64, policy='drop-oldest'):
+		'''
+		Start acquiring frames continuously on a background thread.
+
+		This is a convenience wrapper that creates an :class:`~avmu.streaming.AvmuStream`
+		for this interface, and starts it. The task must be in the ``TASK_STARTED`` state.
+		In ``PROG_ASYNC`` mode, the stream calls ``beginAsync()`` itself.
+
+		Call ``stop()`` on the returned stream before using this interface again.
+
+		Args:
+			capacity (int): Number of frames the stream's ring buffer can hold.
+			policy (str): What to do when the ring is full. One of ``drop-oldest``,
+			              ``drop-newest`` or ``block``. See :class:`~avmu.streaming.AvmuStream`.
+
+		Returns:
+			The running :class:`~avmu.streaming.AvmuStream` instance.
+		'''
+		from . import streaming
+		stream = streaming.AvmuStream(self, capacity=capacity, policy=policy)
+		stream.start()
+		return stream
+
 
 
 	def setSyncPulseMode(self, sync_mode):
@@ -1671,12 +2517,12 @@ class AvmuInterface(object):
 			 :class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State`if the Task is not in the ``TASK_UNINITIALIZED`` or ``TASK_STOPPED`` state
 
 		'''
-		self.log.debug("setSyncPulseMode call")
 		assert sync_mode in self.sync_pulse_mode
 
 		mode = self.sync_pulse_mode[sync_mode]
-		ret = self.dll.setSyncPulseMode(self.task_handle, mode)
-		self.__check_ret(ret)
+		ret = self.task_dll.setSyncPulseMode(mode)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 	def getSyncPulseMode(self):
 		'''
@@ -1686,11 +2532,11 @@ class AvmuInterface(object):
 			Current sync-pulse mode as a string.
 		'''
 
-		self.log.debug("getSyncPulseMode call")
 		# ErrCode getnumberOfEnabledReceivers(TaskHandle t, int*  num_receivers_enabled);
 		sync_mode = self.ffi.new("int *", 0)
-		ret = self.dll.getSyncPulseMode(self.task_handle, sync_mode)
-		self.__check_ret(ret)
+		ret = self.task_dll.getSyncPulseMode(sync_mode)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 		for key, value in self.sync_pulse_mode.items():
 			if value == sync_mode[0]:
@@ -1727,11 +2573,15 @@ class AvmuInterface(object):
 			 :class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State` if the Task is not in the TASK_STOPPED state
 
 		'''
-		self.log.debug("addExclusionBand call")
 		# ErrCode addExclusionBand(TaskHandle t, double start_freq, double stop_freq);
 		assert stop_freq > start_freq, "The stop frequency must be larger then the start frequency"
-		ret = self.dll.addExclusionBand(self.task_handle, start_freq, stop_freq)
-		self.__check_ret(ret)
+		ret = self.task_dll.addExclusionBand(start_freq, stop_freq)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
+		self.__exclusion_bands.append((start_freq, stop_freq))
+		# The bands are part of the sweep plan, so the plan (and its frame time) no longer applies.
+		self.__invalidate_config('npts', 'freqs', 'frame_time')
+		self.__sweep_plan_key = None
 
 	def clearExclusionBands(self):
 		'''
@@ -1742,10 +2592,14 @@ class AvmuInterface(object):
 			 :class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State` if the Task is not in the TASK_STOPPED state
 
 		'''
-		self.log.debug("clearExclusionBands call")
 		# ErrCode clearExclusionBands(TaskHandle t);
-		ret = self.dll.clearExclusionBands(self.task_handle)
-		self.__check_ret(ret)
+		ret = self.task_dll.clearExclusionBands()
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
+		self.__exclusion_bands = []
+		# As for addExclusionBand().
+		self.__invalidate_config('npts', 'freqs', 'frame_time')
+		self.__sweep_plan_key = None
 
 	def getExclusionBandCount(self):
 		'''
@@ -1760,13 +2614,13 @@ class AvmuInterface(object):
 			 :class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State` if the Task is not in the TASK_STOPPED state
 
 		'''
-		self.log.debug("getExclusionBandCount call")
 		# ErrCode getExclusionBandCount(TaskHandle t, int* idx);
 
 		exclusion_band_count = self.ffi.new("int *", 0)
 
-		ret = self.dll.getExclusionBandCount(self.task_handle, exclusion_band_count)
-		self.__check_ret(ret)
+		ret = self.task_dll.getExclusionBandCount(exclusion_band_count)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 		return exclusion_band_count[0]
 
@@ -1787,14 +2641,14 @@ class AvmuInterface(object):
 			                                                                      specified, ALL possible values for idx  \
 			                                                                      are therefore invalid.
 		'''
-		self.log.debug("getExclusionBand call")
 		# ErrCode getExclusionBand(TaskHandle t, int idx, double* start_freq, double* stop_freq);
 
 		start_f = self.ffi.new("double *", 0)
 		stop_f  = self.ffi.new("double *", 0)
 
-		ret = self.dll.getExclusionBand(self.task_handle, band_idx, start_f, stop_f)
-		self.__check_ret(ret)
+		ret = self.task_dll.getExclusionBand(band_idx, start_f, stop_f)
+		if ret != self.ERR_OK:
+			self.__check_ret(ret)
 
 		return start_f[0], stop_f[0]
 
@@ -1811,8 +2665,16 @@ class AvmuInterface(object):
 			     the return value is -1.
 		'''
 
-		ret = self.dll.getPreciseTimePerFrame(self.task_handle)
+		if 'frame_time' in self.__config_cache:
+			return self.__config_cache['frame_time']
+		ret = self.task_dll.getPreciseTimePerFrame()
 
+		# -1 indicates the sweep program hasn't been computed yet,
+		# so don't cache that.
+		if ret > 0:
+			self.__config_cache['frame_time'] = ret
+			if self.__sweep_plan_key is not None and self.__sweep_plan_cache is not None:
+				self.__sweep_plan_cache.setFrameTime(self.__sweep_plan_key, self.getHopRate(), len(self.measured_paths), ret)
 		return ret
 
 
@@ -0,0 +1,339 @@
+'''
+# #########################################################################
+
+Calibration of sweep data.
+
+A :class:`Calibration` holds error terms measured on its own frequency grid,
+for every ``(tx_path, rx_path, receiver)`` it covers:
+
+	- A response (through) calibration, built with :func:`Calibration.response()`
+	  from a through measurement (and optionally an isolation measurement),
+	  corrects ``(M - isolation) / through``.
+	- A one-port calibration, built with :func:`Calibration.onePort()` from
+	  short, open and load measurements, corrects the directivity, source match
+	  and reflection tracking terms.
+
+The terms are interpolated onto the frequencies the hardware actually sweeps
+once per sweep plan, and the resulting :class:`CalibrationPlan` (which is
+cached by the calibration) corrects whole ``(frames, paths, receivers,
+points)`` batches with broadcast arithmetic, in place::
+
+	cal  = avmu.calibration.Calibration.load("thru.npz")
+	plan = avmu.calibration.calibration_plan(cal, device)
+	for data, meta in stream:
+		plan.apply(data, out=data)
+
+# #########################################################################
+'''
+
+import collections
+import json
+import threading
+
+import numpy as np
+
+
+CALIBRATION_KINDS = ('response', 'one_port')
+
+# Error terms stored for each kind of calibration. Terms not listed as
+# optional are required for every key.
+CALIBRATION_TERMS = {
+	'response' : ('tracking', 'isolation'),
+	'one_port' : ('directivity', 'source_match', 'tracking'),
+}
+OPTIONAL_TERMS = frozenset(['isolation'])
+
+# Number of sweep plans a calibration keeps interpolated coefficients for.
+PLAN_CACHE_SIZE = 16
+
+# Tolerance, in MHz, for sweep frequencies outside the calibrated range.
+FREQUENCY_TOLERANCE_MHZ = 1e-6
+
+
+def interpolate_complex(frequencies, values, new_frequencies):
+	'''
+	Interpolate complex values onto a new frequency grid, linearly in magnitude and (unwrapped) phase,
+	which follows electrical delay much better than interpolating the real and imaginary parts.
+
+	Args:
+		frequencies (numpy array): Increasing frequencies the values are known at.
+		values (numpy array): Complex values at ``frequencies``.
+		new_frequencies (numpy array): Frequencies to interpolate to.
+
+	Returns:
+		Complex128 numpy array of the values at ``new_frequencies``.
+	'''
+	mag   = np.interp(new_frequencies, frequencies, np.absolute(values))
+	phase = np.interp(new_frequencies, frequencies, np.unwrap(np.angle(values)))
+	return mag * np.exp(1j * phase)
+
+
+class CalibrationPlan(object):
+	'''
+	Calibration coefficients interpolated onto one sweep plan, with the frame layout of
+	:func:`~avmu.avmu_library.AvmuInterface.allocateFrameBuffer()`.
+
+	Built by :func:`Calibration.plan()`, rather than directly. A plan reuses a scratch buffer
+	for one-port corrections, so it should only be applied from one thread at a time.
+
+	Attributes:
+		kind (str): The calibration kind, one of ``CALIBRATION_KINDS``.
+		frequencies (numpy array): The sweep frequencies, in MHz.
+		keys (list): ``(tx_path, rx_path, receiver)`` key of every row, in ``(paths, receivers)`` order.
+		shape (tuple): Frame shape, ``(paths, receivers, points)``.
+		coefficients (dict): Term name -> read-only coefficient array of shape ``shape``.
+	'''
+
+	def __init__(self, kind, frequencies, keys, shape, coefficients, dtype):
+		self.kind         = kind
+		self.frequencies  = frequencies
+		self.keys         = keys
+		self.shape        = shape
+		self.dtype        = dtype
+		self.coefficients = coefficients
+
+		self.__scratch = None
+
+	def __get_scratch(self, shape):
+		# Only the one-port correction needs a temporary. It grows with the largest batch seen.
+		size = int(np.prod(shape))
+		if self.__scratch is None or self.__scratch.size < size:
+			self.__scratch = np.empty(size, dtype=self.dtype)
+		return self.__scratch[:size].reshape(shape)
+
+	def apply(self, frames, out=None):
+		'''
+		Calibrate a batch of frames.
+
+		Args:
+			frames (numpy array): Complex frames, of shape ``(n, paths, receivers, points)``, or
+			                      ``(paths, receivers, points)`` for a single frame.
+			out (numpy array): Output array, of the same shape as ``frames``. May be ``frames`` itself,
+			                   to calibrate in place. Allocated if not passed.
+
+		Returns:
+			The calibrated frames (``out``, if passed).
+		'''
+		frames = np.asarray(frames)
+		assert frames.shape[-3:] == self.shape, "Frames must have the shape (..., %s). Passed: %s" % (
+				", ".join(str(tmp) for tmp in self.shape), frames.shape)
+		if out is None:
+			out = np.empty(frames.shape, dtype=self.dtype)
+		else:
+			assert out.shape == frames.shape, "Output shape must match the frames. Passed: %s" % (out.shape, )
+
+		coeffs = self.coefficients
+		if self.kind == 'response':
+			# (M - isolation) / tracking, precomputed as M * scale + offset.
+			np.multiply(frames, coeffs['scale'], out=out)
+			if 'offset' in coeffs:
+				out += coeffs['offset']
+		else:
+			# (M - e_d) / (e_r + e_s * (M - e_d))
+			np.subtract(frames, coeffs['directivity'], out=out)
+			scratch = self.__get_scratch(out.shape)
+			np.multiply(out, coeffs['source_match'], out=scratch)
+			scratch += coeffs['tracking']
+			out /= scratch
+		return out
+
+	__call__ = apply
+
+
+class Calibration(object):
+	'''
+	A set of calibration error terms, for any number of ``(tx_path, rx_path, receiver)`` keys, on
+	a common frequency grid.
+
+	Args:
+		kind (str): One of ``CALIBRATION_KINDS``.
+		frequencies (list): The frequencies the terms were measured at, in MHz.
+		terms (dict): ``(tx_path, rx_path, receiver)`` -> dict of term name -> complex array,
+		              with the term names in ``CALIBRATION_TERMS[kind]``.
+		info (dict): Extra JSON-serializable information stored with the calibration (date,
+		             unit serial, etc...).
+
+	Raises:
+		ValueError: If the terms are missing, or not the same length as ``frequencies``.
+	'''
+
+	def __init__(self, kind, frequencies, terms, info=None):
+		assert kind in CALIBRATION_KINDS, "Calibration kind must be one of %s. Passed: '%s'" % (CALIBRATION_KINDS, kind)
+		frequencies = np.asarray(frequencies, dtype=np.float64)
+		assert frequencies.ndim == 1 and len(frequencies) > 1, "A calibration needs at least two frequency points!"
+		assert np.all(np.diff(frequencies) > 0), "Calibration frequencies must be increasing!"
+
+		self.kind        = kind
+		self.frequencies = frequencies
+		self.info        = dict(info or {})
+		self.terms       = {}
+		for key, key_terms in terms.items():
+			key = tuple(key)
+			checked = {}
+			for name in CALIBRATION_TERMS[kind]:
+				if name not in key_terms or key_terms[name] is None:
+					if name in OPTIONAL_TERMS:
+						continue
+					raise ValueError("Calibration for %s is missing the '%s' term!" % (key, name))
+				value = np.asarray(key_terms[name], dtype=np.complex128)
+				if value.shape != frequencies.shape:
+					raise ValueError("Calibration term '%s' for %s has %s points, but there are %s frequencies!" % (
+							name, key, value.shape, len(frequencies)))
+				checked[name] = value
+			self.terms[key] = checked
+
+		self.__plan_lock  = threading.Lock()
+		self.__plan_cache = collections.OrderedDict()
+
+	@classmethod
+	def response(cls, frequencies, throughs, isolations=None, info=None):
+		'''
+		Build a response calibration.
+
+		Args:
+			frequencies (list): The frequencies the references were measured at, in MHz.
+			throughs (dict): ``(tx_path, rx_path, receiver)`` -> complex through (or, for reflection,
+			                 flush short, negated) measurement.
+			isolations (dict): Optional ``(tx_path, rx_path, receiver)`` -> complex isolation measurement
+			                   (with the through removed), subtracted before the through is divided out.
+			info (dict): Extra information stored with the calibration.
+		'''
+		isolations = isolations or {}
+		terms = {key : {'tracking' : value, 'isolation' : isolations.get(key)} for key, value in throughs.items()}
+		return cls('response', frequencies, terms, info)
+
+	@classmethod
+	def onePort(cls, frequencies, shorts, opens, loads, info=None):
+		'''
+		Build a one-port calibration from measurements of ideal short, open and load standards.
+
+		Args:
+			frequencies (list): The frequencies the standards were measured at, in MHz.
+			shorts (dict): ``(tx_path, rx_path, receiver)`` -> complex short measurement.
+			opens (dict): ``(tx_path, rx_path, receiver)`` -> complex open measurement.
+			loads (dict): ``(tx_path, rx_path, receiver)`` -> complex load measurement.
+			info (dict): Extra information stored with the calibration.
+		'''
+		terms = {}
+		for key in shorts:
+			load = np.asarray(loads[key], dtype=np.complex128)
+			o = np.asarray(opens[key], dtype=np.complex128) - load
+			s = np.asarray(shorts[key], dtype=np.complex128) - load
+			terms[key] = {
+				'directivity'  : load,
+				'source_match' : (o + s) / (o - s),
+				'tracking'     : -2 * o * s / (o - s),
+			}
+		return cls('one_port', frequencies, terms, info)
+
+	def save(self, path):
+		'''
+		Write the calibration to ``path``, in the numpy ``.npz`` format.
+		'''
+		keys = sorted(self.terms.keys(), key=str)
+		arrays = {}
+		for idx, key in enumerate(keys):
+			for name, value in self.terms[key].items():
+				arrays['%s_%s' % (name, idx)] = value
+		header = {
+			'kind' : self.kind,
+			'keys' : [list(key) for key in keys],
+			'info' : self.info,
+		}
+		with open(path, "wb") as fp:
+			np.savez_compressed(fp, frequencies=self.frequencies, header=np.array(json.dumps(header, default=str)), **arrays)
+
+	@classmethod
+	def load(cls, path):
+		'''
+		Read a calibration written by :func:`save()`.
+		'''
+		with np.load(path) as npz:
+			header = json.loads(str(npz['header']))
+			terms = {}
+			for idx, key in enumerate(header['keys']):
+				terms[tuple(key)] = {name : npz['%s_%s' % (name, idx)] for name in CALIBRATION_TERMS[header['kind']]
+						if '%s_%s' % (name, idx) in npz.files}
+			return cls(header['kind'], npz['frequencies'], terms, header['info'])
+
+	def plan(self, frequencies, keys, dtype=np.complex128):
+		'''
+		Get the coefficients for a sweep plan, interpolating them if they are not already cached.
+
+		Args:
+			frequencies (list): The swept frequencies, in MHz (see
+			                    :func:`~avmu.avmu_library.AvmuInterface.getFrequencies()`).
+			keys (list): ``(tx_path, rx_path, receiver)`` key of every row of the frames to calibrate, in
+			             ``(paths, receivers)`` order. Every path must have the same number of receivers.
+			dtype: ``np.complex64`` or ``np.complex128``, the dtype of the frames to calibrate.
+
+		Returns:
+			A :class:`CalibrationPlan`.
+
+		Raises:
+			KeyError: If a key is not covered by the calibration.
+			ValueError: If the sweep frequencies are outside the calibrated range.
+		'''
+		frequencies = np.asarray(frequencies, dtype=np.float64)
+		keys  = [tuple(key) for key in keys]
+		dtype = np.dtype(dtype)
+		cache_key = (frequencies.tobytes(), tuple(keys), dtype.str)
+
+		with self.__plan_lock:
+			plan = self.__plan_cache.get(cache_key)
+			if plan is not None:
+				self.__plan_cache.move_to_end(cache_key)
+				return plan
+
+		plan = self.__build_plan(frequencies, keys, dtype)
+
+		with self.__plan_lock:
+			self.__plan_cache[cache_key] = plan
+			while len(self.__plan_cache) > PLAN_CACHE_SIZE:
+				self.__plan_cache.popitem(last=False)
+		return plan
+
+	def __build_plan(self, frequencies, keys, dtype):
+		missing = [key for key in keys if key not in self.terms]
+		if missing:
+			raise KeyError("No calibration for path(s) %s!" % (missing, ))
+		if frequencies.min() < self.frequencies[0] - FREQUENCY_TOLERANCE_MHZ or frequencies.max() > self.frequencies[-1] + FREQUENCY_TOLERANCE_MHZ:
+			raise ValueError("Sweep (%s - %s MHz) is outside the calibrated range (%s - %s MHz)!" % (
+					frequencies.min(), frequencies.max(), self.frequencies[0], self.frequencies[-1]))
+
+		receivers = len(set(key[2] for key in keys))
+		assert len(keys) % receivers == 0, "Every path must have the same number of receivers!"
+		shape = (len(keys) // receivers, receivers, len(frequencies))
+
+		def interpolated(name):
+			# Keys without an (optional) term get zeros.
+			ret = np.zeros((len(keys), len(frequencies)), dtype=np.complex128)
+			for idx, key in enumerate(keys):
+				if name in self.terms[key]:
+					ret[idx] = interpolate_complex(self.frequencies, self.terms[key][name], frequencies)
+			return ret.reshape(shape)
+
+		if self.kind == 'response':
+			tracking = interpolated('tracking')
+			coefficients = {'scale' : 1 / tracking}
+			if any('isolation' in self.terms[key] for key in keys):
+				coefficients['offset'] = -interpolated('isolation') / tracking
+		else:
+			coefficients = {name : interpolated(name) for name in CALIBRATION_TERMS['one_port']}
+
+		for name, value in list(coefficients.items()):
+			value = value.astype(dtype)
+			value.setflags(write=False)
+			coefficients[name] = value
+
+		return CalibrationPlan(self.kind, frequencies, keys, shape, coefficients, dtype)
+
+
+def calibration_plan(calibration, interface):
+	'''
+	Get the :class:`CalibrationPlan` of ``calibration`` for the sweep, paths and receivers currently
+	configured on ``interface``, and its output dtype.
+	'''
+	receivers = interface.getEnabledReceivers()
+	keys = [(tx_path, rx_path, receiver) for _, _, tx_path, rx_path in interface.measured_paths for receiver in receivers]
+	return calibration.plan(interface.getFrequencies(), keys, dtype=interface.getOutputDtype())
@@ -0,0 +1,335 @@
+'''
+# #########################################################################
+
+Synchronized multi-AVMU acquisition.
+
+An :class:`AvmuCluster` creates one :class:`~avmu.avmu_library.AvmuInterface` per AVMU,
+all sharing the same underlying communication objects, configures each unit's paths from
+the output of :func:`~avmu.combo_utils.generate_combo_list`, starts every unit with a single
+``broadcastBeginCommand()``, and then measures all the units concurrently.
+
+# #########################################################################
+'''
+
+import collections
+import concurrent.futures
+import logging
+
+from . import alignment
+from . import avmu_exceptions
+from . import avmu_library
+from . import combo_utils
+
+
+class AvmuCluster(object):
+	'''
+	Run a group of AVMUs as a single synchronized acquisition.
+
+	``avmu_list`` uses the same dicts as :func:`~avmu.combo_utils.generate_combo_list`
+	(``AVMU_ENABLE``, ``AVMU_IDX``, ``AVMU_SWITCHBOARD_TYPE`` and optionally ``AVMU_TDD_CONFIG``),
+	plus the following keys:
+
+		- ``AVMU_IP_ADDRESS``  IP address of the unit.
+		- ``AVMU_IP_PORT``     Local IP port to use for the unit.
+		- ``AVMU_SYNC_MODE``   Optional. Sync pulse mode for the unit. By default, the first
+		  enabled unit in the list is set to ``SYNC_GENERATE``, and all the others to
+		  ``SYNC_RECEIVE``. A cluster of one unit defaults to ``SYNC_IGNORE``.
+
+	Disabled units are ignored. Any TDD configuration has to be applied to the
+	per-unit interfaces (available via ``units``) after :func:`configure()`.
+
+	Typical use::
+
+		cluster = AvmuCluster(avmu_list, 'SIMULTANEOUS')
+		cluster.configure(start_mhz=250, stop_mhz=2100, points=1024, hop_rate='HOP_45K')
+		cluster.start()
+		for x in range(100):
+			frame = cluster.measure()
+		cluster.stop()
+		cluster.close()
+
+	Args:
+		avmu_list (list of dicts): The unit descriptions.
+		schedule_type (str): Passed to :func:`~avmu.combo_utils.generate_combo_list`.
+		                     Either ``SIMULTANEOUS`` or ``SEQUENTIAL``.
+		max_workers (int): Size of the thread pool used to run per-unit calls. Defaults to one
+		                   thread per unit.
+		debug (bool): Passed through to each :class:`~avmu.avmu_library.AvmuInterface`.
+	'''
+
+	def __init__(self, avmu_list, schedule_type='SIMULTANEOUS', max_workers=None, debug=False):
+		self.log = logging.getLogger("Main.Dll.Cluster")
+
+		self.avmu_list     = [tmp for tmp in avmu_list if tmp['AVMU_ENABLE']]
+		self.schedule_type = schedule_type
+
+		assert self.avmu_list, "No enabled AVMUs in the AVMU list!"
+		indices = [tmp['AVMU_IDX'] for tmp in self.avmu_list]
+		assert len(indices) == len(set(indices)), "AVMU_IDX values must be unique. Specified: %s" % (indices, )
+
+		self.combos = combo_utils.generate_combo_list(self.avmu_list, schedule_type)
+
+		# Every unit shares the first unit's communication object, which
+		# is required for broadcastBeginCommand() to work.
+		self.units = collections.OrderedDict()
+		for avmu_conf in self.avmu_list:
+			share = next(iter(self.units.values())) if self.units else None
+			self.units[avmu_conf['AVMU_IDX']] = avmu_library.AvmuInterface(share_from_interface=share, debug=debug)
+
+		self.master_idx = indices[0]
+
+		self.__pool     = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(self.units))
+		self.__async    = False
+		self.__measured = []
+
+		self.__aligner_args = {}
+		self.aligner        = None
+
+		# avmu_idx -> [data, meta, next slot], the per-unit frame rings used by measureAligned().
+		self.__rings = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def __map_units(self, func, unit_indices=None):
+		'''
+		Call ``func(avmu_idx, interface)`` for every unit concurrently on the thread pool.
+		Waits for every call to finish, then raises the first exception (if any).
+
+		Returns:
+			OrderedDict of ``avmu_idx -> return value``.
+		'''
+		if unit_indices is None:
+			unit_indices = list(self.units.keys())
+
+		futures = [(idx, self.__pool.submit(func, idx, self.units[idx])) for idx in unit_indices]
+		concurrent.futures.wait([fut for dummy_idx, fut in futures])
+
+		ret = collections.OrderedDict()
+		for idx, fut in futures:
+			ret[idx] = fut.result()
+		return ret
+
+	def __get_sync_mode(self, avmu_conf):
+		if 'AVMU_SYNC_MODE' in avmu_conf:
+			return avmu_conf['AVMU_SYNC_MODE']
+		if len(self.units) == 1:
+			return 'SYNC_IGNORE'
+		if avmu_conf['AVMU_IDX'] == self.master_idx:
+			return 'SYNC_GENERATE'
+		return 'SYNC_RECEIVE'
+
+	def getUnitPaths(self):
+		'''
+		Get the paths each unit measures, as derived from the combo list.
+
+		Returns:
+			OrderedDict of ``avmu_idx -> list of AvmuComboTuple``, in the order the
+			paths were added to that unit (i.e. the order of the ``paths`` axis in the
+			unit's frame data).
+		'''
+		ret = collections.OrderedDict((idx, []) for idx in self.units)
+		for idx, paths in self.__build_unit_paths().items():
+			ret[idx] = [entry for entry, dummy_port in paths]
+		return ret
+
+	def __build_unit_paths(self):
+		'''
+		Returns:
+			OrderedDict of ``avmu_idx -> list of (AvmuComboTuple, transmitting port)``.
+		'''
+		ret = collections.OrderedDict((idx, []) for idx in self.units)
+		for combo in self.combos:
+			# Only the transmitting unit's own entry in a combo carries the
+			# real TX port. Every other unit's entry has TX_PATH_NONE.
+			tx_port = None
+			for entry in combo:
+				if entry.rx_idx == entry.tx_idx:
+					tx_port = entry.tx_path
+			for entry in combo:
+				ret[entry.rx_idx].append((entry, tx_port))
+		return ret
+
+	def configure(self, start_mhz, stop_mhz, points, hop_rate, measurement_type='PROG_ASYNC', timeout_ms=500):
+		'''
+		Connect to and configure every unit.
+
+		Each unit is initialized (concurrently, as ``initialize()`` can take a long time),
+		then given the same linear sweep and hop rate, its sync pulse mode, and its paths
+		from the combo list.
+
+		Args:
+			start_mhz (float): Sweep start frequency.
+			stop_mhz (float): Sweep stop frequency.
+			points (int): Number of points in the sweep.
+			hop_rate (str): Hop rate for every unit.
+			measurement_type (str): ``PROG_ASYNC`` or ``PROG_SYNC``.
+			timeout_ms (int): Socket timeout for every unit.
+
+		Raises:
+			The first exception raised while configuring any unit.
+		'''
+		confs      = {tmp['AVMU_IDX'] : tmp for tmp in self.avmu_list}
+		unit_paths = self.__build_unit_paths()
+
+		def configure_unit(avmu_idx, unit):
+			conf = confs[avmu_idx]
+			unit.setIPAddress(conf['AVMU_IP_ADDRESS'])
+			unit.setIPPort(conf['AVMU_IP_PORT'])
+			unit.setTimeout(timeout_ms)
+			unit.setMeasurementType(measurement_type)
+			unit.initialize()
+
+			unit.setHopRate(hop_rate)
+			unit.utilGenerateLinearSweep(startF_mhz=start_mhz, stopF_mhz=stop_mhz, points=points)
+			unit.setSyncPulseMode(self.__get_sync_mode(conf))
+
+			unit.clearMeasuredPaths()
+			for entry, tx_port in unit_paths[avmu_idx]:
+				unit.addPathToMeasure(entry.tx_path, entry.rx_path,
+						who_is_transmitting  = entry.tx_idx,
+						port_is_transmitting = unit.tx_paths_int[tx_port] if tx_port else None,
+					)
+
+		self.log.info("Configuring %s units", len(self.units))
+		self.__map_units(configure_unit)
+		self.__measured = [idx for idx, paths in unit_paths.items() if paths]
+		self.aligner    = alignment.FrameAligner(self.__measured, **self.__aligner_args)
+
+	def setAlignment(self, reorder_window=8, key='frame_num', gap_policy='drop'):
+		'''
+		Configure the :class:`~avmu.alignment.FrameAligner` used by :func:`measureAligned()`.
+		Takes effect at the next :func:`configure()` call.
+
+		Args:
+			reorder_window (int): See :class:`~avmu.alignment.FrameAligner`.
+			key (str): See :class:`~avmu.alignment.FrameAligner`.
+			gap_policy (str): See :class:`~avmu.alignment.FrameAligner`.
+		'''
+		self.__aligner_args = {
+			'reorder_window' : reorder_window,
+			'key'            : key,
+			'gap_policy'     : gap_policy,
+		}
+
+	def start(self):
+		'''
+		Start every unit.
+
+		In ``PROG_ASYNC`` mode, every unit is armed with ``beginAsync()``, and then
+		all of them are started together with a single ``broadcastBeginCommand()``.
+		'''
+		self.__map_units(lambda dummy_idx, unit: unit.start())
+		if self.aligner is not None:
+			self.aligner.reset()
+		# The frame shape may have changed since the last start().
+		self.__rings = {}
+
+		master = self.units[self.master_idx]
+		self.__async = master.getMeasurementType() == 'PROG_ASYNC'
+		if self.__async:
+			for unit in self.units.values():
+				unit.beginAsync()
+			master.broadcastBeginCommand(list(self.units.values()))
+
+	def stop(self):
+		'''
+		Halt the async acquisition (if running), and stop every unit.
+		'''
+		if self.__async:
+			self.__async = False
+			self.__map_units(lambda dummy_idx, unit: unit.haltAsync())
+		self.__map_units(lambda dummy_idx, unit: unit.stop())
+
+	def measure(self):
+		'''
+		Acquire one frame from every unit that has paths to measure.
+
+		Each unit's ``measure()`` and extraction runs concurrently on the thread pool.
+
+		Each unit measures into its :func:`~avmu.avmu_library.AvmuInterface.measureBatch()`
+		buffers, so the returned arrays are overwritten by the next call. Copy them if you
+		need to keep them.
+
+		Returns:
+			OrderedDict of ``avmu_idx -> (data, meta)``, where ``data`` and ``meta``
+			are the single-frame arrays described in
+			:func:`~avmu.avmu_library.AvmuInterface.allocateFrameBuffer()`.
+
+		Raises:
+			The first exception raised by any unit, once every unit's call has finished.
+		'''
+		def measure_unit(dummy_idx, unit):
+			data, meta = unit.measureBatch(1)
+			return data[0], meta[0]
+
+		return self.__map_units(measure_unit, self.__measured)
+
+	def measureAligned(self):
+		'''
+		Acquire one frame from every unit, and join the frames on their frame counters.
+
+		Rather than assuming the frames from one acquisition cycle belong together,
+		each unit's frame is passed through ``aligner`` (a :class:`~avmu.alignment.FrameAligner`,
+		see :func:`setAlignment()`). Units that return ``Avmu_Exception_Bytes`` or
+		``Avmu_Exception_No_Response`` for the cycle are treated as having dropped the frame.
+
+		Frames are measured into a ring of preallocated buffers per unit, with enough slots
+		that frames held by the aligner are never overwritten. The returned frames are valid
+		until the next call. Copy them if you need to keep them.
+
+		Returns:
+			List of :data:`~avmu.alignment.AlignedFrame` instances resolved by this
+			cycle. This is usually one frame, but can be zero (while waiting on a lagging
+			unit), or several (once a lagging unit catches up).
+		'''
+		def measure_unit(avmu_idx, unit):
+			data, meta, slot = self.__next_slot(avmu_idx, unit)
+			try:
+				unit.measure()
+				unit.extractFramesInto(data, meta, slot)
+			except (avmu_exceptions.Avmu_Exception_Bytes, avmu_exceptions.Avmu_Exception_No_Response) as e:
+				self.log.warning("Unit %s dropped a frame: %s", avmu_idx, e)
+				return None
+			return data[slot], meta[slot]
+
+		ret = []
+		for avmu_idx, frame in self.__map_units(measure_unit, self.__measured).items():
+			if frame is not None:
+				ret.extend(self.aligner.push(avmu_idx, *frame))
+		return ret
+
+	def __next_slot(self, avmu_idx, unit):
+		# A unit's frame stays pending in the aligner for at most reorder_window cycles,
+		# and is then returned to the caller, who may use it until the next cycle.
+		ring = self.__rings.get(avmu_idx)
+		if ring is None:
+			slots = self.aligner.reorder_window + 2
+			ring = list(unit.allocateFrameBuffer(slots)) + [0]
+			self.__rings[avmu_idx] = ring
+		slot = ring[2]
+		ring[2] = (slot + 1) % ring[0].shape[0]
+		return ring[0], ring[1], slot
+
+	def interruptMeasurement(self):
+		'''
+		Interrupt any in-progress measurement on every unit. Can be called from any thread.
+
+		Units that are not measuring (e.g. in ``PROG_ASYNC`` mode, where
+		``interruptMeasurement()`` raises ``Avmu_Exception_Wrong_State``) are skipped,
+		so every unit is interrupted.
+		'''
+		for avmu_idx, unit in self.units.items():
+			try:
+				unit.interruptMeasurement()
+			except avmu_exceptions.Avmu_Exception as e:
+				self.log.debug("Unit %s was not interrupted: %s", avmu_idx, e)
+
+	def close(self):
+		'''
+		Shut down the thread pool. The cluster cannot be used afterwards.
+		'''
+		self.__pool.shutdown(wait=True)
@@ -13,6 +13,7 @@ import platform
 import sys
 import traceback
 import shutil
+import functools
 
 
 def get_search_paths():
@@ -131,11 +132,74 @@ def find_dll():
 
 STATIC_FFI = None
 STATIC_LIB = None
+STATIC_BACKEND = None
+
+# Backend selected with select_backend(), as a (name, kwargs) 2-tuple.
+SELECTED_BACKEND = None
+
+
+def _load_native_lib(ffi):
+	dll_path = find_dll()
+	return ffi.dlopen(dll_path)
+
+def _load_sim_lib(ffi, **kwargs):
+	from . import sim_backend
+	return sim_backend.SimulatedAvmuDll(ffi, **kwargs)
+
+def _load_replay_lib(ffi, **kwargs):
+	from . import replay
+	return replay.ReplayAvmuDll(ffi, **kwargs)
+
+# Backend name -> callable taking the header-loaded FFI instance (and any
+# keyword arguments passed to select_backend()), and returning the library object.
+BACKENDS = {
+	"dll"    : _load_native_lib,
+	"sim"    : _load_sim_lib,
+	"replay" : _load_replay_lib,
+}
+
+def select_backend(name, **kwargs):
+	'''
+	Select the library backend used by load_ffi_interface().
+
+	Available backends are:
+
+		- ``dll``  The native AVMU DLL/SO (default).
+		- ``sim``  A pure python simulation of the DLL (see :mod:`avmu.sim_backend`).
+		  Keyword arguments are passed to :class:`~avmu.sim_backend.SimulatedAvmuDll`.
+		- ``replay``  Replays a session recorded with ``AvmuInterface.startRecording()``
+		  (see :mod:`avmu.replay`). Keyword arguments are passed to :class:`~avmu.replay.ReplayAvmuDll`.
+
+	If no backend is selected, the ``AVMU_BACKEND`` environment variable is used,
+	falling back to ``dll``.
+
+	The backend is fixed once the library has been loaded (i.e. once the first
+	interface has been created), as objects from different backends can't be
+	mixed. Selecting a different backend after that raises a RuntimeError.
+	'''
+	global SELECTED_BACKEND
+	assert name in BACKENDS, "Unknown backend: '%s'. Available: %s" % (name, list(BACKENDS.keys()))
+	if STATIC_LIB is not None and STATIC_BACKEND != name:
+		raise RuntimeError("The '%s' backend has already been loaded!" % (STATIC_BACKEND, ))
+	SELECTED_BACKEND = (name, kwargs)
+
+def get_backend():
+	'''
+	Returns:
+		The name of the loaded backend, or the backend that will be loaded.
+	'''
+	if STATIC_BACKEND is not None:
+		return STATIC_BACKEND
+	if SELECTED_BACKEND is not None:
+		return SELECTED_BACKEND[0]
+	return os.environ.get("AVMU_BACKEND", "dll")
 
 def load_ffi_interface():
 	'''
 	Load and return the FFI library instance, and DLL interface to the avmu DLL.
 
+	The DLL interface is provided by the backend selected with select_backend().
+
 	return value is a 2-tuple (ffi_lib, dll_handle)
 	'''
 
@@ -144,10 +208,17 @@ def load_ffi_interface():
 	# which will then fail to interoperate.
 	global STATIC_FFI
 	global STATIC_LIB
+	global STATIC_BACKEND
 	if STATIC_FFI is not None and STATIC_LIB is not None:
 		return STATIC_FFI, STATIC_LIB
 
-	dll_path = find_dll()
+	if SELECTED_BACKEND is not None:
+		backend, backend_args = SELECTED_BACKEND
+	else:
+		backend, backend_args = get_backend(), {}
+
+	if backend not in BACKENDS:
+		raise ValueError("Unknown backend: '%s'. Available: %s" % (backend, list(BACKENDS.keys())))
 
 	from . import load_header
 	from cffi import FFI
@@ -157,12 +228,69 @@ def load_ffi_interface():
 	headers = load_header.load()
 
 	ffi.cdef(headers)
-	lib = ffi.dlopen(dll_path)
+	lib = BACKENDS[backend](ffi, **backend_args)
 
 	print("Loaded library version: ", ffi.string(lib.versionString()).decode("utf-8"))
 
 	STATIC_FFI = ffi
 	STATIC_LIB = lib
+	STATIC_BACKEND = backend
 
 	return ffi, lib
 
+
+class TaskBinding(object):
+	'''
+	Per-task call table for the DLL.
+
+	Accessing ``binding.someFunction`` returns the DLL function ``someFunction``
+	with the task handle already bound as its first argument (so ``binding.measure()``
+	is equivalent to ``dll.measure(task_handle)``). The bound callable is built
+	on first access and then cached on the instance, so subsequent calls cost a
+	single attribute lookup and no python-level wrapper.
+
+	Wrappers can be layered over every bound function (e.g. for debug logging).
+	A wrapper is a callable taking ``(func_name, func)`` and returning the
+	replacement callable. Adding or removing a wrapper drops the cached
+	functions, so there is no overhead once a wrapper has been removed.
+
+	Only functions that take a ``TaskHandle`` as their first argument should be
+	accessed through the binding.
+	'''
+
+	def __init__(self, dll, task_handle):
+		self._dll         = dll
+		self._task_handle = task_handle
+		self._wrappers    = []
+
+	def __getattr__(self, name):
+		if name.startswith("_"):
+			raise AttributeError(name)
+		func = functools.partial(getattr(self._dll, name), self._task_handle)
+		for dummy_key, wrapper in self._wrappers:
+			func = wrapper(name, func)
+		self.__dict__[name] = func
+		return func
+
+	def _reset(self):
+		for name in [tmp for tmp in self.__dict__ if not tmp.startswith("_")]:
+			del self.__dict__[name]
+
+	def add_wrapper(self, key, wrapper):
+		'''
+		Layer `wrapper` over every bound function. `key` identifies the wrapper
+		for later removal. Adding a wrapper with an existing key replaces it.
+		'''
+		self._wrappers = [tmp for tmp in self._wrappers if tmp[0] != key]
+		self._wrappers.append((key, wrapper))
+		self._reset()
+
+	def remove_wrapper(self, key):
+		'''
+		Remove the wrapper added under `key`, if present.
+		'''
+		self._wrappers = [tmp for tmp in self._wrappers if tmp[0] != key]
+		self._reset()
+
+	def has_wrapper(self, key):
+		return any(tmp[0] == key for tmp in self._wrappers)
@@ -0,0 +1,1046 @@
+'''
+# #########################################################################
+
+Vectorized range-profile processing.
+
+The AVMU measures I/Q samples at a set of frequency points, which are
+converted to time-domain (range) profiles with an inverse FFT. Doing that
+correctly needs a window, zero padding from 0 Hz up to the sweep start (so
+the sweep lands in the right bins of the iFFT input), and padding to a
+power-of-two transform length.
+
+A :class:`RangeProcessor` works all of that out once from the swept
+frequencies, and then transforms whole batches of sweeps (any array whose
+last axis is the frequency points, e.g. the ``(frames, paths, receivers,
+points)`` buffers from :func:`~avmu.avmu_library.AvmuInterface.measureBatch()`)
+in a single call, into a preallocated output::
+
+	proc = avmu.dsp.range_processor(device, cable_delay=1.3, output='db')
+	for data, meta in stream:
+		profiles = proc.transform(data)
+	plot(proc.time_axis, profiles[0, 0, 0])
+
+Fine range resolution over a small region is much cheaper with ``zoom``, which
+evaluates only the requested time window, at any bin density, with a chirp-z
+(Bluestein) transform instead of an oversized iFFT::
+
+	proc = avmu.dsp.range_processor(device, zoom=(2.0, 12.0), bins=1000)
+
+Moving targets are found by a second FFT across frames (slow time) for every
+range bin. A :class:`DopplerProcessor` keeps a rolling window of the most recent
+complex range profiles, and produces a range-Doppler map every ``hop`` frames::
+
+	ranger  = avmu.dsp.range_processor(device, output='complex')
+	doppler = avmu.dsp.doppler_processor(device, ranger, frames=128, hop=16)
+	for data, meta in stream:
+		for rd_map in doppler.push(ranger.transform(data)):
+			show(doppler.velocity_axis, ranger.range_axis, rd_map[0, 0])
+
+Static scenes are usually processed with the background removed. A
+:class:`BackgroundSubtractor` keeps a per-path model of the background (an
+exponential moving average, a sliding-window mean, or a sliding-window median)
+and subtracts it from each frame, updating in place::
+
+	clutter = avmu.dsp.background_subtractor(device, mode='ema', alpha=0.02)
+	for data, meta in stream:
+		clutter.process(data, out=data)
+
+A :class:`FrameAverager` averages every ``count`` frames into one, per
+``(tx_path, rx_path, receiver)``, to cut the noise (and the downstream
+processing rate) by ``count``::
+
+	averager = avmu.dsp.frame_averager(device, count=8, mode='coherent')
+	for data, meta in stream:
+		for averaged in averager.push(data):
+			process(averaged)
+
+# #########################################################################
+'''
+
+import functools
+import inspect
+
+import numpy as np
+
+from . import avmu_exceptions
+
+
+# Propagation speed used for the range axis, in meters/second.
+SPEED_OF_LIGHT = 299792458.0
+
+# Smallest transform length chosen automatically.
+MIN_FFT_SIZE = 128
+
+# Number of bins in a zoom window, if not specified.
+ZOOM_DEFAULT_BINS = 512
+
+# Floor added before taking the log for ``output='db'``, so empty bins are not -inf.
+DB_FLOOR = 1e-20
+
+OUTPUT_MODES = ('complex', 'magnitude', 'db')
+
+BACKGROUND_MODES = ('ema', 'mean', 'median')
+
+AVERAGING_MODES = ('boxcar', 'exponential', 'coherent')
+
+# Updates between recomputing the sliding-mean running sum from the window, so
+# rounding errors from the incremental updates do not accumulate.
+RESUM_INTERVAL = 65536
+
+# numpy >= 2.0 can write FFT results into an existing array.
+_FFT_HAS_OUT = 'out' in inspect.signature(np.fft.ifft).parameters
+
+
+def next_power_of_two(value):
+	'''
+	Returns:
+		The smallest power of two that is >= ``value``.
+	'''
+	return 1 << max(int(value) - 1, 0).bit_length()
+
+
+@functools.lru_cache(maxsize=32)
+def _chirp_z_kernels(points, start_padding, step_hz, start_s, step_s, bins, dtype):
+	'''
+	Compute (and cache) the chirp-z transform kernels evaluating the padded iFFT input (sweep
+	point ``k`` at index ``start_padding + k``, spaced ``step_hz`` apart) at the times
+	``start_s + m * step_s``, for ``m`` in ``range(bins)``.
+
+	The sum over ``k`` of ``x[k] * exp(2j * pi * (start_padding + k) * step_hz * t[m])`` is split
+	with ``k * m = (k ** 2 + m ** 2 - (m - k) ** 2) / 2`` into a pre-multiplication, a
+	convolution with a chirp (done with FFTs of length ``conv_size``), and a post-multiplication.
+
+	Returns:
+		4-tuple of ``(pre, kernel_fft, post, conv_size)``. The arrays are read-only, as they
+		are shared between processors.
+	'''
+	alpha = step_hz * step_s
+	conv_size = next_power_of_two(points + bins - 1)
+
+	def chirp(n, sign):
+		# Reduce the phase (in cycles) before scaling, to keep precision for large n.
+		return np.exp(sign * 1j * np.pi * np.mod(alpha * n * n, 2.0))
+
+	k = np.arange(points, dtype=np.float64)
+	m = np.arange(bins, dtype=np.float64)
+
+	pre  = chirp(k, 1) * np.exp(2j * np.pi * np.mod((start_padding + k) * step_hz * start_s, 1.0))
+	post = chirp(m, 1) * np.exp(2j * np.pi * np.mod(start_padding * alpha * m, 1.0))
+
+	kernel = np.zeros(conv_size, dtype=np.complex128)
+	kernel[:bins] = chirp(m, -1)
+	kernel[conv_size - points + 1:] = chirp(np.arange(points - 1, 0, -1, dtype=np.float64), -1)
+	kernel_fft = np.fft.fft(kernel)
+
+	ret = []
+	for arr in (pre, kernel_fft, post):
+		arr = arr.astype(dtype)
+		arr.setflags(write=False)
+		ret.append(arr)
+	return ret[0], ret[1], ret[2], conv_size
+
+
+class RangeProcessor(object):
+	'''
+	Converts batches of frequency-domain sweeps to time-domain range profiles.
+
+	The plan (window, padding, transform length and axes) is computed on construction, and
+	the working buffers are allocated on first use and reused while the batch size does not
+	grow, so :func:`transform()` does no per-sweep work in python.
+
+	Args:
+		frequencies (list): The swept frequencies, in MHz, as returned by
+		                    :func:`~avmu.avmu_library.AvmuInterface.getFrequencies()`.
+		                    The points are assumed to be evenly spaced.
+		cable_delay (float): Total cable delay (TX + RX), in nanoseconds. The time axis is
+		                     shifted by this, so zero is at the antenna plane.
+		window (callable or array): Window function called with the point count (e.g.
+		                            ``np.hanning``), or an array of per-point weights.
+		                            ``None`` disables windowing.
+		fft_size (int): Transform length. Defaults to the next power of two (and at least
+		                ``MIN_FFT_SIZE``) that fits the start padding and the sweep.
+		output (str): ``'complex'`` for the complex profile, ``'magnitude'`` for its absolute
+		              value, or ``'db'`` for ``20 * log10(magnitude)``.
+		bins (int): Number of time bins to keep. Defaults to the positive-time half of
+		            the transform, or ``ZOOM_DEFAULT_BINS`` with ``zoom``.
+		dtype: ``np.complex64`` or ``np.complex128``, the precision of the transform.
+		zoom (tuple): ``(start, stop)`` times, in nanoseconds on the (cable delay corrected) time
+		              axis. If set, only ``bins`` evenly spaced times from ``start`` to ``stop``
+		              (inclusive) are evaluated, with a chirp-z transform. The values are those
+		              of the full transform interpolated to those times, with the same scaling.
+		              Zooming needs a sweep of more than one point.
+
+	Raises:
+		ValueError: If ``fft_size`` is too small to hold the padded sweep.
+	'''
+
+	def __init__(self, frequencies, cable_delay=0.0, window=np.hanning, fft_size=None, output='magnitude', bins=None, dtype=np.complex128, zoom=None):
+		frequencies = np.asarray(frequencies, dtype=np.float64)
+		assert frequencies.ndim == 1 and len(frequencies) > 0, "RangeProcessor needs at least one frequency point!"
+		assert output in OUTPUT_MODES, "Output mode must be one of %s. Passed: '%s'" % (OUTPUT_MODES, output)
+		assert np.dtype(dtype) in (np.dtype(np.complex64), np.dtype(np.complex128)), \
+				"RangeProcessor dtype must be complex64 or complex128. Passed: '%s'" % (dtype, )
+
+		self.frequencies = frequencies
+		self.cable_delay = cable_delay
+		self.output      = output
+		self.dtype       = np.dtype(dtype)
+		self.points      = len(frequencies)
+
+		if self.points > 1:
+			self.step_mhz = (frequencies[-1] - frequencies[0]) / (self.points - 1)
+		else:
+			self.step_mhz = 0.0
+
+		# Pad the start of the transform input from 0 Hz up to the first swept frequency.
+		if self.step_mhz > 0:
+			self.start_padding = max(int(round(frequencies[0] / self.step_mhz)), 0)
+		else:
+			self.start_padding = 0
+
+		min_size = self.start_padding + self.points
+		if fft_size is None:
+			fft_size = max(next_power_of_two(min_size), MIN_FFT_SIZE)
+		elif fft_size < min_size:
+			raise ValueError("FFT size %s is too small for %s points with %s points of start padding!" % (
+					fft_size, self.points, self.start_padding))
+		self.fft_size = fft_size
+
+		if zoom is not None:
+			assert self.step_mhz > 0, "Zooming needs a sweep over more than one frequency!"
+			assert zoom[1] > zoom[0], "Zoom stop time must be after the start time. Passed: %s" % (zoom, )
+			if bins is None:
+				bins = ZOOM_DEFAULT_BINS
+			assert bins > 1, "A zoom window needs at least two bins. Passed: %s" % (bins, )
+		elif bins is None:
+			bins = fft_size // 2
+		else:
+			assert 0 < bins <= fft_size, "Bins must be between 1 and the FFT size (%s). Passed: %s" % (fft_size, bins)
+		self.bins = bins
+		self.zoom = tuple(zoom) if zoom is not None else None
+
+		real_dtype = np.float32 if self.dtype == np.complex64 else np.float64
+		if window is None:
+			self.window = None
+		else:
+			if callable(window):
+				window = window(self.points)
+			self.window = np.asarray(window, dtype=real_dtype)
+			assert self.window.shape == (self.points, ), "Window must have one weight per point (%s). Shape: %s" % (
+					self.points, self.window.shape)
+
+		# Time axis, in nanoseconds. The iFFT bin spacing is 1 / (fft_size * frequency step).
+		if self.zoom is not None:
+			self.time_step = (self.zoom[1] - self.zoom[0]) / (bins - 1)
+			self.time_axis = self.zoom[0] + np.arange(bins) * self.time_step
+		elif self.step_mhz > 0:
+			self.time_step = 1e3 / (fft_size * self.step_mhz)
+			self.time_axis = np.arange(bins) * self.time_step - cable_delay
+		else:
+			self.time_step = None
+			self.time_axis = np.arange(bins, dtype=np.float64)
+
+		self.out_dtype = self.dtype if output == 'complex' else np.dtype(real_dtype)
+
+		if self.zoom is not None:
+			pre, self.__kernel_fft, self.__post, self.__conv_size = _chirp_z_kernels(
+					self.points,
+					self.start_padding,
+					self.step_mhz * 1e6,
+					(self.zoom[0] + cable_delay) * 1e-9,
+					self.time_step * 1e-9,
+					bins,
+					self.dtype,
+				)
+			# Fold the window and the iFFT's 1 / fft_size scaling into the pre-multiplication.
+			pre = pre / fft_size
+			if self.window is not None:
+				pre = pre * self.window
+			self.__pre = pre.astype(self.dtype)
+
+		self.__capacity = 0
+		self.__work     = None
+		self.__spectrum = None
+		self.__out      = None
+
+	@property
+	def range_axis(self):
+		'''
+		The time axis converted to one-way range, in meters (half the round-trip distance).
+		'''
+		if self.time_step is None:
+			return self.time_axis.copy()
+		return self.time_axis * 1e-9 * SPEED_OF_LIGHT / 2
+
+	def __reserve(self, count):
+		if count <= self.__capacity:
+			return
+		# The padding regions of the work buffer are zeroed here, and never written again.
+		size = self.fft_size if self.zoom is None else self.__conv_size
+		self.__work     = np.zeros((count, size), dtype=self.dtype)
+		self.__spectrum = np.empty((count, size), dtype=self.dtype) if _FFT_HAS_OUT else None
+		self.__out      = np.empty((count, self.bins), dtype=self.out_dtype)
+		self.__capacity = count
+
+	def __ifft(self, flat, count):
+		work = self.__work[:count]
+		dest = work[:, self.start_padding:self.start_padding + self.points]
+		if self.window is None:
+			dest[...] = flat
+		else:
+			np.multiply(flat, self.window, out=dest)
+
+		if _FFT_HAS_OUT:
+			spectrum = np.fft.ifft(work, axis=-1, out=self.__spectrum[:count])
+		else:
+			spectrum = np.fft.ifft(work, axis=-1)
+		return spectrum[:, :self.bins]
+
+	def __chirp_z(self, flat, count):
+		work = self.__work[:count]
+		np.multiply(flat, self.__pre, out=work[:, :self.points])
+
+		# The convolution overwrites the work buffer, so the padding has to be cleared every call.
+		work[:, self.points:] = 0
+		if _FFT_HAS_OUT:
+			spectrum = np.fft.fft(work, axis=-1, out=self.__spectrum[:count])
+			spectrum *= self.__kernel_fft
+			spectrum = np.fft.ifft(spectrum, axis=-1, out=work)
+		else:
+			spectrum = np.fft.fft(work, axis=-1)
+			spectrum *= self.__kernel_fft
+			spectrum = np.fft.ifft(spectrum, axis=-1)
+		spectrum = spectrum[:, :self.bins]
+		spectrum *= self.__post
+		return spectrum
+
+	def transform(self, data, out=None):
+		'''
+		Convert a batch of sweeps to range profiles.
+
+		Args:
+			data (numpy array): Complex sweep data, with the frequency points on the last axis.
+			                    Any leading axes (frames, paths, receivers, ...) are kept.
+			out (numpy array): Optional output array, of shape ``data.shape[:-1] + (bins, )``
+			                   and dtype ``out_dtype``. If not passed, the result is a view
+			                   into a buffer owned by the processor, which is overwritten by
+			                   the next call.
+
+		Returns:
+			Array of shape ``data.shape[:-1] + (bins, )``.
+		'''
+		data = np.asarray(data)
+		assert data.shape[-1] == self.points, "Data has %s points per sweep, processor expects %s!" % (
+				data.shape[-1], self.points)
+
+		lead  = data.shape[:-1]
+		flat  = data.reshape(-1, self.points)
+		count = flat.shape[0]
+		self.__reserve(count)
+
+		if self.zoom is None:
+			spectrum = self.__ifft(flat, count)
+		else:
+			spectrum = self.__chirp_z(flat, count)
+
+		if out is None:
+			result = self.__out[:count]
+		else:
+			assert out.shape == lead + (self.bins, ), "Output shape must be %s. Passed: %s" % (lead + (self.bins, ), out.shape)
+			assert out.dtype == self.out_dtype, "Output dtype must be %s. Passed: %s" % (self.out_dtype, out.dtype)
+			result = out.reshape(count, self.bins)
+
+		if self.output == 'complex':
+			result[...] = spectrum
+		else:
+			np.absolute(spectrum, out=result)
+			if self.output == 'db':
+				result += DB_FLOOR
+				np.log10(result, out=result)
+				result *= 20
+
+		if out is not None:
+			# reshape() copies if ``out`` is not contiguous, in which case copy the result back.
+			if not np.shares_memory(result, out):
+				out[...] = result.reshape(out.shape)
+			return out
+		return result.reshape(lead + (self.bins, ))
+
+	__call__ = transform
+
+
+def range_processor(interface, **kwargs):
+	'''
+	Build a :class:`RangeProcessor` for the sweep currently configured on ``interface``.
+
+	Args:
+		interface (AvmuInterface): The interface to take the frequencies (and, unless overridden,
+		                           the output dtype) from.
+		**kwargs: Passed to :class:`RangeProcessor`.
+	'''
+	kwargs.setdefault('dtype', interface.getOutputDtype())
+	return RangeProcessor(interface.getFrequencies(), **kwargs)
+
+
+class DopplerProcessor(object):
+	'''
+	Rolling slow-time processor, producing range-Doppler maps from a stream of range profiles.
+
+	Profiles are written into a circular ``(*shape, frames, bins)`` buffer as they arrive. As soon
+	as the buffer has filled, and every ``hop`` frames after that, the buffer is unrolled into time
+	order through the window, and FFT'd across frames, into preallocated buffers.
+
+	Args:
+		bins (int): Range bins per profile.
+		frame_time (float): Time between frames, in seconds (see
+		                    :func:`~avmu.avmu_library.AvmuInterface.getPreciseTimePerFrame()`).
+		frames (int): Number of frames in each map (the coherent processing interval).
+		hop (int): Frames between maps. Defaults to ``frames``, i.e. non-overlapping maps.
+		shape (tuple): Leading shape of each profile, e.g. ``(paths, receivers)`` for profiles from
+		               a :class:`RangeProcessor` fed with :func:`~avmu.avmu_library.AvmuInterface.measureBatch()`
+		               frames. Each leading index gets its own map.
+		window (callable or array): Slow-time window function called with ``frames``, or an array
+		                            of per-frame weights. ``None`` disables windowing.
+		output (str): ``'complex'``, ``'magnitude'`` or ``'db'``, as for :class:`RangeProcessor`.
+		dtype: ``np.complex64`` or ``np.complex128``, the precision of the buffer and transform.
+		center_frequency (float): Sweep center frequency, in MHz. Needed for :attr:`velocity_axis`.
+	'''
+
+	def __init__(self, bins, frame_time, frames=64, hop=None, shape=(), window=np.hanning, output='db', dtype=np.complex128, center_frequency=None):
+		assert frames > 1, "A Doppler map needs at least two frames. Passed: %s" % (frames, )
+		assert frame_time > 0, "Frame time must be positive. Passed: %s" % (frame_time, )
+		assert output in OUTPUT_MODES, "Output mode must be one of %s. Passed: '%s'" % (OUTPUT_MODES, output)
+		assert np.dtype(dtype) in (np.dtype(np.complex64), np.dtype(np.complex128)), \
+				"DopplerProcessor dtype must be complex64 or complex128. Passed: '%s'" % (dtype, )
+		if hop is None:
+			hop = frames
+		assert 0 < hop <= frames, "Hop must be between 1 and the frame count (%s). Passed: %s" % (frames, hop)
+
+		self.bins             = bins
+		self.frame_time       = frame_time
+		self.frames           = frames
+		self.hop              = hop
+		self.shape            = tuple(shape)
+		self.output           = output
+		self.dtype            = np.dtype(dtype)
+		self.center_frequency = center_frequency
+
+		real_dtype = np.float32 if self.dtype == np.complex64 else np.float64
+		if window is None:
+			self.window = None
+		else:
+			if callable(window):
+				window = window(frames)
+			window = np.asarray(window, dtype=real_dtype)
+			assert window.shape == (frames, ), "Window must have one weight per frame (%s). Shape: %s" % (frames, window.shape)
+			# Shaped to broadcast along the frame axis of the buffer.
+			self.window = window.reshape(frames, 1)
+
+		self.out_dtype = self.dtype if output == 'complex' else np.dtype(real_dtype)
+
+		# Doppler axis, in Hz, with zero Doppler in the middle of the map.
+		self.doppler_axis = np.fft.fftshift(np.fft.fftfreq(frames, frame_time))
+
+		self.__ring     = np.zeros(self.shape + (frames, bins), dtype=self.dtype)
+		self.__work     = np.empty(self.shape + (frames, bins), dtype=self.dtype)
+		self.__spectrum = np.empty(self.shape + (frames, bins), dtype=self.dtype) if _FFT_HAS_OUT else None
+		self.__out      = np.empty(self.shape + (frames, bins), dtype=self.out_dtype)
+
+		# Next ring slot to write, frames written in total, and frames until the next map.
+		self.__index     = 0
+		self.__total     = 0
+		self.__remaining = frames
+
+	@property
+	def velocity_axis(self):
+		'''
+		The Doppler axis converted to radial velocity, in meters/second (positive is approaching).
+
+		Raises:
+			ValueError: If the processor has no ``center_frequency``.
+		'''
+		if not self.center_frequency:
+			raise ValueError("A center frequency is needed to convert Doppler to velocity!")
+		return self.doppler_axis * SPEED_OF_LIGHT / (2 * self.center_frequency * 1e6)
+
+	@property
+	def frames_written(self):
+		return self.__total
+
+	def reset(self):
+		'''
+		Discard the buffered frames. The next map is produced once the buffer has refilled.
+		'''
+		self.__ring[...] = 0
+		self.__index     = 0
+		self.__total     = 0
+		self.__remaining = self.frames
+
+	def push(self, profiles):
+		'''
+		Add frames of complex range profiles to the buffer.
+
+		This is a generator, yielding a range-Doppler map when the buffer first fills, and each time
+		``hop`` more frames have been added after that, so a batch of frames can produce any number of maps::
+
+			for rd_map in doppler.push(profiles):
+				detect(rd_map)
+
+		Each map is a view of shape ``(*shape, frames, bins)`` into a buffer owned by the processor,
+		with the Doppler axis (see :attr:`doppler_axis`) before the range axis. It is overwritten by
+		the next map, so copy it if it is needed after the loop advances.
+
+		Args:
+			profiles (numpy array): Complex profiles of shape ``(n, *shape, bins)``, or
+			                        ``(*shape, bins)`` for a single frame.
+		'''
+		profiles = np.asarray(profiles)
+		if profiles.shape == self.shape + (self.bins, ):
+			profiles = profiles[np.newaxis]
+		assert profiles.shape[1:] == self.shape + (self.bins, ), "Profiles must have shape (n, %s). Passed: %s" % (
+				", ".join(str(tmp) for tmp in self.shape + (self.bins, )), profiles.shape)
+
+		pos = 0
+		count = profiles.shape[0]
+		while pos < count:
+			# Write up to the next map, in contiguous runs of ring slots.
+			step = min(count - pos, self.__remaining, self.frames - self.__index)
+			# Profile frames are moved to the ring's frame axis, just before the range bins.
+			self.__ring[..., self.__index:self.__index + step, :] = np.moveaxis(profiles[pos:pos + step], 0, -2)
+			pos            += step
+			self.__index    = (self.__index + step) % self.frames
+			self.__total     += step
+			self.__remaining -= step
+
+			if not self.__remaining:
+				self.__remaining = self.hop
+				yield self.__transform()
+
+	def __transform(self):
+		ring, work = self.__ring, self.__work
+		idx, frames = self.__index, self.frames
+
+		# Unroll the ring into time order (the oldest frame is at the write index).
+		head = frames - idx
+		if self.window is None:
+			work[..., :head, :] = ring[..., idx:, :]
+			work[..., head:, :] = ring[..., :idx, :]
+		else:
+			np.multiply(ring[..., idx:, :], self.window[:head], out=work[..., :head, :])
+			np.multiply(ring[..., :idx, :], self.window[head:], out=work[..., head:, :])
+
+		if _FFT_HAS_OUT:
+			spectrum = np.fft.fft(work, axis=-2, out=self.__spectrum)
+		else:
+			spectrum = np.fft.fft(work, axis=-2)
+
+		# fftshift, without the temporary.
+		out  = self.__out
+		half = frames - frames // 2
+		neg  = frames // 2
+		if self.output == 'complex':
+			out[..., :neg, :] = spectrum[..., half:, :]
+			out[..., neg:, :] = spectrum[..., :half, :]
+		else:
+			np.absolute(spectrum[..., half:, :], out=out[..., :neg, :])
+			np.absolute(spectrum[..., :half, :], out=out[..., neg:, :])
+			if self.output == 'db':
+				out += DB_FLOOR
+				np.log10(out, out=out)
+				out *= 20
+		return out
+
+
+def doppler_processor(interface, range_proc, frames=64, hop=None, **kwargs):
+	'''
+	Build a :class:`DopplerProcessor` for the profiles produced by ``range_proc`` from the
+	frames of the task currently configured on ``interface``.
+
+	The frame time is taken from :func:`~avmu.avmu_library.AvmuInterface.getPreciseTimePerFrame()`,
+	the leading shape is ``(paths, receivers)`` as returned by
+	:func:`~avmu.avmu_library.AvmuInterface.allocateFrameBuffer()`, and the center frequency is
+	the middle of the sweep.
+
+	Args:
+		interface (AvmuInterface): The (started) interface the frames come from.
+		range_proc (RangeProcessor): The range processor the profiles come from. Its output mode
+		                             must be ``'complex'``.
+		frames (int): Frames per map.
+		hop (int): Frames between maps.
+		**kwargs: Passed to :class:`DopplerProcessor`.
+
+	Raises:
+		Avmu_Exception_Wrong_State: If the task has not been started, so the frame time is not known.
+	'''
+	assert range_proc.output == 'complex', "Doppler processing needs complex range profiles!"
+	frame_time = interface.getPreciseTimePerFrame()
+	if frame_time <= 0:
+		raise avmu_exceptions.Avmu_Exception_Wrong_State("The frame time is not known until the task has been started!")
+
+	kwargs.setdefault('shape', (len(interface.measured_paths), len(interface.getEnabledReceivers())))
+	kwargs.setdefault('dtype', range_proc.dtype)
+	kwargs.setdefault('center_frequency', (range_proc.frequencies[0] + range_proc.frequencies[-1]) / 2)
+	return DopplerProcessor(range_proc.bins, frame_time, frames=frames, hop=hop, **kwargs)
+
+
+class BackgroundSubtractor(object):
+	'''
+	Per-path background (clutter) model, subtracted from complex frames as they arrive.
+
+	Each frame has the background as it was *before* that frame subtracted from it, and is then
+	added to the model, so a target appearing in a frame is not partially removed from itself.
+	The first frame seeds the background, so it comes out as zeros.
+
+	Modes:
+
+	 - ``'ema'``    - Exponential moving average, ``bg += alpha * (frame - bg)``.
+	 - ``'mean'``   - Mean of the last ``window`` frames, kept as a running sum over a circular buffer.
+	 - ``'median'`` - Median of the last ``window`` frames (of the real and imaginary parts
+	                  separately), from a circular buffer.
+
+	The model, window and scratch buffers are allocated on construction, and every update
+	writes into them, so processing does not allocate per frame (except for the sort
+	inside ``np.median()``).
+
+	Args:
+		shape (tuple): Shape of one frame, e.g. ``(paths, receivers, points)``.
+		mode (str): One of ``BACKGROUND_MODES``.
+		alpha (float): EMA update weight, 0 < ``alpha`` <= 1.
+		window (int): Number of frames in the sliding window, for ``'mean'`` and ``'median'``.
+		dtype: ``np.complex64`` or ``np.complex128``, the dtype of the frames.
+	'''
+
+	def __init__(self, shape, mode='ema', alpha=0.05, window=32, dtype=np.complex128):
+		assert mode in BACKGROUND_MODES, "Background mode must be one of %s. Passed: '%s'" % (BACKGROUND_MODES, mode)
+		assert 0 < alpha <= 1, "EMA alpha must be in (0, 1]. Passed: %s" % (alpha, )
+		assert window > 0, "The background window must be at least one frame. Passed: %s" % (window, )
+		assert np.dtype(dtype) in (np.dtype(np.complex64), np.dtype(np.complex128)), \
+				"BackgroundSubtractor dtype must be complex64 or complex128. Passed: '%s'" % (dtype, )
+
+		self.shape  = tuple(shape)
+		self.mode   = mode
+		self.alpha  = alpha
+		self.window = window
+		self.dtype  = np.dtype(dtype)
+
+		self.__background = np.zeros(self.shape, dtype=self.dtype)
+		self.__scratch    = np.zeros(self.shape, dtype=self.dtype)
+		if mode == 'ema':
+			self.__ring = None
+			self.__sum  = None
+		else:
+			self.__ring = np.zeros((window, ) + self.shape, dtype=self.dtype)
+			# The running sum is kept in double precision regardless of the frame dtype.
+			self.__sum  = np.zeros(self.shape, dtype=np.complex128) if mode == 'mean' else None
+
+		self.__index   = 0
+		self.__count   = 0
+		self.__updates = 0
+
+	@property
+	def frames_seen(self):
+		return self.__count
+
+	@property
+	def background(self):
+		'''
+		The current background estimate (a copy), of shape ``shape``.
+		'''
+		if self.mode == 'ema':
+			return self.__background.copy()
+		if self.__count == 0:
+			return np.zeros(self.shape, dtype=self.dtype)
+		self.__estimate(self.__scratch)
+		return self.__scratch.copy()
+
+	def reset(self):
+		'''
+		Discard the background model. The next frame seeds a new one.
+		'''
+		self.__background[...] = 0
+		if self.__ring is not None:
+			self.__ring[...] = 0
+		if self.__sum is not None:
+			self.__sum[...] = 0
+		self.__index   = 0
+		self.__count   = 0
+		self.__updates = 0
+
+	def __estimate(self, dest):
+		filled = min(self.__count, self.window)
+		if self.mode == 'mean':
+			np.divide(self.__sum, filled, out=dest, casting='same_kind')
+		else:
+			# Viewing the complex values as (real, imag) pairs takes the median of each part.
+			ring = self.__ring[:filled] if filled < self.window else self.__ring
+			real_ring = ring.view(ring.real.dtype)
+			np.median(real_ring, axis=0, out=dest.view(dest.real.dtype))
+
+	def __resum(self):
+		np.sum(self.__ring, axis=0, out=self.__sum)
+		self.__updates = 0
+
+	def process(self, frames, out=None, update=True):
+		'''
+		Subtract the background from ``frames``, updating the model with each frame in turn.
+
+		Args:
+			frames (numpy array): Complex frames, of shape ``(n, *shape)``, or ``shape`` for a single
+			                      frame (e.g. the data array from
+			                      :func:`~avmu.avmu_library.AvmuInterface.measureBatch()`).
+			out (numpy array): Output array, of the same shape as ``frames``. May be ``frames``
+			                   itself, to subtract in place. Allocated if not passed.
+			update (bool): If False, subtract the current background without updating it.
+
+		Returns:
+			The background-subtracted frames (``out``, if passed).
+		'''
+		frames = np.asarray(frames)
+		single = frames.shape == self.shape
+		if single:
+			frames = frames[np.newaxis]
+		assert frames.shape[1:] == self.shape, "Frames must have shape (n, %s). Passed: %s" % (
+				", ".join(str(tmp) for tmp in self.shape), frames.shape)
+
+		if out is None:
+			out = np.empty(frames.shape, dtype=self.dtype)
+			result = out[0] if single else out
+		else:
+			result = out
+			if single:
+				out = out[np.newaxis]
+			assert out.shape == frames.shape, "Output shape must match the frames. Passed: %s" % (out.shape, )
+
+		if self.mode == 'ema':
+			self.__process_ema(frames, out, update)
+		else:
+			self.__process_window(frames, out, update)
+		return result
+
+	def __process_ema(self, frames, out, update):
+		bg, scratch = self.__background, self.__scratch
+		for idx in range(frames.shape[0]):
+			if self.__count == 0:
+				if not update:
+					out[idx] = frames[idx]
+					continue
+				bg[...] = frames[idx]
+			# Written so that ``out`` may alias ``frames``: only the difference is needed for the update.
+			diff = out[idx]
+			np.subtract(frames[idx], bg, out=diff)
+			if update:
+				np.multiply(diff, self.alpha, out=scratch)
+				bg += scratch
+				self.__count += 1
+
+	def __process_window(self, frames, out, update):
+		bg, ring = self.__scratch, self.__ring
+		for idx in range(frames.shape[0]):
+			if self.__count == 0:
+				if not update:
+					out[idx] = frames[idx]
+					continue
+				bg[...] = frames[idx]
+			else:
+				self.__estimate(bg)
+
+			if not update:
+				np.subtract(frames[idx], bg, out=out[idx])
+				continue
+
+			# Copy the frame into the window before writing the output, so ``out`` may alias ``frames``.
+			slot = ring[self.__index]
+			if self.mode == 'mean':
+				self.__sum -= slot
+			slot[...] = frames[idx]
+			if self.mode == 'mean':
+				self.__sum += slot
+				self.__updates += 1
+				if self.__updates >= RESUM_INTERVAL:
+					self.__resum()
+			np.subtract(slot, bg, out=out[idx])
+
+			self.__index = (self.__index + 1) % self.window
+			self.__count += 1
+
+
+def background_subtractor(interface, mode='ema', **kwargs):
+	'''
+	Build a :class:`BackgroundSubtractor` for frames of the task currently configured on
+	``interface``, i.e. of shape ``(paths, receivers, points)`` and the interface's output dtype.
+
+	Args:
+		interface (AvmuInterface): The interface the frames come from.
+		mode (str): One of ``BACKGROUND_MODES``.
+		**kwargs: Passed to :class:`BackgroundSubtractor`.
+	'''
+	kwargs.setdefault('dtype', interface.getOutputDtype())
+	shape = (len(interface.measured_paths), len(interface.getEnabledReceivers()), interface.getNumberOfFrequencies())
+	return BackgroundSubtractor(shape, mode=mode, **kwargs)
+
+
+class FrameAverager(object):
+	'''
+	Running average of complex frames, emitting one averaged frame for every ``count`` input frames.
+
+	Each frame is a ``(paths, receivers, points)`` array (as returned by
+	:func:`~avmu.avmu_library.AvmuInterface.measureBatch()`), and each ``(path, receiver)`` row is
+	averaged independently. Rows can be named by ``(tx_path, rx_path, receiver)`` keys, which is how
+	frames from :func:`~avmu.avmu_library.AvmuInterface.extractAllPaths()` are laid out (see
+	:func:`pushPaths()`).
+
+	Modes:
+
+	 - ``'boxcar'``      - Mean of each block of ``count`` frames.
+	 - ``'exponential'`` - Exponential moving average with weight ``alpha``, sampled every ``count`` frames.
+	 - ``'coherent'``    - Mean of each block of ``count`` frames, after rotating every frame so the
+	                       phase of its ``reference`` point(s) matches the first frame of the block. This
+	                       removes sweep-to-sweep phase drift (e.g. from the LO), which otherwise
+	                       partially cancels a boxcar average.
+
+	The accumulators are allocated for the shape of the first frame, and reallocated (discarding any
+	partial average) whenever the frame shape or keys change, e.g. after the sweep plan is changed.
+
+	Args:
+		count (int): Number of frames per averaged frame.
+		mode (str): One of ``AVERAGING_MODES``.
+		alpha (float): EMA weight for ``'exponential'``. Defaults to ``1 / count``.
+		reference (int or slice): Point index (or slice of points, which are summed) used as the phase
+		                          reference in ``'coherent'`` mode. Pick points with a strong, stable
+		                          return, such as the direct TX -> RX coupling.
+		keys (list): ``(tx_path, rx_path, receiver)`` key for every row, in ``(paths, receivers)`` order.
+		dtype: ``np.complex64`` or ``np.complex128``, the dtype of the accumulators and output.
+	'''
+
+	def __init__(self, count, mode='boxcar', alpha=None, reference=0, keys=None, dtype=np.complex128):
+		assert count > 0, "Averaging count must be at least one frame. Passed: %s" % (count, )
+		assert mode in AVERAGING_MODES, "Averaging mode must be one of %s. Passed: '%s'" % (AVERAGING_MODES, mode)
+		if alpha is None:
+			alpha = 1.0 / count
+		assert 0 < alpha <= 1, "EMA alpha must be in (0, 1]. Passed: %s" % (alpha, )
+		assert np.dtype(dtype) in (np.dtype(np.complex64), np.dtype(np.complex128)), \
+				"FrameAverager dtype must be complex64 or complex128. Passed: '%s'" % (dtype, )
+
+		self.count     = count
+		self.mode      = mode
+		self.alpha     = alpha
+		self.reference = reference
+		self.dtype     = np.dtype(dtype)
+
+		self.shape = None
+		self.keys  = None
+		self.__key_index = {}
+		self.__accum   = None
+		self.__out     = None
+		self.__scratch = None
+		self.__rotation     = None
+		self.__ref_phase    = None
+		self.__path_staging = None
+		self.__filled  = 0
+		self.__seeded  = False
+		self.__emitted = 0
+
+		if keys is not None:
+			self.__set_keys(list(keys))
+
+	@property
+	def pending(self):
+		'''
+		Number of frames added since the last averaged frame was emitted.
+		'''
+		return self.__filled
+
+	@property
+	def frames_emitted(self):
+		return self.__emitted
+
+	def __set_keys(self, keys, receivers=None):
+		# Rows are in (paths, receivers) order, so every path has the same number of receivers.
+		if receivers is None:
+			receivers = len(set(key[2] for key in keys))
+		self.keys = keys
+		self.__key_index = {key : divmod(idx, receivers) for idx, key in enumerate(keys)}
+
+	def __allocate(self, shape):
+		self.shape     = tuple(shape)
+		self.__accum   = np.zeros(self.shape, dtype=self.dtype)
+		self.__out     = np.zeros(self.shape, dtype=self.dtype)
+		self.__scratch = np.zeros(self.shape, dtype=self.dtype)
+		if self.mode == 'coherent':
+			self.__rotation  = np.zeros(self.shape[:-1], dtype=self.dtype)
+			self.__ref_phase = np.zeros(self.shape[:-1], dtype=self.dtype)
+		self.reset()
+
+	def reset(self):
+		'''
+		Discard the partial average (and, in ``'exponential'`` mode, the EMA state).
+		'''
+		if self.__accum is not None:
+			self.__accum[...] = 0
+		self.__filled = 0
+		self.__seeded = False
+
+	def index(self, key):
+		'''
+		Get the ``(path, receiver)`` row index for a ``(tx_path, rx_path, receiver)`` key.
+		'''
+		return self.__key_index[key]
+
+	def __unit_reference(self, frame, dest):
+		# Unit phasor of each row's reference point(s). Rows with no signal at the reference get 1.
+		if isinstance(self.reference, slice):
+			np.sum(frame[..., self.reference], axis=-1, out=dest)
+		else:
+			dest[...] = frame[..., self.reference]
+		mag = np.absolute(dest)
+		zero = mag == 0
+		mag[zero] = 1
+		dest /= mag
+		dest[zero] = 1
+
+	def __add(self, frame):
+		accum = self.__accum
+		if self.mode == 'exponential':
+			if not self.__seeded:
+				accum[...] = frame
+				self.__seeded = True
+			else:
+				np.subtract(frame, accum, out=self.__scratch)
+				self.__scratch *= self.alpha
+				accum += self.__scratch
+		elif self.mode == 'coherent':
+			self.__unit_reference(frame, self.__rotation)
+			if self.__filled == 0:
+				self.__ref_phase[...] = self.__rotation
+				accum += frame
+			else:
+				# Rotate by (first frame's reference phase) / (this frame's reference phase).
+				np.conjugate(self.__rotation, out=self.__rotation)
+				self.__rotation *= self.__ref_phase
+				np.multiply(frame, self.__rotation[..., np.newaxis], out=self.__scratch)
+				accum += self.__scratch
+		else:
+			accum += frame
+
+		self.__filled += 1
+		if self.__filled < self.count:
+			return None
+		return self.__emit()
+
+	def __emit(self):
+		if self.mode == 'exponential':
+			self.__out[...] = self.__accum
+		else:
+			np.divide(self.__accum, self.__filled, out=self.__out)
+			self.__accum[...] = 0
+		self.__filled = 0
+		self.__emitted += 1
+		return self.__out
+
+	def push(self, frames):
+		'''
+		Add frames to the average.
+
+		This is a generator, yielding an averaged frame every time ``count`` frames have been added,
+		so a batch can produce any number of averaged frames. Each is a view into a buffer owned by
+		the averager, which is overwritten by the next one, so copy it if it is needed after the loop
+		advances.
+
+		Args:
+			frames (numpy array): Complex frames, of shape ``(n, paths, receivers, points)``, or
+			                      ``(paths, receivers, points)`` for a single frame. A shape that does
+			                      not match the current accumulators resets the averager.
+		'''
+		frames = np.asarray(frames)
+		if frames.ndim == 3:
+			frames = frames[np.newaxis]
+		assert frames.ndim == 4, "Frames must have shape (n, paths, receivers, points). Passed: %s" % (frames.shape, )
+		if self.shape != frames.shape[1:]:
+			rows = frames.shape[1] * frames.shape[2]
+			if self.keys is not None and (len(self.keys) != rows or any(rx >= frames.shape[2] for _, rx in self.__key_index.values())):
+				self.keys = None
+				self.__key_index = {}
+			self.__allocate(frames.shape[1:])
+
+		for frame in frames:
+			averaged = self.__add(frame)
+			if averaged is not None:
+				yield averaged
+
+	def flush(self):
+		'''
+		Emit the partial average of the frames added since the last averaged frame.
+
+		Returns:
+			The averaged frame, or ``None`` if no frames are pending.
+		'''
+		if not self.__filled:
+			return None
+		return self.__emit()
+
+	def pushPaths(self, paths):
+		'''
+		Add one frame in the :func:`~avmu.avmu_library.AvmuInterface.extractAllPaths()` (``dict``
+		metadata format) layout.
+
+		The rows are keyed by ``(tx_path, rx_path, receiver)``. If the set of keys or the point count
+		changes, the averager is reset for the new layout.
+
+		Args:
+			paths (list): The list of ``(path_info, data)`` 2-tuples returned by ``extractAllPaths()``.
+
+		Returns:
+			``None``, or, every ``count`` frames, a list in the same layout as ``paths``, with each
+			``data['data']`` dict holding the averaged sweeps (views into the averager's output
+			buffer) and ``data['meta']`` the metadata of the last frame in the average.
+		'''
+		keys = []
+		for path_info, data in paths:
+			for receiver in data['data'].keys():
+				keys.append((path_info['tx_path'], path_info['rx_path'], receiver))
+		points = len(next(iter(paths[0][1]['data'].values()))) if paths else 0
+
+		shape = (len(keys), 1, points)
+		if keys != self.keys or self.shape != shape:
+			self.__set_keys(keys, receivers=1)
+			self.__allocate(shape)
+			self.__path_staging = np.zeros(shape, dtype=self.dtype)
+
+		staging = self.__path_staging
+		row = 0
+		for path_info, data in paths:
+			for sweep in data['data'].values():
+				staging[row, 0] = sweep
+				row += 1
+
+		averaged = self.__add(staging)
+		if averaged is None:
+			return None
+
+		ret = []
+		row = 0
+		for path_info, data in paths:
+			rx_dict = {}
+			for receiver in data['data'].keys():
+				rx_dict[receiver] = averaged[row, 0]
+				row += 1
+			ret.append((path_info, {'data' : rx_dict, 'meta' : data['meta']}))
+		return ret
+
+
+def frame_averager(interface, count, mode='boxcar', **kwargs):
+	'''
+	Build a :class:`FrameAverager` for frames of the task currently configured on ``interface``,
+	with rows keyed by ``(tx_path, rx_path, receiver)`` in the layout of
+	:func:`~avmu.avmu_library.AvmuInterface.allocateFrameBuffer()`.
+
+	Args:
+		interface (AvmuInterface): The interface the frames come from.
+		count (int): Number of frames per averaged frame.
+		mode (str): One of ``AVERAGING_MODES``.
+		**kwargs: Passed to :class:`FrameAverager`.
+	'''
+	kwargs.setdefault('dtype', interface.getOutputDtype())
+	receivers = interface.getEnabledReceivers()
+	kwargs.setdefault('keys', [(tx_path, rx_path, receiver) for _, _, tx_path, rx_path in interface.measured_paths for receiver in receivers])
+	return FrameAverager(count, mode=mode, **kwargs)
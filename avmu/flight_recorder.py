@@ -0,0 +1,242 @@
+'''
+# #########################################################################
+
+In-memory flight recorder for DLL calls.
+
+A :class:`FlightRecorder` keeps the last N DLL calls made by a task (function,
+return code, sweep number and timing) in a set of preallocated numpy arrays.
+Recording a call is a handful of array stores, with no allocation, and calls
+that only read task state (``get*()`` and ``is*()``) are not wrapped at all, so
+it is left enabled all the time. It adds about 1 us to each recorded call, which
+in steady state is only ``measure()`` and ``extractSweepData()``, each taking
+far longer than that. When a call fails, the interface attaches a
+:class:`FlightRecord` snapshot of the ring to the raised exception (as
+``flight_record``), so the history leading up to a field failure is available
+without having had debug logging enabled.
+
+# #########################################################################
+'''
+
+import json
+import time
+
+import numpy as np
+
+
+FLIGHT_RECORD_DTYPE = np.dtype([
+	('time',         np.float64),   # Wall-clock time at the start of the call, as from time.time()
+	('function',     np.uint16),    # Index into the function name table
+	('ret',          np.int32),     # Return value, for calls that return an integer
+	('sweep_number', np.int64),     # Sweep number for extraction calls, otherwise -1
+	('duration',     np.float32),   # Call duration, in seconds
+])
+
+# Minimum time, in seconds, between flight records written to disk for one task.
+DUMP_INTERVAL = 10.0
+
+# Task functions that return a value rather than an error code. Their
+# return values are recorded as-is, but not resolved to error names.
+VALUE_FUNCTIONS = frozenset([
+	'getMeasurementType',
+	'getState',
+	'getTimeout',
+	'getIPAddress',
+	'getIPPort',
+	'getHopRate',
+	'getNumberOfFrequencies',
+	'getHardwareDetails',
+	'getPreciseTimePerFrame',
+])
+
+
+class FlightRecord(object):
+	'''
+	A snapshot of a :class:`FlightRecorder` ring.
+
+	Attributes:
+		events (numpy array): Structured array with the dtype ``FLIGHT_RECORD_DTYPE``, oldest first.
+		functions (list): Function names, indexed by the ``function`` field.
+		context (dict): Extra information about the task at the time of the snapshot
+		                (IP address, state, error code names, etc...).
+	'''
+
+	def __init__(self, events, functions, context=None):
+		self.events    = events
+		self.functions = functions
+		self.context   = context or {}
+
+	def __len__(self):
+		return len(self.events)
+
+	def to_dicts(self):
+		'''
+		Returns:
+			The events as a list of dicts, with function names and error names resolved.
+		'''
+		err_names = self.context.get('error_names', {})
+		ret = []
+		for event in self.events:
+			function = self.functions[event['function']]
+			ret.append({
+				'time'         : float(event['time']),
+				'function'     : function,
+				'ret'          : int(event['ret']),
+				'ret_name'     : None if function in VALUE_FUNCTIONS else err_names.get(int(event['ret'])),
+				'sweep_number' : int(event['sweep_number']),
+				'duration'     : float(event['duration']),
+			})
+		return ret
+
+	def to_json(self, **kwargs):
+		'''
+		Serialize the record to a JSON string. Extra keyword arguments are passed to ``json.dumps()``.
+		'''
+		context = dict(self.context)
+		context['error_names'] = {str(key) : value for key, value in context.get('error_names', {}).items()}
+		return json.dumps({'context' : context, 'events' : self.to_dicts()}, default=str, **kwargs)
+
+	def save(self, path):
+		'''
+		Write the record to ``path``. Paths ending in ``.json`` are written as JSON. Anything
+		else is written in the compact numpy ``.npz`` format, containing the raw ``events``
+		array, and the ``functions`` and ``context`` (as JSON) alongside it.
+		'''
+		if path.endswith(".json"):
+			with open(path, "w") as fp:
+				fp.write(self.to_json(indent=1))
+		else:
+			with open(path, "wb") as fp:
+				np.savez_compressed(fp,
+						events    = self.events,
+						functions = np.array(self.functions),
+						context   = np.array(json.dumps(self.context, default=str)),
+					)
+
+	def format(self, last=20):
+		'''
+		Render the newest ``last`` events as a text table.
+		'''
+		lines = []
+		for event in self.to_dicts()[-last:]:
+			lines.append("%s %-24s ret %4s %-24s sweep %10s %9.3f ms" % (
+					time.strftime("%H:%M:%S", time.localtime(event['time'])) + ("%.6f" % (event['time'] % 1))[1:],
+					event['function'],
+					event['ret'],
+					event['ret_name'] or "",
+					event['sweep_number'],
+					event['duration'] * 1000,
+				))
+		return "\n".join(lines)
+
+
+class FlightRecorder(object):
+	'''
+	Fixed-size ring of the most recent DLL calls for one task.
+
+	Install on a :class:`~avmu.dll_loader.TaskBinding` with
+	``binding.add_wrapper('flight_recorder', recorder.wrap)``. Every
+	:class:`~avmu.avmu_library.AvmuInterface` does this on construction.
+
+	Calls are timed with ``time.perf_counter()``, and their start times converted
+	to wall-clock time when the ring is snapshotted.
+
+	Args:
+		capacity (int): Number of calls to keep.
+		record_reads (bool): Also record calls that only read task state (``get*()`` and
+		                     ``is*()``), at the cost of wrapping them.
+	'''
+
+	def __init__(self, capacity=1024, record_reads=False):
+		assert capacity > 0, "Flight recorder capacity must be at least one event!"
+		self.capacity     = capacity
+		self.record_reads = record_reads
+
+		# Offset from perf_counter() to wall-clock time.
+		self.__epoch = time.time() - time.perf_counter()
+
+		self.__time     = np.zeros(capacity, dtype=np.float64)
+		self.__function = np.zeros(capacity, dtype=np.uint16)
+		self.__ret      = np.zeros(capacity, dtype=np.int32)
+		self.__sweep    = np.zeros(capacity, dtype=np.int64)
+		self.__duration = np.zeros(capacity, dtype=np.float32)
+
+		# Next slot to write, and total number of events written.
+		self.__index = 0
+		self.__total = 0
+
+		self.functions = []
+		self.__function_ids = {}
+
+	def function_id(self, name):
+		'''
+		Get (or assign) the index for function ``name`` in the function name table.
+		'''
+		if name not in self.__function_ids:
+			self.__function_ids[name] = len(self.functions)
+			self.functions.append(name)
+		return self.__function_ids[name]
+
+	def record(self, function_id, start, duration, ret, sweep_number=-1):
+		idx = self.__index
+		self.__time[idx]     = start
+		self.__function[idx] = function_id
+		self.__ret[idx]      = ret
+		self.__sweep[idx]    = sweep_number
+		self.__duration[idx] = duration
+		self.__index = (idx + 1) % self.capacity
+		self.__total += 1
+
+	def wrap(self, name, func):
+		'''
+		:class:`~avmu.dll_loader.TaskBinding` wrapper that records every call to ``func``.
+		Read-only calls are returned unwrapped, unless ``record_reads`` is set.
+		'''
+		if not self.record_reads and name.startswith(("get", "is")):
+			return func
+
+		func_id = self.function_id(name)
+		record  = self.record
+		now     = time.perf_counter
+
+		if name == 'extractSweepData':
+			# The sweep number comes back in the SweepDataStruct passed as the first argument.
+			def recorded(sdat, *args):
+				start = now()
+				ret = func(sdat, *args)
+				record(func_id, start, now() - start, ret, sdat.sweep_number)
+				return ret
+		else:
+			def recorded(*args):
+				start = now()
+				ret = func(*args)
+				record(func_id, start, now() - start, ret if type(ret) is int else 0)
+				return ret
+		return recorded
+
+	def clear(self):
+		self.__index = 0
+		self.__total = 0
+
+	def snapshot(self, context=None):
+		'''
+		Copy the ring contents into a :class:`FlightRecord`, oldest first.
+
+		Args:
+			context (dict): Extra information to store with the record.
+		'''
+		count = min(self.__total, self.capacity)
+		if self.__total > self.capacity:
+			order = np.roll(np.arange(self.capacity), -self.__index)
+		else:
+			order = np.arange(count)
+
+		events = np.zeros(count, dtype=FLIGHT_RECORD_DTYPE)
+		events['time']         = self.__time[order] + self.__epoch
+		events['function']     = self.__function[order]
+		events['ret']          = self.__ret[order]
+		events['sweep_number'] = self.__sweep[order]
+		events['duration']     = self.__duration[order]
+
+		context = dict(context or {})
+		context['events_recorded'] = self.__total
+		return FlightRecord(events, list(self.functions), context)
@@ -0,0 +1,280 @@
+'''
+# #########################################################################
+
+Per-call latency histograms for the DLL entry points.
+
+A :class:`CallInstrumentation` is installed as a wrapper on an interface's
+per-task call table (see :class:`~avmu.dll_loader.TaskBinding`), and records
+the duration of every call into a fixed-size, log-bucketed histogram for that
+function. Each thread records into its own histograms, so recording takes no
+locks. When instrumentation is not installed, the DLL calls are not wrapped at
+all, and there is no overhead.
+
+# #########################################################################
+'''
+
+import json
+import threading
+import time
+
+
+if hasattr(time, 'perf_counter_ns'):
+	_now_ns = time.perf_counter_ns
+else:
+	def _now_ns():
+		return int(time.perf_counter() * 1e9)
+
+
+class LatencyHistogram(object):
+	'''
+	Fixed-memory histogram of durations in nanoseconds.
+
+	Values below ``2 ** (SUB_BUCKET_BITS + 1)`` ns are counted exactly. Above that, every
+	power-of-two range is split into ``2 ** SUB_BUCKET_BITS`` linear sub-buckets, so every
+	recorded value is accurate to within ``1 / 2 ** SUB_BUCKET_BITS`` (about 6%), in the same
+	manner as an HDR histogram. Values over ``2 ** MAX_MAGNITUDE`` ns (about 18 minutes)
+	are counted in the last bucket.
+	'''
+
+	SUB_BUCKET_BITS  = 4
+	SUB_BUCKET_COUNT = 2 ** SUB_BUCKET_BITS
+	MAX_MAGNITUDE    = 40
+	BUCKET_COUNT     = (MAX_MAGNITUDE - SUB_BUCKET_BITS + 1) * SUB_BUCKET_COUNT
+
+	__slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.counts = [0] * self.BUCKET_COUNT
+		self.count  = 0
+		self.total  = 0
+		self.min    = None
+		self.max    = 0
+
+	@classmethod
+	def bucket_index(cls, value):
+		shift = value.bit_length() - (cls.SUB_BUCKET_BITS + 1)
+		if shift <= 0:
+			return value
+		idx = (shift << cls.SUB_BUCKET_BITS) + (value >> shift)
+		return min(idx, cls.BUCKET_COUNT - 1)
+
+	@classmethod
+	def bucket_bounds(cls, idx):
+		'''
+		Returns:
+			2-tuple of the ``(lowest, highest)`` value (inclusive) counted in bucket ``idx``.
+		'''
+		if idx < 2 * cls.SUB_BUCKET_COUNT:
+			return idx, idx
+		shift = (idx >> cls.SUB_BUCKET_BITS) - 1
+		lower = (idx - (shift << cls.SUB_BUCKET_BITS)) << shift
+		return lower, lower + (1 << shift) - 1
+
+	def record(self, value):
+		self.counts[self.bucket_index(value)] += 1
+		self.count += 1
+		self.total += value
+		if value > self.max:
+			self.max = value
+		if self.min is None or value < self.min:
+			self.min = value
+
+	def merge(self, other):
+		for idx, cnt in enumerate(other.counts):
+			if cnt:
+				self.counts[idx] += cnt
+		self.count += other.count
+		self.total += other.total
+		self.max    = max(self.max, other.max)
+		if other.min is not None and (self.min is None or other.min < self.min):
+			self.min = other.min
+
+	def percentile(self, pct):
+		'''
+		Get the value at percentile ``pct`` (0-100), as the highest value of the
+		bucket containing it. Returns ``None`` if the histogram is empty.
+		'''
+		if not self.count:
+			return None
+		target = max(1, int(round(self.count * pct / 100.0)))
+		seen = 0
+		for idx, cnt in enumerate(self.counts):
+			seen += cnt
+			if seen >= target:
+				return min(self.bucket_bounds(idx)[1], self.max)
+		return self.max
+
+
+class CallInstrumentation(object):
+	'''
+	Call counts and latency histograms for every function called through a
+	:class:`~avmu.dll_loader.TaskBinding`.
+
+	Install with ``binding.add_wrapper('latency', instrumentation.wrap)``. Normally this is
+	done with :func:`~avmu.avmu_library.AvmuInterface.enableCallInstrumentation()`.
+
+	Args:
+		labels (dict): Extra labels attached to every exported series (e.g. the unit's IP).
+	'''
+
+	PERCENTILES = (50, 90, 99, 99.9)
+
+	# Bucket bounds (in seconds) used for the Prometheus export.
+	PROMETHEUS_BUCKETS = (
+		1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+		1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+	)
+
+	def __init__(self, labels=None):
+		self.labels   = dict(labels or {})
+		self.__local  = threading.local()
+		self.__lock   = threading.Lock()
+		self.__tables = []
+
+	def __get_table(self):
+		table = getattr(self.__local, 'table', None)
+		if table is None:
+			table = {}
+			self.__local.table = table
+			with self.__lock:
+				self.__tables.append(table)
+		return table
+
+	def __get_histogram(self, name):
+		table = self.__get_table()
+		hist = table.get(name)
+		if hist is None:
+			hist = LatencyHistogram()
+			table[name] = hist
+		return hist
+
+	def wrap(self, name, func):
+		'''
+		:class:`~avmu.dll_loader.TaskBinding` wrapper that times every call to ``func``.
+		'''
+		local = self.__local
+		get_histogram = self.__get_histogram
+		def timed(*args):
+			start = _now_ns()
+			ret = func(*args)
+			elapsed = _now_ns() - start
+			table = getattr(local, 'table', None)
+			hist = table.get(name) if table is not None else None
+			if hist is None:
+				hist = get_histogram(name)
+			hist.record(elapsed)
+			return ret
+		return timed
+
+	def reset(self):
+		'''
+		Zero every histogram.
+		'''
+		with self.__lock:
+			tables = list(self.__tables)
+		for table in tables:
+			for hist in list(table.values()):
+				hist.reset()
+
+	def histograms(self):
+		'''
+		Get every function's histogram, merged across threads.
+
+		Returns:
+			dict of ``function name -> LatencyHistogram``.
+		'''
+		with self.__lock:
+			tables = list(self.__tables)
+		ret = {}
+		for table in tables:
+			for name, hist in list(table.items()):
+				if name not in ret:
+					ret[name] = LatencyHistogram()
+				ret[name].merge(hist)
+		return ret
+
+	def snapshot(self, include_buckets=False):
+		'''
+		Get the call statistics as plain python types.
+
+		Args:
+			include_buckets (bool): If True, include the non-empty histogram buckets.
+
+		Returns:
+			A dict with ``labels``, and ``functions``, a dict mapping each function name to a
+			dict of ``count``, ``total_s``, ``mean_s``, ``min_s``, ``max_s``, and ``p50_s``,
+			``p90_s``, ``p99_s`` and ``p99.9_s``. If ``include_buckets`` is set, ``buckets`` is
+			a list of ``[lowest_ns, highest_ns, count]`` lists.
+		'''
+		functions = {}
+		for name, hist in sorted(self.histograms().items()):
+			if not hist.count:
+				continue
+			entry = {
+				'count'   : hist.count,
+				'total_s' : hist.total / 1e9,
+				'mean_s'  : hist.total / hist.count / 1e9,
+				'min_s'   : hist.min / 1e9,
+				'max_s'   : hist.max / 1e9,
+			}
+			for pct in self.PERCENTILES:
+				entry['p%s_s' % (pct, )] = hist.percentile(pct) / 1e9
+			if include_buckets:
+				entry['buckets'] = [list(hist.bucket_bounds(idx)) + [cnt] for idx, cnt in enumerate(hist.counts) if cnt]
+			functions[name] = entry
+
+		return {
+			'labels'    : dict(self.labels),
+			'functions' : functions,
+		}
+
+	def toJson(self, include_buckets=True, **kwargs):
+		'''
+		Serialize :func:`snapshot()` to a JSON string. Extra keyword arguments are passed to ``json.dumps()``.
+		'''
+		return json.dumps(self.snapshot(include_buckets=include_buckets), **kwargs)
+
+	def toPrometheus(self, metric='avmu_dll_call_duration_seconds'):
+		'''
+		Render the histograms in the Prometheus text exposition format.
+
+		Each function is exported as a histogram series labelled with ``function``, plus
+		``labels``. The bucket bounds are those in ``PROMETHEUS_BUCKETS``, and are
+		accurate to the resolution of the underlying histogram.
+
+		Returns:
+			The exposition text, as a string.
+		'''
+		def fmt_labels(extra):
+			items = sorted(self.labels.items()) + extra
+			return ",".join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in items)
+
+		lines = [
+			"# HELP %s Duration of AVMU DLL calls." % (metric, ),
+			"# TYPE %s histogram" % (metric, ),
+		]
+		for name, hist in sorted(self.histograms().items()):
+			if not hist.count:
+				continue
+			bounds = [int(tmp * 1e9) for tmp in self.PROMETHEUS_BUCKETS]
+			cumulative = [0] * len(bounds)
+			for idx, cnt in enumerate(hist.counts):
+				if not cnt:
+					continue
+				highest = hist.bucket_bounds(idx)[1]
+				for b_idx, bound in enumerate(bounds):
+					if highest <= bound:
+						cumulative[b_idx] += cnt
+						break
+			running = 0
+			for bound_s, cnt in zip(self.PROMETHEUS_BUCKETS, cumulative):
+				running += cnt
+				lines.append('%s_bucket{%s} %s' % (metric, fmt_labels([('function', name), ('le', repr(bound_s))]), running))
+			lines.append('%s_bucket{%s} %s' % (metric, fmt_labels([('function', name), ('le', '+Inf')]), hist.count))
+			lines.append('%s_sum{%s} %s' % (metric, fmt_labels([('function', name)]), repr(hist.total / 1e9)))
+			lines.append('%s_count{%s} %s' % (metric, fmt_labels([('function', name)]), hist.count))
+
+		return "\n".join(lines) + "\n"
@@ -0,0 +1,277 @@
+'''
+# #########################################################################
+
+Hot-swappable sweep profiles.
+
+Changing the hop rate or frequency plan of a task needs ``stop()``, the new
+configuration, and ``start()``, which recomputes the sweep program. A
+:class:`ProfileSet` instead builds one :class:`~avmu.avmu_library.AvmuInterface`
+per profile, all sharing one unit through ``createSharedTask()``, configures and
+starts every one of them up front, and then switches between them with as few
+state transitions as possible::
+
+	profiles = ProfileSet("192.168.1.223", 1027, {
+			'wide' : {'start_mhz' : 250,  'stop_mhz' : 2100, 'points' : 1024, 'hop_rate' : 'HOP_45K',
+			          'paths' : [("AVMU_TX_PATH_0", "AVMU_RX_PATH_1")]},
+			'fine' : {'start_mhz' : 1000, 'stop_mhz' : 1200, 'points' : 256,  'hop_rate' : 'HOP_90K',
+			          'paths' : [("AVMU_TX_PATH_0", "AVMU_RX_PATH_1")]},
+		})
+	profiles.build()
+	profiles.activate('wide')
+	frame = profiles.active.measureBatch(16)
+	latency = profiles.activate('fine')
+
+# #########################################################################
+'''
+
+import collections
+import logging
+import time
+
+from . import avmu_library
+from . import instrumentation
+
+
+PROFILE_KEYS = frozenset(['start_mhz', 'stop_mhz', 'points', 'hop_rate', 'paths', 'exclusion_bands', 'receivers'])
+
+
+class ProfileSet(object):
+	'''
+	A set of pre-configured sweep profiles on one AVMU, with fast switching between them.
+
+	Each profile is a dict with the keys:
+
+		- ``start_mhz``, ``stop_mhz``, ``points``  The linear sweep (see
+		  :func:`~avmu.avmu_library.AvmuInterface.utilGenerateLinearSweep()`).
+		- ``hop_rate``                           Hop rate name, e.g. ``HOP_45K``.
+		- ``paths``                              List of ``(tx_path, rx_path)`` names to measure.
+		- ``exclusion_bands``                    Optional list of ``(start_mhz, stop_mhz)`` bands.
+		- ``receivers``                          Optional list of receivers to enable.
+
+	Every profile's task is started by :func:`build()`, so its sweep program is computed
+	once, and kept. :func:`activate()` then only halts the outgoing profile (in
+	``PROG_ASYNC`` mode) and begins the incoming one. A profile whose task has been
+	stopped (e.g. by error recovery) is restarted when it is activated.
+
+	If the unit only retains the most recently started program, pass ``reprogram=True``,
+	and the incoming profile is restarted on every switch. That still skips reconfiguring
+	the task, but is not gapless.
+
+	Args:
+		ip_address (str): IP address of the unit.
+		ip_port (int): Local IP port to use.
+		profiles (dict): Profile name -> profile dict. An ``OrderedDict`` keeps the build order.
+		measurement_type (str): ``PROG_ASYNC`` or ``PROG_SYNC``, for every profile.
+		timeout_ms (int): Socket timeout for every task.
+		sweep_plan_cache (SweepPlanCache): Optional :class:`~avmu.sweep_cache.SweepPlanCache`
+		                                   set on every task.
+		reprogram (bool): Restart the incoming profile's task on every switch.
+		debug (bool): Passed through to each :class:`~avmu.avmu_library.AvmuInterface`.
+	'''
+
+	def __init__(self, ip_address, ip_port, profiles, measurement_type='PROG_ASYNC', timeout_ms=500,
+				sweep_plan_cache=None, reprogram=False, debug=False):
+		self.log = logging.getLogger("Main.Dll.Profiles")
+
+		assert profiles, "A profile set needs at least one profile!"
+		for name, profile in profiles.items():
+			missing = set(['start_mhz', 'stop_mhz', 'points', 'hop_rate', 'paths']) - set(profile)
+			assert not missing, "Profile '%s' is missing the key(s) %s" % (name, sorted(missing))
+			unknown = set(profile) - PROFILE_KEYS
+			assert not unknown, "Profile '%s' has unknown key(s) %s" % (name, sorted(unknown))
+
+		self.ip_address       = ip_address
+		self.ip_port          = ip_port
+		self.profiles         = collections.OrderedDict(profiles)
+		self.measurement_type = measurement_type
+		self.timeout_ms       = timeout_ms
+		self.sweep_plan_cache = sweep_plan_cache
+		self.reprogram        = reprogram
+		self.debug            = debug
+
+		# Every task after the first shares the first one's communication object.
+		self.interfaces = collections.OrderedDict()
+		for name in self.profiles:
+			share = next(iter(self.interfaces.values())) if self.interfaces else None
+			self.interfaces[name] = avmu_library.AvmuInterface(share_from_interface=share, debug=debug)
+
+		self.active_name = None
+		self.__built     = False
+
+		# (from, to) -> LatencyHistogram of activate() durations, in nanoseconds.
+		self.__switch_latency = collections.OrderedDict()
+		self.__switch_count   = 0
+		self.last_switch      = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	@property
+	def active(self):
+		'''
+		The :class:`~avmu.avmu_library.AvmuInterface` of the active profile, or ``None``.
+		'''
+		if self.active_name is None:
+			return None
+		return self.interfaces[self.active_name]
+
+	def __configure(self, name, interface):
+		profile = self.profiles[name]
+		interface.setIPAddress(self.ip_address)
+		interface.setIPPort(self.ip_port)
+		interface.setTimeout(self.timeout_ms)
+		interface.setMeasurementType(self.measurement_type)
+		interface.initialize()
+
+		if self.sweep_plan_cache is not None:
+			interface.setSweepPlanCache(self.sweep_plan_cache)
+
+		interface.setHopRate(profile['hop_rate'])
+		interface.clearExclusionBands()
+		for start_mhz, stop_mhz in profile.get('exclusion_bands', ()):
+			interface.addExclusionBand(start_mhz, stop_mhz)
+		interface.utilGenerateLinearSweep(startF_mhz=profile['start_mhz'], stopF_mhz=profile['stop_mhz'], points=profile['points'])
+		if 'receivers' in profile:
+			interface.setEnabledReceivers(profile['receivers'])
+
+		interface.clearMeasuredPaths()
+		for tx_path, rx_path in profile['paths']:
+			interface.addPathToMeasure(tx_path, rx_path)
+
+	def build(self):
+		'''
+		Initialize, configure and start the task for every profile, so each profile's
+		sweep program is computed. No profile is active afterwards.
+
+		Raises:
+			The first exception raised while configuring any profile.
+		'''
+		for name, interface in self.interfaces.items():
+			self.log.info("Building profile '%s'", name)
+			self.__configure(name, interface)
+			interface.start()
+			self.log.info("Profile '%s' frame time: %0.6f s", name, interface.getPreciseTimePerFrame())
+		self.__built = True
+
+	def activate(self, name):
+		'''
+		Make ``name`` the active profile.
+
+		The outgoing profile is halted (``haltAsync()``, in ``PROG_ASYNC`` mode), and left in
+		the started state with its program intact. The incoming profile is started if it is not
+		(or always, with ``reprogram``), and begun (``beginAsync()``, in ``PROG_ASYNC`` mode).
+		Activating the already-active profile does nothing, and is not counted as a switch.
+
+		Args:
+			name (str): Profile name.
+
+		Returns:
+			The time the switch took, in seconds.
+		'''
+		assert self.__built, "The profile set must be built before a profile can be activated!"
+		assert name in self.interfaces, "Unknown profile '%s'. Available: %s" % (name, list(self.interfaces.keys()))
+
+		if name == self.active_name:
+			return 0.0
+
+		start = time.perf_counter()
+		transitions = []
+		outgoing = self.active
+		if outgoing is not None and outgoing.getState() == 'TASK_RUNNING':
+			outgoing.haltAsync()
+			transitions.append('haltAsync')
+
+		incoming = self.interfaces[name]
+		state = incoming.getState()
+		if state == 'TASK_RUNNING':
+			incoming.haltAsync()
+			transitions.append('haltAsync')
+			state = 'TASK_STARTED'
+		if self.reprogram and state == 'TASK_STARTED':
+			incoming.stop()
+			transitions.append('stop')
+			state = 'TASK_STOPPED'
+		if state != 'TASK_STARTED':
+			incoming.start()
+			transitions.append('start')
+		if self.measurement_type == 'PROG_ASYNC':
+			incoming.beginAsync()
+			transitions.append('beginAsync')
+
+		elapsed = int((time.perf_counter() - start) * 1e9)
+
+		key = (self.active_name, name)
+		if key not in self.__switch_latency:
+			self.__switch_latency[key] = instrumentation.LatencyHistogram()
+		self.__switch_latency[key].record(elapsed)
+		self.__switch_count += 1
+		self.last_switch = {
+			'from'        : self.active_name,
+			'to'          : name,
+			'latency_s'   : elapsed / 1e9,
+			'transitions' : transitions,
+		}
+		self.log.debug("Switched profile %s -> %s in %0.3f ms (%s)", self.active_name, name, elapsed / 1e6, ", ".join(transitions))
+		self.active_name = name
+		return elapsed / 1e9
+
+	def getFrameTime(self, name=None):
+		'''
+		Get the frame time of profile ``name`` (default: the active profile), in seconds.
+		'''
+		return self.interfaces[name or self.active_name].getPreciseTimePerFrame()
+
+	def getSwitchStatistics(self):
+		'''
+		Get the measured :func:`activate()` latencies.
+
+		Returns:
+			A dict with ``count``, ``last`` (the details of the most recent switch: ``from``,
+			``to``, ``latency_s`` and the ``transitions`` made), and ``switches``, a dict mapping
+			each ``"from -> to"`` pair to a dict of ``count``, ``mean_s``, ``min_s``, ``max_s``,
+			``p50_s`` and ``p99_s``.
+		'''
+		switches = collections.OrderedDict()
+		for (src, dst), hist in self.__switch_latency.items():
+			if not hist.count:
+				continue
+			switches["%s -> %s" % (src, dst)] = {
+				'count'  : hist.count,
+				'mean_s' : hist.total / hist.count / 1e9,
+				'min_s'  : hist.min / 1e9,
+				'max_s'  : hist.max / 1e9,
+				'p50_s'  : hist.percentile(50) / 1e9,
+				'p99_s'  : hist.percentile(99) / 1e9,
+			}
+		return {
+			'count'    : self.__switch_count,
+			'last'     : self.last_switch,
+			'switches' : switches,
+		}
+
+	def stop(self):
+		'''
+		Halt (if running) and stop every profile's task. The profile set has to be rebuilt
+		(or the profiles restarted by activating them) to continue.
+		'''
+		for name, interface in self.interfaces.items():
+			state = interface.getState()
+			if state == 'TASK_RUNNING':
+				interface.haltAsync()
+				state = 'TASK_STARTED'
+			if state == 'TASK_STARTED':
+				interface.stop()
+		self.active_name = None
+
+	def close(self):
+		'''
+		Stop every profile's task, and release the interfaces.
+		'''
+		try:
+			self.stop()
+		finally:
+			self.interfaces.clear()
+			self.__built = False
@@ -0,0 +1,747 @@
+'''
+# #########################################################################
+
+Chunked, append-only on-disk sweep recorder.
+
+A :class:`SweepRecorder` streams frames (in the layout returned by
+:func:`~avmu.avmu_library.AvmuInterface.allocateFrameBuffer()`) to disk from a
+background writer thread, so long captures are bounded by disk space rather
+than memory::
+
+	with avmu.recorder.SweepRecorder("capture", avmu.recorder.sweep_plan(device), dtype=np.complex64) as rec:
+		with avmu.AvmuStream(device) as stream:
+			for data, meta in stream:
+				rec.append(data, meta)
+
+A recording is a series of segment files, ``<path>.00000.avseg``,
+``<path>.00001.avseg``, etc. Each segment starts with a header:
+
+	- ``SEGMENT_MAGIC`` (8 bytes)
+	- The length of the JSON sweep plan (``uint32``, little endian)
+	- The JSON sweep plan (see :func:`sweep_plan()`), plus the storage ``dtype``,
+	  frame ``shape``, metadata dtype ``meta_descr``, ``segment`` number and the
+	  index of the segment's ``first_frame``.
+	- Zero padding to ``SEGMENT_HEADER_ALIGN`` bytes.
+
+followed by any number of chunks, each of which is:
+
+	- A ``CHUNK_HEADER_DTYPE`` record (``CHUNK_MAGIC``, frame count, data and metadata
+	  byte counts, and the time the chunk was written).
+	- The raw frame data, as a C-ordered ``(frames, paths, receivers, points)`` array.
+	- The raw metadata records, as a ``(frames, paths)`` array.
+	- Zero padding to ``CHUNK_ALIGN`` bytes.
+
+As chunks are only ever appended, a segment that was cut short (e.g. by a crash)
+is readable up to its last complete chunk.
+
+:class:`RecordingReader` memory-maps a recording for random access by frame range,
+time window, path and receiver.
+
+# #########################################################################
+'''
+
+import json
+import logging
+import numbers
+import os
+import queue
+import struct
+import threading
+import time
+
+import numpy as np
+
+
+SEGMENT_MAGIC         = b"AVMUSEG1"
+CHUNK_MAGIC           = b"AVCK"
+SEGMENT_HEADER_ALIGN  = 4096
+CHUNK_ALIGN           = 64
+SEGMENT_SUFFIX        = ".avseg"
+
+CHUNK_HEADER_DTYPE = np.dtype([
+	('magic',      'S4'),
+	('frames',     '<u4'),
+	('data_bytes', '<u8'),
+	('meta_bytes', '<u8'),
+	('time',       '<f8'),
+])
+
+STORAGE_DTYPES = (np.complex64, np.complex128)
+
+
+def segment_path(path, index):
+	'''
+	Returns:
+		The file name of segment ``index`` of the recording at ``path``.
+	'''
+	return "%s.%05d%s" % (path, index, SEGMENT_SUFFIX)
+
+
+def sweep_plan(interface, **extra):
+	'''
+	Build the sweep plan stored in each segment header from a configured interface.
+
+	Args:
+		interface (AvmuInterface): Configured (and started, so the frame time is known) interface.
+		**extra: Additional JSON-serializable values to store in the plan.
+
+	Returns:
+		A dict with the keys ``freqs``, ``paths``, ``tx_port_names``, ``rx_port_names``,
+		``receivers``, ``meta_descr``, ``frame_time``, ``hop_rate``, ``measurement_type``,
+		``avmu_ip``, ``avmu_port``, ``serial_number`` and ``extra``.
+	'''
+	lut    = interface.getMetadataLookupTable()
+	config = interface.getTaskConfiguration()
+	return {
+		'freqs'            : list(interface.getFrequencies()),
+		'paths'            : [list(tmp) for tmp in lut['paths']],
+		'tx_port_names'    : {str(key) : value for key, value in lut['tx_port_names'].items()},
+		'rx_port_names'    : {str(key) : value for key, value in lut['rx_port_names'].items()},
+		'receivers'        : list(lut['receivers']),
+		'meta_descr'       : np.lib.format.dtype_to_descr(lut['dtype']),
+		'frame_time'       : interface.getPreciseTimePerFrame(),
+		'hop_rate'         : config['hop_rate'],
+		'measurement_type' : config['measurement_type'],
+		'avmu_ip'          : lut['avmu_ip'],
+		'avmu_port'        : lut['avmu_port'],
+		'serial_number'    : interface.getHardwareDetails()['serial_number'],
+		'extra'            : extra,
+	}
+
+
+def descr_to_dtype(descr):
+	'''
+	Convert a ``meta_descr`` value read back from JSON into a numpy dtype.
+	'''
+	def fix(item):
+		if isinstance(item, list):
+			return tuple(fix(tmp) for tmp in item)
+		return item
+	if isinstance(descr, list):
+		return np.dtype([fix(tmp) for tmp in descr])
+	return np.dtype(descr)
+
+
+class SweepRecorder(object):
+	'''
+	Write frames to a chunked, append-only segment container from a background thread.
+
+	:func:`append()` copies each frame into the storage dtype (which is also the
+	only copy made, so ``append()`` can be given reused buffers such as those from an
+	:class:`~avmu.streaming.AvmuStream`), and queues it for the writer thread. The
+	writer gathers queued frames into chunks of about ``chunk_bytes`` (or however many
+	frames arrive within ``chunk_interval`` seconds), and writes
+	them through a ``write_buffer`` sized file buffer, so the disk sees a few large
+	sequential writes rather than one small write per frame.
+
+	A new segment is started once the current one would exceed ``segment_bytes``, or
+	has been open for ``segment_seconds``.
+
+	Args:
+		path (str): Base path of the recording. Segment files are named with :func:`segment_path()`.
+		plan (dict): Sweep plan, from :func:`sweep_plan()`. Must contain ``freqs``, ``paths``,
+		             ``receivers`` and ``meta_descr``.
+		dtype (numpy dtype): Storage dtype, ``np.complex64`` or ``np.complex128``. ``complex64``
+		                     halves the disk bandwidth and space, at the cost of precision
+		                     (about 7 significant digits).
+		segment_bytes (int): Maximum segment size, or None for no limit.
+		segment_seconds (float): Maximum segment duration, or None for no limit.
+		chunk_bytes (int): Target chunk size.
+		chunk_interval (float): Maximum time to wait for a chunk to fill before writing it.
+		                        Larger chunks are read back with fewer copies by
+		                        :class:`RecordingReader`.
+		queue_frames (int): Maximum number of :func:`append()` calls (frames or batches) waiting for the writer.
+		block (bool): If True, :func:`append()` waits when the queue is full. Otherwise the
+		              frames are dropped, and counted in ``frames_dropped``.
+		write_buffer (int): Size of the file write buffer.
+	'''
+
+	def __init__(self, path, plan, dtype=np.complex128, segment_bytes=2 ** 30, segment_seconds=None,
+				chunk_bytes=8 * 2 ** 20, chunk_interval=0.5, queue_frames=1024, block=True, write_buffer=16 * 2 ** 20):
+		dtype = np.dtype(dtype)
+		assert dtype in [np.dtype(tmp) for tmp in STORAGE_DTYPES], "Invalid storage dtype: '%s'" % (dtype, )
+		assert queue_frames > 0, "The queue must hold at least one frame!"
+		for key in ('freqs', 'paths', 'receivers', 'meta_descr'):
+			assert key in plan, "Sweep plan is missing the '%s' key!" % (key, )
+
+		self.log = logging.getLogger("Main.Dll.Recorder")
+
+		self.path            = path
+		self.plan            = dict(plan)
+		self.dtype           = dtype
+		self.meta_dtype      = descr_to_dtype(plan['meta_descr'])
+		self.shape           = (len(plan['paths']), len(plan['receivers']), len(plan['freqs']))
+		self.segment_bytes   = segment_bytes
+		self.segment_seconds = segment_seconds
+		self.chunk_bytes     = chunk_bytes
+		self.chunk_interval  = chunk_interval
+		self.block           = block
+		self.write_buffer    = write_buffer
+
+		self.__frame_bytes = int(np.prod(self.shape)) * dtype.itemsize + self.shape[0] * self.meta_dtype.itemsize
+
+		self.__queue  = queue.Queue(maxsize=queue_frames)
+		self.__error  = None
+		self.__closed = False
+
+		self.__fp             = None
+		self.__segment        = -1
+		self.__segment_size   = 0
+		self.__segment_chunks = 0
+		self.__segment_start  = None
+
+		self.__stats = {
+			'frames_queued'    : 0,
+			'frames_written'   : 0,
+			'frames_dropped'   : 0,
+			'bytes_written'    : 0,
+			'chunks_written'   : 0,
+			'segments'         : 0,
+			'queue_high_water' : 0,
+			'write_time'       : 0.0,
+		}
+		self.__started_at = time.time()
+
+		self.__thread = threading.Thread(target=self.__writer, name="AvmuSweepRecorder")
+		self.__thread.daemon = True
+		self.__thread.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+	def append(self, data, meta):
+		'''
+		Queue one frame (``data`` of shape ``(paths, receivers, points)``, ``meta`` of shape
+		``(paths, )``), or a batch of frames (with a leading ``frames`` axis on both) for writing.
+
+		Returns:
+			The number of frames queued (0 if they were dropped).
+
+		Raises:
+			Any exception raised by the writer thread (e.g. an ``OSError`` if the disk is full).
+		'''
+		if self.__error is not None:
+			raise self.__error
+		assert not self.__closed, "Recorder has been closed!"
+
+		data = np.asarray(data)
+		meta = np.asarray(meta)
+		if data.ndim == 3:
+			data = data[np.newaxis]
+			meta = meta[np.newaxis]
+		assert data.shape[1:] == self.shape, "Frame shape %s does not match the sweep plan %s!" % (data.shape[1:], self.shape)
+		assert meta.shape == data.shape[:2], "Metadata shape %s does not match the data %s!" % (meta.shape, data.shape[:2])
+
+		# The storage conversion is also the copy that lets callers reuse their buffers.
+		item = (data.astype(self.dtype, order='C'), np.array(meta, dtype=self.meta_dtype, order='C'))
+		frames = data.shape[0]
+		try:
+			self.__queue.put(item, block=self.block)
+		except queue.Full:
+			self.__stats['frames_dropped'] += frames
+			return 0
+
+		self.__stats['frames_queued'] += frames
+		depth = self.__queue.qsize()
+		if depth > self.__stats['queue_high_water']:
+			self.__stats['queue_high_water'] = depth
+		return frames
+
+	def __open_segment(self):
+		if self.__fp is not None:
+			self.__fp.close()
+		self.__segment += 1
+		self.__stats['segments'] += 1
+
+		header = dict(self.plan)
+		header.update({
+			'format'      : 1,
+			'created'     : time.time(),
+			'dtype'       : self.dtype.name,
+			'shape'       : list(self.shape),
+			'segment'     : self.__segment,
+			'first_frame' : self.__stats['frames_written'],
+		})
+		blob = json.dumps(header, default=str).encode("utf-8")
+		head = SEGMENT_MAGIC + struct.pack("<I", len(blob)) + blob
+		head += b"\0" * (-len(head) % SEGMENT_HEADER_ALIGN)
+
+		fname = segment_path(self.path, self.__segment)
+		self.__fp = open(fname, "wb", buffering=self.write_buffer)
+		self.__fp.write(head)
+		self.__segment_size   = len(head)
+		self.__segment_chunks = 0
+		self.__segment_start  = time.time()
+		self.log.info("Opened recording segment %s", fname)
+
+	def __needs_rotation(self, chunk_size):
+		if self.__fp is None:
+			return True
+		if not self.__segment_chunks:
+			return False
+		if self.segment_bytes and self.__segment_size + chunk_size > self.segment_bytes:
+			return True
+		if self.segment_seconds and time.time() - self.__segment_start >= self.segment_seconds:
+			return True
+		return False
+
+	def __write_chunk(self, items):
+		frames     = sum(tmp[0].shape[0] for tmp in items)
+		data_bytes = sum(tmp[0].nbytes for tmp in items)
+		meta_bytes = sum(tmp[1].nbytes for tmp in items)
+		chunk_size = CHUNK_HEADER_DTYPE.itemsize + data_bytes + meta_bytes
+		padding    = -chunk_size % CHUNK_ALIGN
+
+		if self.__needs_rotation(chunk_size + padding):
+			self.__open_segment()
+
+		start = time.perf_counter()
+		header = np.array([(CHUNK_MAGIC, frames, data_bytes, meta_bytes, time.time())], dtype=CHUNK_HEADER_DTYPE)
+		fp = self.__fp
+		fp.write(header.tobytes())
+		for data, dummy_meta in items:
+			fp.write(memoryview(data.reshape(-1).view(np.uint8)))
+		for dummy_data, meta in items:
+			fp.write(memoryview(meta.reshape(-1).view(np.uint8)))
+		if padding:
+			fp.write(b"\0" * padding)
+
+		self.__segment_size   += chunk_size + padding
+		self.__segment_chunks += 1
+		stats = self.__stats
+		stats['write_time']     += time.perf_counter() - start
+		stats['frames_written'] += frames
+		stats['bytes_written']  += chunk_size + padding
+		stats['chunks_written'] += 1
+
+	def __writer(self):
+		finished = False
+		try:
+			while not finished:
+				try:
+					item = self.__queue.get(timeout=0.25)
+				except queue.Empty:
+					continue
+				if item is None:
+					break
+
+				# Gather frames up to the chunk size, or for at most chunk_interval seconds.
+				items    = [item]
+				size     = item[0].nbytes + item[1].nbytes
+				deadline = time.time() + self.chunk_interval
+				while size < self.chunk_bytes:
+					try:
+						item = self.__queue.get(timeout=max(deadline - time.time(), 0))
+					except queue.Empty:
+						break
+					if item is None:
+						finished = True
+						break
+					items.append(item)
+					size += item[0].nbytes + item[1].nbytes
+
+				self.__write_chunk(items)
+
+		except Exception as e:
+			self.log.error("Recorder writer failed: %s", e)
+			self.__error = e
+			# Keep draining the queue so a blocked append() can see the error.
+			while True:
+				try:
+					if self.__queue.get(timeout=0.25) is None:
+						break
+				except queue.Empty:
+					if self.__closed:
+						break
+		finally:
+			if self.__fp is not None:
+				self.__fp.close()
+				self.__fp = None
+
+	def close(self):
+		'''
+		Write every queued frame, and close the current segment.
+
+		Raises:
+			Any exception raised by the writer thread.
+		'''
+		if not self.__closed:
+			self.__closed = True
+			self.__queue.put(None)
+			self.__thread.join()
+		if self.__error is not None:
+			raise self.__error
+
+	def getSegmentPaths(self):
+		'''
+		Returns:
+			List of the segment file paths written so far.
+		'''
+		return [segment_path(self.path, idx) for idx in range(self.__segment + 1)]
+
+	def getStatistics(self):
+		'''
+		Returns:
+			A dict containing:
+
+				- ``frames_queued``     Frames accepted by :func:`append()`.
+				- ``frames_written``    Frames written to disk.
+				- ``frames_dropped``    Frames dropped because the queue was full (only if ``block`` is False).
+				- ``bytes_written``     Bytes written, excluding segment headers.
+				- ``chunks_written``    Number of chunks written.
+				- ``segments``          Number of segments opened.
+				- ``queue_depth``       Items currently waiting for the writer.
+				- ``queue_high_water``  Highest observed ``queue_depth``.
+				- ``write_time``        Seconds the writer spent writing.
+				- ``write_rate``        ``bytes_written / write_time``, in bytes per second.
+				- ``frame_bytes``       Bytes per frame, including metadata.
+				- ``elapsed``           Seconds since the recorder was created.
+		'''
+		ret = dict(self.__stats)
+		ret['queue_depth'] = self.__queue.qsize()
+		ret['write_rate']  = ret['bytes_written'] / ret['write_time'] if ret['write_time'] else None
+		ret['frame_bytes'] = self.__frame_bytes
+		ret['elapsed']     = time.time() - self.__started_at
+		return ret
+
+
+class RecordingReader(object):
+	'''
+	Random access to a recording written by :class:`SweepRecorder`.
+
+	Every segment is memory-mapped, and only the chunk headers are read on open, to
+	build an index of ``frame -> (segment, chunk, offset)``. Reads return numpy views
+	of the mapped files, so only the pages covering the requested frames, paths and
+	receivers are ever loaded from disk. A read that spans more than one chunk is
+	returned as a copy of just the requested frames.
+
+	The index (and the frame time axis, once built) is cached in ``<path>.avidx``, and
+	rebuilt automatically if the segment files have changed size (e.g. if the recording
+	was still being written).
+
+	Paths can be given as an index into the plan's ``paths`` list, or as a
+	``(tx_port, rx_port)`` tuple of either port numbers or ``addPathToMeasure()``-style
+	port names. Receivers are given as receiver numbers, as in ``getEnabledReceivers()``.
+
+	Args:
+		path (str): Base path passed to :class:`SweepRecorder`, or a single segment file.
+		use_index_cache (bool): Load and save the index cache file.
+	'''
+
+	INDEX_SUFFIX = ".avidx"
+
+	def __init__(self, path, use_index_cache=True):
+		self.log = logging.getLogger("Main.Dll.Recorder")
+
+		if path.endswith(SEGMENT_SUFFIX):
+			self.segments = [path]
+			self.path     = path[:-len(SEGMENT_SUFFIX)]
+		else:
+			self.segments = []
+			while os.path.exists(segment_path(path, len(self.segments))):
+				self.segments.append(segment_path(path, len(self.segments)))
+			self.path = path
+		if not self.segments:
+			raise IOError("No recording segments found for '%s'!" % (path, ))
+
+		self.__maps    = []
+		self.__headers = []
+		for fname in self.segments:
+			mapped = np.memmap(fname, dtype=np.uint8, mode='r')
+			self.__headers.append(self.__read_header(fname, mapped))
+			self.__maps.append(mapped)
+
+		self.plan       = self.__headers[0]
+		self.dtype      = np.dtype(self.plan['dtype'])
+		self.shape      = tuple(self.plan['shape'])
+		self.meta_dtype = descr_to_dtype(self.plan['meta_descr'])
+		self.frame_time = self.plan.get('frame_time') or None
+		for header in self.__headers[1:]:
+			assert tuple(header['shape']) == self.shape and header['dtype'] == self.plan['dtype'], \
+				"Segment %s has a different layout to the first segment!" % (header['segment'], )
+
+		self.__index_path = self.path + self.INDEX_SUFFIX
+		self.__use_cache  = use_index_cache
+		self.__times      = None
+		if not (use_index_cache and self.__load_index()):
+			self.__build_index()
+			self.__save_index()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+		return False
+
+	def __len__(self):
+		return self.frame_count
+
+	@staticmethod
+	def __read_header(fname, mapped):
+		if bytes(mapped[:len(SEGMENT_MAGIC)]) != SEGMENT_MAGIC:
+			raise IOError("'%s' is not a recording segment!" % (fname, ))
+		start  = len(SEGMENT_MAGIC) + 4
+		length = struct.unpack("<I", bytes(mapped[len(SEGMENT_MAGIC):start]))[0]
+		header = json.loads(bytes(mapped[start:start + length]).decode("utf-8"))
+		end    = start + length
+		header['data_start'] = end + (-end % SEGMENT_HEADER_ALIGN)
+		return header
+
+	#################################################################################
+	#        Index
+	#################################################################################
+
+	def __segment_sizes(self):
+		return np.array([mapped.shape[0] for mapped in self.__maps], dtype=np.int64)
+
+	def __build_index(self):
+		segment, offset, frames, times = [], [], [], []
+		hsize = CHUNK_HEADER_DTYPE.itemsize
+		for seg_idx, mapped in enumerate(self.__maps):
+			pos  = self.__headers[seg_idx]['data_start']
+			size = mapped.shape[0]
+			while pos + hsize <= size:
+				header = mapped[pos:pos + hsize].view(CHUNK_HEADER_DTYPE)[0]
+				end = pos + hsize + int(header['data_bytes']) + int(header['meta_bytes'])
+				if header['magic'] != CHUNK_MAGIC or end > size:
+					self.log.warning("Segment %s is truncated at byte %s", self.segments[seg_idx], pos)
+					break
+				segment.append(seg_idx)
+				offset.append(pos + hsize)
+				frames.append(int(header['frames']))
+				times.append(float(header['time']))
+				pos = end + (-(end - pos) % CHUNK_ALIGN)
+
+		self.chunk_segment = np.array(segment, dtype=np.int32)
+		self.chunk_offset  = np.array(offset,  dtype=np.int64)
+		self.chunk_frames  = np.array(frames,  dtype=np.int64)
+		self.chunk_time    = np.array(times,   dtype=np.float64)
+		self.__finish_index()
+
+	def __finish_index(self):
+		self.chunk_first = np.zeros(self.chunk_frames.shape[0] + 1, dtype=np.int64)
+		np.cumsum(self.chunk_frames, out=self.chunk_first[1:])
+		self.frame_count = int(self.chunk_first[-1])
+
+	def __load_index(self):
+		try:
+			with np.load(self.__index_path) as cached:
+				if not np.array_equal(cached['segment_sizes'], self.__segment_sizes()):
+					return False
+				self.chunk_segment = cached['chunk_segment']
+				self.chunk_offset  = cached['chunk_offset']
+				self.chunk_frames  = cached['chunk_frames']
+				self.chunk_time    = cached['chunk_time']
+				# Index caches written before restarts were handled stored 'times', which is ignored.
+				if 'frame_times' in cached.files:
+					self.__times = cached['frame_times']
+		except (IOError, OSError, KeyError, ValueError):
+			return False
+		self.__finish_index()
+		return True
+
+	def __save_index(self):
+		if not self.__use_cache:
+			return
+		arrays = {
+			'segment_sizes' : self.__segment_sizes(),
+			'chunk_segment' : self.chunk_segment,
+			'chunk_offset'  : self.chunk_offset,
+			'chunk_frames'  : self.chunk_frames,
+			'chunk_time'    : self.chunk_time,
+		}
+		if self.__times is not None:
+			arrays['frame_times'] = self.__times
+		try:
+			with open(self.__index_path, "wb") as fp:
+				np.savez(fp, **arrays)
+		except (IOError, OSError) as e:
+			self.log.warning("Could not write index cache %s: %s", self.__index_path, e)
+
+	def locate(self, frame):
+		'''
+		Find a frame on disk.
+
+		Returns:
+			3-tuple of ``(segment path, byte offset of the frame's data, chunk index)``.
+		'''
+		if frame < 0:
+			frame += self.frame_count
+		if not 0 <= frame < self.frame_count:
+			raise IndexError("Frame %s out of range (%s frames)" % (frame, self.frame_count))
+		chunk = int(np.searchsorted(self.chunk_first, frame, side='right')) - 1
+		frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+		offset = int(self.chunk_offset[chunk]) + (frame - int(self.chunk_first[chunk])) * frame_bytes
+		return self.segments[self.chunk_segment[chunk]], offset, chunk
+
+	#################################################################################
+	#        Time axis
+	#################################################################################
+
+	def frameTimes(self):
+		'''
+		Get the acquisition time of every frame, in seconds relative to the first frame.
+
+		Times are derived from the ``frame_num`` counter of each frame's first path
+		(unwrapped, so frames dropped during the capture leave gaps in the time axis),
+		multiplied by the plan's ``frame_time``. If the plan has no frame time, the
+		frame counter itself is returned. A counter that steps backwards (the unit
+		restarted mid-capture) is counted as a single frame step, not a wrap.
+
+		Returns:
+			float64 numpy array of length ``len(reader)``.
+		'''
+		if self.__times is None:
+			counters = np.empty(self.frame_count, dtype=np.int64)
+			for chunk in range(self.chunk_frames.shape[0]):
+				dummy_data, meta = self.__chunk_views(chunk)
+				counters[self.chunk_first[chunk]:self.chunk_first[chunk + 1]] = meta[:, 0]['frame_num']
+			if counters.shape[0]:
+				steps = np.diff(counters) % (2 ** 32)
+				steps[steps >= 2 ** 31] = 1
+				counters[0] = 0
+				np.cumsum(steps, out=counters[1:])
+			self.__times = counters * (self.frame_time or 1.0)
+			self.__save_index()
+		return self.__times
+
+	def frameAtTime(self, seconds):
+		'''
+		Returns:
+			Index of the first frame acquired at or after ``seconds`` (see :func:`frameTimes()`).
+		'''
+		return int(np.searchsorted(self.frameTimes(), seconds, side='left'))
+
+	#################################################################################
+	#        Reads
+	#################################################################################
+
+	def __chunk_views(self, chunk):
+		mapped = self.__maps[self.chunk_segment[chunk]]
+		frames = int(self.chunk_frames[chunk])
+		start  = int(self.chunk_offset[chunk])
+		data_end = start + frames * int(np.prod(self.shape)) * self.dtype.itemsize
+		meta_end = data_end + frames * self.shape[0] * self.meta_dtype.itemsize
+		data = mapped[start:data_end].view(self.dtype).reshape((frames, ) + self.shape)
+		meta = mapped[data_end:meta_end].view(self.meta_dtype).reshape(frames, self.shape[0])
+		return data, meta
+
+	def pathIndex(self, path):
+		'''
+		Resolve a path (see the class description) to its index on the ``paths`` axis.
+		'''
+		if isinstance(path, numbers.Integral):
+			assert 0 <= path < self.shape[0], "Path index %s out of range!" % (path, )
+			return int(path)
+		tx_port, rx_port = path
+		tx_names = {value : int(key) for key, value in self.plan.get('tx_port_names', {}).items()}
+		rx_names = {value : int(key) for key, value in self.plan.get('rx_port_names', {}).items()}
+		tx_port = tx_names.get(tx_port, tx_port)
+		rx_port = rx_names.get(rx_port, rx_port)
+		for idx, entry in enumerate(self.plan['paths']):
+			if entry[2] == tx_port and entry[3] == rx_port:
+				return idx
+		raise KeyError("Path %s is not in the recording!" % (path, ))
+
+	def receiverIndex(self, receiver):
+		'''
+		Resolve a receiver number to its index on the ``receivers`` axis.
+		'''
+		try:
+			return self.plan['receivers'].index(receiver)
+		except ValueError:
+			raise KeyError("Receiver %s is not in the recording!" % (receiver, ))
+
+	def iterChunks(self, start=0, stop=None, path=None, receiver=None):
+		'''
+		Iterate over the frames in ``[start, stop)`` as zero-copy views, one piece per chunk.
+
+		Yields:
+			3-tuples of ``(first frame index, data, meta)``. Indexing of ``data`` and ``meta``
+			is as for :func:`read()`.
+		'''
+		start, stop, dummy_step = slice(start, stop).indices(self.frame_count)
+		if start >= stop:
+			return
+		path_idx = self.pathIndex(path) if path is not None else None
+		rx_idx   = self.receiverIndex(receiver) if receiver is not None else None
+
+		chunk = int(np.searchsorted(self.chunk_first, start, side='right')) - 1
+		while chunk < self.chunk_frames.shape[0] and self.chunk_first[chunk] < stop:
+			first = int(self.chunk_first[chunk])
+			lo = max(start - first, 0)
+			hi = min(stop - first, int(self.chunk_frames[chunk]))
+			data, meta = self.__chunk_views(chunk)
+			data = data[lo:hi]
+			meta = meta[lo:hi]
+			if path_idx is not None:
+				data = data[:, path_idx]
+				meta = meta[:, path_idx]
+				if rx_idx is not None:
+					data = data[:, rx_idx]
+			elif rx_idx is not None:
+				data = data[:, :, rx_idx]
+			yield first + lo, data, meta
+			chunk += 1
+
+	def read(self, start=0, stop=None, path=None, receiver=None):
+		'''
+		Read frames ``[start, stop)`` (negative indices count from the end).
+
+		Args:
+			start (int): First frame.
+			stop (int): End frame (exclusive), or None for the end of the recording.
+			path: If specified, only return this path, and drop the ``paths`` axis.
+			receiver (int): If specified, only return this receiver, and drop the ``receivers`` axis.
+
+		Returns:
+			2-tuple of ``(data, meta)``. ``data`` has the shape ``(frames, paths, receivers, points)``,
+			and ``meta`` ``(frames, paths)``, less any axes dropped by ``path`` and ``receiver``.
+			These are read-only views of the mapped file if the frames are in a single chunk,
+			otherwise copies.
+		'''
+		pieces = list(self.iterChunks(start, stop, path, receiver))
+		if len(pieces) == 1:
+			return pieces[0][1], pieces[0][2]
+		if not pieces:
+			data, meta = self.__empty(path, receiver)
+			return data, meta
+		return np.concatenate([tmp[1] for tmp in pieces]), np.concatenate([tmp[2] for tmp in pieces])
+
+	def readTime(self, start_s, stop_s, path=None, receiver=None):
+		'''
+		Read the frames acquired in ``[start_s, stop_s)``, in seconds relative to the first
+		frame (see :func:`frameTimes()`). Other arguments and return values are as for :func:`read()`.
+		'''
+		return self.read(self.frameAtTime(start_s), self.frameAtTime(stop_s), path, receiver)
+
+	def __empty(self, path, receiver):
+		shape = list(self.shape)
+		meta_shape = [0, self.shape[0]]
+		if path is not None:
+			shape.pop(0)
+			meta_shape.pop(1)
+			if receiver is not None:
+				shape.pop(0)
+		elif receiver is not None:
+			shape.pop(1)
+		return np.zeros([0] + shape, dtype=self.dtype), np.zeros(meta_shape, dtype=self.meta_dtype)
+
+	def getFrequencies(self):
+		'''
+		Returns:
+			The recorded frequency list, as a numpy array (MHz).
+		'''
+		return np.array(self.plan['freqs'])
+
+	def close(self):
+		'''
+		Release the memory maps. Views returned by previous reads remain valid until
+		they are garbage collected.
+		'''
+		self.__maps = []
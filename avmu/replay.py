@@ -0,0 +1,505 @@
+'''
+# #########################################################################
+
+Session recording, and a backend that replays recorded sessions.
+
+A :class:`SessionRecorder` is installed on an interface with
+:func:`~avmu.avmu_library.AvmuInterface.startRecording()`, and writes every
+DLL call the task makes to a file: ``measure()`` calls with their timing and
+return code, the full contents of every ``extractSweepData()`` result, every
+other call with its arguments, and a snapshot of the task configuration
+(hardware details, frequencies, frame time, paths) whenever the task is
+initialized or started.
+
+:class:`ReplayAvmuDll` serves a recording back in place of the DLL. It is
+selected with ``dll_loader.select_backend("replay", path="session.avmurec")``.
+The application configures the task as it normally would, and ``measure()``
+and ``extractSweepData()`` then return the recorded frames, return codes
+included, either at their original pacing or as fast as possible::
+
+	avmu.dll_loader.select_backend("replay", path="field.avmurec", pacing="fast")
+	device = avmu.AvmuInterface()
+	... # Identical configuration to the recorded session.
+
+The file is a stream of pickled event tuples, so a recording can be cut short
+at any point (e.g. by a crash) and still be read back up to that point. Events
+are pickled and written by a background thread, so recording adds only a copy
+of each sweep to the acquisition thread.
+
+# #########################################################################
+'''
+
+import logging
+import pickle
+import queue
+import threading
+import time
+
+import numpy as np
+
+from . import sim_backend
+
+
+# Version 2 records return codes by name. Version 1 recorded the raw integers.
+RECORDING_FORMAT_VERSION = 2
+
+# Python 3.4 is still supported, so stick to a protocol it can read.
+PICKLE_PROTOCOL = 4
+
+SWEEP_META_FIELDS = (
+	'shaft_encoder_left',
+	'shaft_encoder_right',
+	'serial_data_age',
+	'timestamp_ticks',
+	'timestamp_seconds',
+	'packet_num',
+	'sweep_number',
+	'frame_num',
+)
+
+
+def read_session(path):
+	'''
+	Iterate over the events in a recording, in the order they were recorded.
+
+	Events are tuples, whose first item is the event type:
+
+		- ``('header', info)``
+		- ``('config', time, config)``           Task configuration snapshot (see :func:`~avmu.avmu_library.AvmuInterface.startRecording()`).
+		- ``('call', time, name, args, ret)``    Any call other than ``measure()`` and ``extractSweepData()``.
+		                                         ``ret`` is the error name for calls that return an error code.
+		- ``('measure', start, end, ret)``       ``ret`` is the error name, e.g. ``'ERR_OK'``.
+		- ``('sweep', time, tx_path, rx_path, ret, data, meta)``  ``data`` is a complex array of shape
+		  ``(receivers, points)``, and ``meta`` a dict of the ``SweepDataStruct`` metadata fields,
+		  plus ``serial_data_bytes``. Both are None if the call failed.
+
+	Times are in seconds, relative to the start of the recording.
+
+	Args:
+		path (str): Recording file path.
+	'''
+	with open(path, "rb") as fp:
+		while True:
+			try:
+				yield pickle.load(fp)
+			except EOFError:
+				return
+
+
+class SessionRecorder(object):
+	'''
+	:class:`~avmu.dll_loader.TaskBinding` wrapper that writes every call made by a task to a file.
+
+	Normally created with :func:`~avmu.avmu_library.AvmuInterface.startRecording()`.
+
+	Args:
+		path (str): Output file path. Existing files are overwritten.
+		ffi (FFI): The interface's FFI instance.
+		err_ok (int): The DLL's ``ERR_OK`` code.
+		err_names (dict): Error code -> name mapping. Return codes are recorded by name, as the
+		                  values of the codes are not fixed across DLL builds (or backends).
+		tx_names (dict): TX path enum -> name mapping.
+		rx_names (dict): RX path enum -> name mapping.
+		config_func (callable): Called without arguments to get the task configuration
+		                        snapshot. DLL calls it makes are not recorded.
+		info (dict): Extra values to store in the recording header.
+		queue_events (int): Maximum number of events waiting for the writer thread. Recording
+		                    calls wait when the queue is full, rather than lose events.
+	'''
+
+	# Successful calls after which the task configuration is snapshotted again.
+	CONFIG_CALLS = frozenset(['initialize', 'start'])
+
+	def __init__(self, path, ffi, err_ok, err_names, tx_names, rx_names, config_func, info=None, queue_events=65536):
+		self.log = logging.getLogger("Main.Dll.Recorder")
+
+		self.path        = path
+		self.ffi         = ffi
+		self.err_ok      = err_ok
+		self.err_names   = err_names
+		self.tx_names    = tx_names
+		self.rx_names    = rx_names
+		self.config_func = config_func
+
+		self.frames = 0
+		self.sweeps = 0
+
+		self.__fp      = open(path, "wb")
+		self.__queue   = queue.Queue(maxsize=queue_events)
+		self.__error   = None
+		self.__closed  = False
+		self.__local   = threading.local()
+		self.__t0      = time.perf_counter()
+		self.__dirty   = True
+		self.__npts    = 0
+		self.__nrx     = 0
+		self.__serial  = 0
+
+		header = {
+			'format'  : RECORDING_FORMAT_VERSION,
+			'created' : time.time(),
+		}
+		header.update(info or {})
+		self.__write(('header', header))
+
+		self.__thread = threading.Thread(target=self.__writer, name="AvmuSessionRecorder")
+		self.__thread.daemon = True
+		self.__thread.start()
+
+	def __now(self):
+		return time.perf_counter() - self.__t0
+
+	def __write(self, event):
+		# Events are pickled on the writer thread. After a write error, they are discarded.
+		if self.__closed or self.__error is not None:
+			return
+		self.__queue.put(event)
+
+	def __writer(self):
+		fp = self.__fp
+		try:
+			while True:
+				event = self.__queue.get()
+				if event is None:
+					break
+				pickle.dump(event, fp, protocol=PICKLE_PROTOCOL)
+		except Exception as e:
+			self.log.error("Recording %s failed: %s", self.path, e)
+			self.__error = e
+			# Keep draining the queue so a blocked recording call can see the error.
+			while self.__queue.get() is not None:
+				pass
+		finally:
+			try:
+				fp.close()
+			except Exception as e:
+				# Closing flushes the file, so it can fail too.
+				self.__error = self.__error or e
+
+	def recordConfig(self):
+		'''
+		Snapshot the task configuration into the recording.
+		'''
+		self.__local.suspended = True
+		try:
+			config = self.config_func()
+		finally:
+			self.__local.suspended = False
+
+		self.__npts   = len(config.get('freqs', ()))
+		self.__nrx    = len(config.get('receivers', ()))
+		self.__serial = config.get('serial_buf_sz', 0)
+		self.__dirty  = False
+		self.__write(('config', self.__now(), config))
+
+	def __convert_arg(self, arg):
+		if arg is None or isinstance(arg, (int, float, bool, bytes, str)):
+			return arg
+		if isinstance(arg, self.ffi.CData):
+			return repr(arg)
+		return arg
+
+	def wrap(self, name, func):
+		'''
+		:class:`~avmu.dll_loader.TaskBinding` wrapper that records every call to ``func``.
+		'''
+		local = self.__local
+		now   = self.__now
+		write = self.__write
+		err   = self.err_names.get
+
+		if name == 'measure':
+			def recorded(*args):
+				if self.__dirty and not getattr(local, 'suspended', False):
+					self.recordConfig()
+				start = now()
+				ret = func(*args)
+				write(('measure', start, now(), err(ret, ret)))
+				self.frames += 1
+				return ret
+
+		elif name == 'extractSweepData':
+			def recorded(sdat, tx_path, rx_path, *args):
+				ret = func(sdat, tx_path, rx_path, *args)
+				if getattr(local, 'suspended', False):
+					return ret
+				data = meta = None
+				if ret == self.err_ok:
+					data, meta = self.__copy_sweep(sdat)
+				write(('sweep', now(), self.tx_names.get(tx_path, tx_path), self.rx_names.get(rx_path, rx_path), err(ret, ret), data, meta))
+				self.sweeps += 1
+				return ret
+
+		else:
+			convert = self.__convert_arg
+			# Only calls that return an error code have their return value named.
+			named = not name.startswith(("get", "is"))
+			def recorded(*args):
+				ret = func(*args)
+				if getattr(local, 'suspended', False):
+					return ret
+				write(('call', now(), name, [convert(tmp) for tmp in args[1:]], err(ret, ret) if named else convert(ret)))
+				if name in self.CONFIG_CALLS and ret == self.err_ok:
+					self.__dirty = True
+				return ret
+
+		return recorded
+
+	def __copy_sweep(self, sdat):
+		npts   = self.__npts
+		data   = np.empty((self.__nrx, npts), dtype=np.complex128)
+		nbytes = npts * 8
+		for rx_idx in range(self.__nrx):
+			data[rx_idx].real = np.frombuffer(self.ffi.buffer(sdat.points.I[rx_idx], nbytes), dtype=np.float64)
+			data[rx_idx].imag = np.frombuffer(self.ffi.buffer(sdat.points.Q[rx_idx], nbytes), dtype=np.float64)
+
+		meta = {key : getattr(sdat, key) for key in SWEEP_META_FIELDS}
+		if self.__serial and sdat.serial_data_bytes != self.ffi.NULL:
+			meta['serial_data_bytes'] = bytes(self.ffi.buffer(sdat.serial_data_bytes, self.__serial))
+		else:
+			meta['serial_data_bytes'] = b""
+		return data, meta
+
+	def close(self):
+		'''
+		Write every queued event, and close the recording file.
+
+		Raises:
+			Any exception raised by the writer thread (e.g. an ``OSError`` if the disk is full).
+		'''
+		if not self.__closed:
+			self.__closed = True
+			self.__queue.put(None)
+			self.__thread.join()
+			self.log.info("Recording %s closed (%s frames, %s sweeps)", self.path, self.frames, self.sweeps)
+		if self.__error is not None:
+			raise self.__error
+
+
+class _ReplayState(object):
+	def __init__(self, path):
+		self.path      = path
+		self.reader    = read_session(path)
+		self.pending   = None
+		self.config    = None
+		self.base_wall = None
+		self.base_rec  = None
+		self.finished  = False
+
+
+class ReplayAvmuDll(sim_backend.SimulatedAvmuDll):
+	'''
+	Backend that replays sessions recorded with :class:`SessionRecorder`.
+
+	Configuration calls are handled by the :class:`~avmu.sim_backend.SimulatedAvmuDll`
+	state machine, with the unit's hardware details, and (on ``start()``) the frequency
+	list and frame time, taken from the recording. ``measure()`` and ``extractSweepData()``
+	then serve the recorded frames in order. The application should configure the same
+	paths and receivers as the recorded session, as only recorded paths can be extracted.
+
+	Args:
+		ffi (FFI): ``FFI`` instance with the AVMU header ``cdef()``-ed.
+		path (str): Recording replayed by every task, unless listed in ``recordings``.
+		recordings (dict): IP address -> recording path, for replaying several units.
+		pacing (str): ``original`` to return each frame at the same point (relative to the first frame)
+		              that it was acquired in the recording, or ``fast`` to return frames as fast
+		              as they are requested.
+		loop (bool): Restart from the beginning of the recording once it runs out. Otherwise,
+		             ``measure()`` returns ``ERR_NO_RESPONSE`` once the recording is exhausted.
+	'''
+
+	def __init__(self, ffi, path=None, recordings=None, pacing='original', loop=False):
+		assert pacing in ('original', 'fast'), "Invalid pacing: '%s'" % (pacing, )
+		assert path or recordings, "A recording path is required!"
+		super(ReplayAvmuDll, self).__init__(ffi)
+		self.log = logging.getLogger("Main.Dll.Replay")
+
+		self._version    = ffi.new("char[]", b"AVMU Replay Backend 1.0")
+		self._path       = path
+		self._recordings = dict(recordings or {})
+		self._pacing     = pacing
+		self._loop       = loop
+		self._tx_names   = {getattr(self, name) : name for name in dir(self) if name.startswith("AVMU_TX_PATH_")}
+		self._rx_names   = {getattr(self, name) : name for name in dir(self) if name.startswith("AVMU_RX_PATH_")}
+
+	def _read_hardware(self, path):
+		# A recording started before initialize() opens with a snapshot of
+		# an uninitialized task, whose hardware details are all zero.
+		for event in read_session(path):
+			if event[0] != 'config':
+				continue
+			config   = event[2]
+			hardware = config.get('hardware')
+			if config.get('state') == 'TASK_UNINITIALIZED' or not hardware:
+				continue
+			if hardware.get('serial_number') and hardware.get('maximum_points'):
+				return hardware
+		return None
+
+	def initialize(self, t, callback, user):
+		task = self._task(t)
+		if task is not None and task.state == 'TASK_UNINITIALIZED' and task.ip is not None:
+			path = self._recordings.get(task.ip, self._path)
+			if path is None:
+				self.log.error("No recording for unit at %s", task.ip)
+				return self.ERR_NO_RESPONSE
+			hardware = self._read_hardware(path)
+			if hardware:
+				flags = hardware.get('feature_flags', {})
+				self.add_unit(task.ip, sim_backend.SimulatedUnit(
+						serial_number     = hardware['serial_number'],
+						minimum_frequency = hardware['minimum_frequency'],
+						maximum_frequency = hardware['maximum_frequency'],
+						maximum_points    = hardware['maximum_points'],
+						switch_board_type = hardware['switch_board_type'],
+						has_encoders      = flags.get('has_encoders', True),
+						has_serial_port   = flags.get('has_serial_port', True),
+					))
+			task.replay = _ReplayState(path)
+		return super(ReplayAvmuDll, self).initialize(t, callback, user)
+
+	def _error_code(self, ret):
+		# Recorded error names map to this backend's own codes. Format 1
+		# recordings hold the recording DLL's integers, which are used as-is.
+		if isinstance(ret, str):
+			return getattr(self, ret)
+		return ret
+
+	def _next_event(self, replay):
+		try:
+			return next(replay.reader)
+		except StopIteration:
+			if not self._loop:
+				return None
+			self.log.info("Recording %s finished. Restarting.", replay.path)
+			replay.reader    = read_session(replay.path)
+			replay.base_wall = None
+			try:
+				return next(replay.reader)
+			except StopIteration:
+				return None
+
+	def _advance_to_measure(self, task):
+		'''
+		Read forward to the next ``measure`` event, applying any configuration
+		snapshots along the way.
+		'''
+		replay = task.replay
+		while replay.pending is None:
+			event = self._next_event(replay)
+			if event is None:
+				replay.finished = True
+				return None
+			if event[0] == 'measure':
+				replay.pending = event
+			elif event[0] == 'config':
+				self._apply_config(task, event[2])
+		return replay.pending
+
+	def _apply_config(self, task, config):
+		task.replay.config = config
+		if task.state not in ('TASK_STARTED', 'TASK_RUNNING'):
+			return
+		freqs = config.get('freqs')
+		if freqs:
+			if len(freqs) != task.freqs.shape[0]:
+				self.log.warning("Recorded sweep has %s points, but %s are configured.", len(freqs), task.freqs.shape[0])
+			task.freqs = np.array(freqs, dtype=np.float64)
+		frame_time = config.get('frame_time')
+		if frame_time and frame_time > 0:
+			task.frame_time = frame_time
+
+	def start(self, t):
+		ret = super(ReplayAvmuDll, self).start(t)
+		task = self._task(t)
+		if ret == self.ERR_OK and getattr(task, 'replay', None) is not None:
+			task.replay.base_wall = None
+			self._advance_to_measure(task)
+			if task.replay.config:
+				self._apply_config(task, task.replay.config)
+		return ret
+
+	def beginAsync(self, t):
+		ret = super(ReplayAvmuDll, self).beginAsync(t)
+		task = self._task(t)
+		if ret == self.ERR_OK and getattr(task, 'replay', None) is not None:
+			task.replay.base_wall = None
+		return ret
+
+	def measure(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if not task.paths:
+			return self.ERR_NO_PATHS_MEASURED
+		required = 'TASK_STARTED' if task.prog_type == 'PROG_SYNC' else 'TASK_RUNNING'
+		if task.state != required:
+			return self.ERR_WRONG_STATE
+		replay = getattr(task, 'replay', None)
+		if replay is None:
+			return self.ERR_NO_RESPONSE
+
+		event = self._advance_to_measure(task)
+		if event is None:
+			return self.ERR_NO_RESPONSE
+		dummy_type, dummy_start, rec_end, ret = event
+		ret = self._error_code(ret)
+
+		if self._pacing == 'original':
+			now = time.perf_counter()
+			if replay.base_wall is None:
+				replay.base_wall = now
+				replay.base_rec  = rec_end
+			if self._wait(task, replay.base_wall + (rec_end - replay.base_rec) - now):
+				return self.ERR_INTERRUPTED
+
+		# Consume the measure, and the sweeps extracted after it.
+		replay.pending = None
+		frame = {}
+		while replay.pending is None:
+			next_event = self._next_event(replay)
+			if next_event is None:
+				replay.finished = True
+				break
+			if next_event[0] == 'measure':
+				replay.pending = next_event
+			elif next_event[0] == 'sweep':
+				dummy_type, dummy_time, tx_name, rx_name, sweep_ret, data, meta = next_event
+				frame.setdefault((tx_name, rx_name), (self._error_code(sweep_ret), data, meta))
+			elif next_event[0] == 'config':
+				replay.config = next_event[2]
+
+		task.current_frame = frame if ret == self.ERR_OK else None
+		return ret
+
+	def extractSweepData(self, t, data, tx_path, rx_path):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if (tx_path, rx_path) not in task.paths:
+			return self.ERR_BAD_PATH
+		frame = task.current_frame
+		if frame is None:
+			return self.ERR_PATH_HAS_NO_DATA
+
+		key = (self._tx_names.get(tx_path), self._rx_names.get(rx_path))
+		if key not in frame:
+			return self.ERR_PATH_HAS_NO_DATA
+
+		sweep_ret, sweep_data, meta = frame[key]
+		if sweep_ret != self.ERR_OK:
+			return sweep_ret
+
+		nbytes = sweep_data.shape[1] * 8
+		for rx_idx in range(min(sweep_data.shape[0], self._receivers(task))):
+			self._ffi.memmove(data.points.I[rx_idx], np.ascontiguousarray(sweep_data[rx_idx].real).tobytes(), nbytes)
+			self._ffi.memmove(data.points.Q[rx_idx], np.ascontiguousarray(sweep_data[rx_idx].imag).tobytes(), nbytes)
+
+		for field in SWEEP_META_FIELDS:
+			setattr(data, field, meta[field])
+		serial = meta.get('serial_data_bytes', b"")
+		if serial and task.serial_enabled and task.serial_size and data.serial_data_bytes != self._ffi.NULL:
+			serial = serial[:task.serial_size]
+			self._ffi.memmove(data.serial_data_bytes, serial, len(serial))
+
+		return self.ERR_OK
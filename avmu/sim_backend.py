@@ -0,0 +1,942 @@
+'''
+# #########################################################################
+
+Simulated AVMU backend.
+
+This module implements the function and constant surface declared in
+``headers/avmu_header_agg.h`` in pure python, so the whole
+:class:`~avmu.avmu_library.AvmuInterface` API can be exercised without an
+AVMU (or the native DLL) present. It is selected by calling
+``dll_loader.select_backend("sim")``, or by setting the ``AVMU_BACKEND``
+environment variable to ``sim``, before the first interface is created.
+
+The simulation is intended for testing and benchmarking code that sits
+on top of the interface library. It models:
+
+ - The task state machine (``TASK_UNINITIALIZED`` -> ``TASK_STOPPED`` ->
+   ``TASK_STARTED`` -> ``TASK_RUNNING``), and returns ``ERR_WRONG_STATE``
+   in the same places the header documents.
+ - Frequency plans, with start/stop snapping to a fixed synthesizer grid.
+ - Frame timing derived from the hop rate, point count and path count, so
+   ``measure()`` blocks for roughly as long as the real hardware would.
+ - Socket buffer overruns in ``PROG_ASYNC`` mode. If the consumer falls behind
+   by more than the (simulated) receive buffer, the backlog is discarded,
+   ``measure()`` returns ``ERR_BYTES`` and the sweep numbers skip forward.
+ - A static scene of point scatterers per path, plus receiver noise.
+
+The I/Q data is plausible stepped-frequency radar data, not a model of
+any particular AVMU's RF behaviour.
+
+# #########################################################################
+'''
+
+import itertools
+import threading
+import time
+
+import numpy as np
+
+
+# Points per second for each hop rate.
+HOP_RATE_PTS_PER_SEC = {
+	'HOP_90K' : 90000,
+	'HOP_45K' : 45000,
+	'HOP_30K' : 30000,
+	'HOP_15K' : 15000,
+	'HOP_7K'  : 7000,
+	'HOP_3K'  : 3000,
+	'HOP_2K'  : 2000,
+	'HOP_1K'  : 1000,
+	'HOP_550' : 550,
+	'HOP_312' : 312,
+	'HOP_156' : 156,
+	'HOP_78'  : 78,
+	'HOP_39'  : 39,
+	'HOP_20'  : 20,
+}
+
+ERROR_NAMES = [
+	'ERR_OK',
+	'ERR_BAD_ATTEN',
+	'ERR_BAD_CAL',
+	'ERR_BAD_HANDLE',
+	'ERR_BAD_HOP',
+	'ERR_BAD_PATH',
+	'ERR_BAD_PROM',
+	'ERR_BYTES',
+	'ERR_EMPTY_PROM',
+	'ERR_FEATURE_NOT_PRESENT',
+	'ERR_FREQ_OUT_OF_BOUNDS',
+	'ERR_INTERRUPTED',
+	'ERR_MISSING_FREQS',
+	'ERR_MISSING_HOP',
+	'ERR_MISSING_IP',
+	'ERR_BAD_IP_PORT',
+	'ERR_MISSING_PORT',
+	'ERR_NO_PATHS_MEASURED',
+	'ERR_NO_RESPONSE',
+	'ERR_PATH_ALREADY_MEASURED',
+	'ERR_PROG_OVERFLOW',
+	'ERR_SOCKET',
+	'ERR_TOO_MANY_POINTS',
+	'ERR_UNKNOWN_FEATURE',
+	'ERR_WRONG_PROGRAM_TYPE',
+	'ERR_WRONG_STATE',
+	'ERR_MISSING_ATTEN',
+	'ERR_NO_ATTEN_PRESENT',
+	'ERR_TASK_ARRAY_INVALID',
+	'ERR_PATH_HAS_NO_DATA',
+	'ERR_INDEX_OUT_OF_BOUNDS',
+	'ERR_INVALID_PARAMETER',
+	'ERR_PROM_INVALID_FEATURE_CONFIGURATION',
+]
+
+HOP_NAMES = ['HOP_UNDEFINED'] + list(HOP_RATE_PTS_PER_SEC.keys())
+
+STATE_NAMES = ['TASK_UNINITIALIZED', 'TASK_STOPPED', 'TASK_STARTED', 'TASK_RUNNING']
+
+GAIN_NAMES = ['AVMU_GAIN_USE_DEFAULT'] + ['AVMU_GAIN_%s' % tmp for tmp in range(0, 48, 3)]
+
+# Serial clock of the sweep timer, per the header (32.768 MHz / 256)
+TIMESTAMP_TICK_HZ = 32.768e6 / 256
+
+# Synthesizer step size. Requested frequencies are snapped to this grid.
+FREQUENCY_RESOLUTION_MHZ = 0.0625
+
+# Fixed per-sweep overhead (switch settling, packet framing), in seconds.
+SWEEP_OVERHEAD_S = 50e-6
+
+# Simulated OS UDP receive buffer size, in bytes.
+SOCKET_BUFFER_BYTES = 4 * 1024 * 1024
+
+# Approximate wire size per sample (I + Q + framing).
+BYTES_PER_POINT = 12
+
+SWITCHBOARD_IDS = {
+	'NO_SWITCH_BOARD'         : 0,
+	'SIMPLE_4_PORT_SWITCH'    : 1,
+	'TDD_4_PORT_SWITCH'       : 2,
+	'SIMPLE_8_PORT_SWITCH'    : 3,
+	'S_PARAMETER_SWITCH'      : 4,
+	'MULTIPLE_RECEIVER_BOARD' : 5,
+}
+
+
+class SimulatedUnit(object):
+	'''
+	Description of a simulated AVMU. Everything here is what would normally
+	be read out of the unit's PROM during ``initialize()``.
+	'''
+	def __init__(self,
+				serial_number     = 1000,
+				minimum_frequency = 200,
+				maximum_frequency = 6000,
+				maximum_points    = 4096,
+				switch_board_type = 'SIMPLE_4_PORT_SWITCH',
+				has_encoders      = True,
+				has_serial_port   = True,
+				noise_level       = 1e-4,
+				scatterers        = ((0.8, 3.0), (0.3, 11.5), (0.05, 24.0)),
+			):
+		self.serial_number     = serial_number
+		self.minimum_frequency = minimum_frequency
+		self.maximum_frequency = maximum_frequency
+		self.maximum_points    = maximum_points
+		self.switch_board_type = switch_board_type
+		self.has_encoders      = has_encoders
+		self.has_serial_port   = has_serial_port
+		self.noise_level       = noise_level
+
+		# (amplitude, delay in nanoseconds) tuples
+		self.scatterers        = scatterers
+
+
+class _SimTask(object):
+	def __init__(self, handle_id, group):
+		self.handle_id        = handle_id
+		self.group            = group
+		self.state            = 'TASK_UNINITIALIZED'
+		self.ip               = None
+		self.ip_buf           = None
+		self.port             = 0
+		self.timeout          = 100
+		self.hop              = 'HOP_UNDEFINED'
+		self.prog_type        = 'PROG_SYNC'
+		self.freqs            = np.zeros(0, dtype=np.float64)
+		self.paths            = []
+		self.receiver_mask    = 1 << 1
+		self.if_gain          = 'AVMU_GAIN_USE_DEFAULT'
+		self.pad_12db         = False
+		self.sync_mode        = 'SYNC_IGNORE'
+		self.serial_enabled   = False
+		self.serial_size      = 0
+		self.encoders_enabled = False
+		self.exclusion_bands  = []
+		self.send_timer       = False
+		self.reset_frame_cnt  = True
+		self.unit             = None
+		self.details          = None
+
+		self.frame_time       = -1.0
+		self.frame_num        = 0
+		self.sweep_num        = 0
+		self.async_t0         = None
+		self.async_consumed   = 0
+		self.current_frame    = None
+		self.interrupt        = threading.Event()
+
+		self.scene            = None
+		self.noise_bank       = None
+		self.noise_idx        = 0
+
+
+class SimulatedAvmuDll(object):
+	'''
+	Drop-in replacement for the cffi ``dlopen()`` library object.
+
+	Constants are plain integer attributes, and each DLL function is a method
+	with the same name and argument order as the C declaration. ``ffi`` must be
+	an ``FFI`` instance with the AVMU header already ``cdef()``-ed, as it is
+	used to create and decode the handles and structs passed across the
+	interface.
+
+	Units are selected by IP address. Any IP that has not been explicitly
+	registered with :func:`add_unit` gets a default :class:`SimulatedUnit`.
+	'''
+
+	def __init__(self, ffi, units=None):
+		self._ffi        = ffi
+		self._lock       = threading.Lock()
+		self._tasks      = {}
+		self._handle_ids = itertools.count(1)
+		self._units      = dict(units) if units else {}
+		self._version    = ffi.new("char[]", b"AVMU Simulated Backend 1.0")
+		self._rng        = np.random.RandomState(0x4156)
+
+		for idx, name in enumerate(ERROR_NAMES):
+			setattr(self, name, idx)
+		for idx, name in enumerate(HOP_NAMES):
+			setattr(self, name, idx)
+		for idx, name in enumerate(STATE_NAMES):
+			setattr(self, name, idx)
+		for idx, name in enumerate(GAIN_NAMES):
+			setattr(self, name, idx)
+
+		self.PROG_ASYNC    = 0
+		self.PROG_SYNC     = 1
+		self.SYNC_IGNORE   = 0
+		self.SYNC_GENERATE = 1
+		self.SYNC_RECEIVE  = 2
+
+		for idx in range(9):
+			setattr(self, 'AVMU_TX_PATH_%s' % idx, idx)
+		for idx in range(8):
+			setattr(self, 'AVMU_RX_PATH_%s' % idx, idx)
+		self.AVMU_TX_PATH_NONE = 15
+		self.AVMU_RX_PATH_NONE = 15
+
+		for name, value in SWITCHBOARD_IDS.items():
+			setattr(self, 'SWITCHBOARD_' + name, value)
+
+		self._hop_lut   = {getattr(self, name) : name for name in HOP_NAMES}
+		self._state_lut = {name : getattr(self, name) for name in STATE_NAMES}
+
+	def add_unit(self, ip_address, unit):
+		'''
+		Register a :class:`SimulatedUnit` as the device answering at `ip_address`.
+		'''
+		self._units[ip_address] = unit
+
+	#################################################################################
+	#        Internals
+	#################################################################################
+
+	def _handle_key(self, t):
+		return int(self._ffi.cast("uintptr_t", t))
+
+	def _task(self, t):
+		return self._tasks.get(self._handle_key(t))
+
+	def _new_task(self, group):
+		handle_id = next(self._handle_ids)
+		task = _SimTask(handle_id, group)
+		with self._lock:
+			self._tasks[handle_id] = task
+		return self._ffi.cast("TaskHandle", handle_id)
+
+	def _snap(self, freq):
+		return round(freq / FREQUENCY_RESOLUTION_MHZ) * FREQUENCY_RESOLUTION_MHZ
+
+	def _fix_limits(self, task, start_f, stop_f, npts):
+		if npts > task.unit.maximum_points:
+			return self.ERR_TOO_MANY_POINTS, None, None
+		start_f = self._snap(start_f)
+		if npts <= 1 or start_f == stop_f:
+			stop_f = self._snap(stop_f)
+		else:
+			step = max(self._snap((stop_f - start_f) / (npts - 1)), FREQUENCY_RESOLUTION_MHZ)
+			stop_f = start_f + step * (npts - 1)
+		if (min(start_f, stop_f) < task.unit.minimum_frequency or
+				max(start_f, stop_f) > task.unit.maximum_frequency):
+			return self.ERR_FREQ_OUT_OF_BOUNDS, None, None
+		return self.ERR_OK, start_f, stop_f
+
+	def _receivers(self, task):
+		return bin(task.receiver_mask & 0x1F).count("1")
+
+	def _build_scene(self, task):
+		'''
+		Precompute the per-path frequency response of the simulated scene, and a
+		bank of receiver noise that is cycled through on each sweep.
+		'''
+		freqs_hz = task.freqs * 1e6
+		unit     = task.unit
+		scene    = {}
+		for path_idx, path in enumerate(task.paths):
+			resp = np.zeros(freqs_hz.shape[0], dtype=np.complex128)
+			for amplitude, delay_ns in unit.scatterers:
+				delay = (delay_ns + 0.35 * path_idx) * 1e-9
+				resp += amplitude * np.exp(-2j * np.pi * freqs_hz * delay)
+			scene[path] = resp
+		task.scene = scene
+
+		bank_sz = 64
+		task.noise_bank = (
+				self._rng.standard_normal((bank_sz, freqs_hz.shape[0])) +
+				1j * self._rng.standard_normal((bank_sz, freqs_hz.shape[0]))
+			) * unit.noise_level
+		task.noise_idx = 0
+
+	def _frame_bytes(self, task):
+		return task.freqs.shape[0] * len(task.paths) * self._receivers(task) * BYTES_PER_POINT
+
+	def _capture_frame(self, task, now):
+		task.current_frame = {
+			'frame_num'    : task.frame_num,
+			'sweep_base'   : task.sweep_num,
+			'timestamp'    : now,
+			'noise_idx'    : task.noise_idx,
+			'encoder'      : task.frame_num if task.encoders_enabled else 0,
+		}
+		task.frame_num += 1
+		task.sweep_num += len(task.paths)
+		task.noise_idx = (task.noise_idx + 1) % task.noise_bank.shape[0]
+
+	def _wait(self, task, delay):
+		if delay <= 0:
+			return False
+		interrupted = task.interrupt.wait(delay)
+		if interrupted:
+			task.interrupt.clear()
+		return interrupted
+
+	#################################################################################
+	#        Task lifecycle
+	#################################################################################
+
+	def versionString(self):
+		return self._version
+
+	def createTask(self):
+		return self._new_task(group=object())
+
+	def createSharedTask(self, share_from):
+		source = self._task(share_from)
+		group  = source.group if source else object()
+		return self._new_task(group=group)
+
+	def deleteTask(self, t):
+		with self._lock:
+			self._tasks.pop(self._handle_key(t), None)
+
+	def initialize(self, t, callback, user):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_UNINITIALIZED':
+			return self.ERR_WRONG_STATE
+		if task.ip is None:
+			return self.ERR_MISSING_IP
+		if not task.port:
+			return self.ERR_MISSING_PORT
+		task.unit = self._units.get(task.ip, None) or SimulatedUnit()
+		task.details = self._ffi.new("HardwareDetails *")
+		unit = task.unit
+		task.details.minimum_frequency = unit.minimum_frequency
+		task.details.maximum_frequency = unit.maximum_frequency
+		task.details.maximum_points    = unit.maximum_points
+		task.details.serial_number     = unit.serial_number
+		boundaries = [tmp for tmp in (1000, 2000, 3000, 4000) if unit.minimum_frequency < tmp < unit.maximum_frequency]
+		for idx, boundary in enumerate(boundaries):
+			task.details.band_boundaries[idx] = boundary
+		task.details.number_of_band_boundaries = len(boundaries)
+		task.details.swbd_type = SWITCHBOARD_IDS.get(unit.switch_board_type, 1)
+		task.details.hardware_features.has_encoders    = unit.has_encoders
+		task.details.hardware_features.has_serial_port = unit.has_serial_port
+		task.state = 'TASK_STOPPED'
+		return self.ERR_OK
+
+	def start(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_STOPPED':
+			return self.ERR_WRONG_STATE
+		if task.hop == 'HOP_UNDEFINED':
+			return self.ERR_MISSING_HOP
+		if not task.freqs.shape[0]:
+			return self.ERR_MISSING_FREQS
+		if task.freqs.shape[0] * max(len(task.paths), 1) > task.unit.maximum_points * 8:
+			return self.ERR_PROG_OVERFLOW
+
+		sweep_time = task.freqs.shape[0] / HOP_RATE_PTS_PER_SEC[task.hop] + SWEEP_OVERHEAD_S
+		task.frame_time = sweep_time * max(len(task.paths), 1)
+		if task.reset_frame_cnt:
+			task.frame_num = 0
+			task.sweep_num = 0
+		task.current_frame = None
+		self._build_scene(task)
+		task.state = 'TASK_STARTED'
+		return self.ERR_OK
+
+	def stop(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_STARTED':
+			return self.ERR_WRONG_STATE
+		task.state = 'TASK_STOPPED'
+		task.frame_time = -1.0
+		task.async_t0 = None
+		return self.ERR_OK
+
+	def getState(self, t):
+		task = self._task(t)
+		if task is None:
+			return -1
+		return self._state_lut[task.state]
+
+	#################################################################################
+	#        Configuration
+	#################################################################################
+
+	def setIPAddress(self, t, ipv4):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if ipv4 == self._ffi.NULL or ipv4 is None:
+			return self.ERR_MISSING_IP
+		if task.state not in ('TASK_UNINITIALIZED', 'TASK_STOPPED'):
+			return self.ERR_WRONG_STATE
+		if not isinstance(ipv4, bytes):
+			ipv4 = self._ffi.string(ipv4)
+		task.ip = ipv4.decode("ascii")
+		task.ip_buf = self._ffi.new("char[]", ipv4)
+		task.state = 'TASK_UNINITIALIZED'
+		return self.ERR_OK
+
+	def getIPAddress(self, t):
+		task = self._task(t)
+		if task is None or task.ip_buf is None:
+			return self._ffi.NULL
+		return task.ip_buf
+
+	def setIPPort(self, t, port):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state not in ('TASK_UNINITIALIZED', 'TASK_STOPPED'):
+			return self.ERR_WRONG_STATE
+		if port <= 1024 or port >= 65535:
+			return self.ERR_BAD_IP_PORT
+		task.port = port
+		task.state = 'TASK_UNINITIALIZED'
+		return self.ERR_OK
+
+	def getIPPort(self, t):
+		task = self._task(t)
+		return task.port if task else 0
+
+	def setTimeout(self, t, timeout):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		task.timeout = timeout
+		return self.ERR_OK
+
+	def getTimeout(self, t):
+		task = self._task(t)
+		return task.timeout if task else 0
+
+	def setHopRate(self, t, rate):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if rate not in self._hop_lut or self._hop_lut[rate] == 'HOP_UNDEFINED':
+			return self.ERR_BAD_HOP
+		if task.state not in ('TASK_UNINITIALIZED', 'TASK_STOPPED'):
+			return self.ERR_WRONG_STATE
+		task.hop = self._hop_lut[rate]
+		return self.ERR_OK
+
+	def getHopRate(self, t):
+		task = self._task(t)
+		return getattr(self, task.hop if task else 'HOP_UNDEFINED')
+
+	def setMeasurementType(self, t, prog_type):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if prog_type not in (self.PROG_ASYNC, self.PROG_SYNC):
+			return self.ERR_WRONG_PROGRAM_TYPE
+		if task.state not in ('TASK_UNINITIALIZED', 'TASK_STOPPED'):
+			return self.ERR_WRONG_STATE
+		task.prog_type = 'PROG_ASYNC' if prog_type == self.PROG_ASYNC else 'PROG_SYNC'
+		return self.ERR_OK
+
+	def getMeasurementType(self, t):
+		task = self._task(t)
+		return getattr(self, task.prog_type if task else 'PROG_SYNC')
+
+	def setFrequencies(self, t, freqs, npts):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_STOPPED':
+			return self.ERR_WRONG_STATE
+		if npts > task.unit.maximum_points:
+			return self.ERR_TOO_MANY_POINTS
+		arr = np.frombuffer(self._ffi.buffer(freqs, npts * 8), dtype=np.float64)
+		if npts and (arr.min() < task.unit.minimum_frequency or arr.max() > task.unit.maximum_frequency):
+			return self.ERR_FREQ_OUT_OF_BOUNDS
+		task.freqs = np.round(arr / FREQUENCY_RESOLUTION_MHZ) * FREQUENCY_RESOLUTION_MHZ
+		return self.ERR_OK
+
+	def getNumberOfFrequencies(self, t):
+		task = self._task(t)
+		return task.freqs.shape[0] if task else 0
+
+	def getFrequencies(self, t, freqs, freqs_sz):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		count = min(freqs_sz, task.freqs.shape[0])
+		if count:
+			self._ffi.memmove(freqs, task.freqs[:count].tobytes(), count * 8)
+		return self.ERR_OK
+
+	def utilNearestLegalFreq(self, t, freq):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state == 'TASK_UNINITIALIZED':
+			return self.ERR_WRONG_STATE
+		snapped = self._snap(freq[0])
+		if not task.unit.minimum_frequency <= snapped <= task.unit.maximum_frequency:
+			return self.ERR_FREQ_OUT_OF_BOUNDS
+		freq[0] = snapped
+		return self.ERR_OK
+
+	def utilFixLinearSweepLimits(self, t, startFreq, endFreq, npts):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state == 'TASK_UNINITIALIZED':
+			return self.ERR_WRONG_STATE
+		ret, start_f, stop_f = self._fix_limits(task, startFreq[0], endFreq[0], npts)
+		if ret == self.ERR_OK:
+			startFreq[0] = start_f
+			endFreq[0]   = stop_f
+		return ret
+
+	def utilGenerateLinearSweep(self, t, startFreq, endFreq, npts):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_STOPPED':
+			return self.ERR_WRONG_STATE
+		ret, start_f, stop_f = self._fix_limits(task, startFreq, endFreq, npts)
+		if ret != self.ERR_OK:
+			return ret
+		task.freqs = np.linspace(start_f, stop_f, npts)
+		return self.ERR_OK
+
+	def getPreciseTimePerFrame(self, t):
+		task = self._task(t)
+		if task is None or task.state not in ('TASK_STARTED', 'TASK_RUNNING'):
+			return -1.0
+		return task.frame_time
+
+	def getHardwareDetails(self, t):
+		task = self._task(t)
+		if task is None or task.details is None:
+			return self._ffi.new("HardwareDetails *")[0]
+		return task.details[0]
+
+	def addPathToMeasure(self, t, tx_path, rx_path):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		# Receive-only paths repeat in multi-unit schedules (one per remote transmit port).
+		if (tx_path, rx_path) in task.paths and tx_path != self.AVMU_TX_PATH_NONE:
+			return self.ERR_PATH_ALREADY_MEASURED
+		task.paths.append((tx_path, rx_path))
+		return self.ERR_OK
+
+	def clearMeasuredPaths(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		task.paths = []
+		return self.ERR_OK
+
+	def getMeasuredPathCount(self, t, measured_path_count):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		measured_path_count[0] = len(task.paths)
+		return self.ERR_OK
+
+	def getPathAtIndex(self, t, path_idx, tx_path, rx_path):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if not 0 <= path_idx < len(task.paths):
+			return self.ERR_INDEX_OUT_OF_BOUNDS
+		tx_path[0], rx_path[0] = task.paths[path_idx]
+		return self.ERR_OK
+
+	def getnumberOfEnabledReceivers(self, t, num_receivers_enabled):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		num_receivers_enabled[0] = self._receivers(task)
+		return self.ERR_OK
+
+	def getEnabledReceivers(self, t, enabled_receivers_mask):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		enabled_receivers_mask[0] = bytes([task.receiver_mask])
+		return self.ERR_OK
+
+	def setEnabledReceivers(self, t, enabled_receivers_mask):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if isinstance(enabled_receivers_mask, bytes):
+			enabled_receivers_mask = enabled_receivers_mask[0]
+		task.receiver_mask = enabled_receivers_mask
+		return self.ERR_OK
+
+	def setIfGain(self, t, new_gain):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state == 'TASK_UNINITIALIZED':
+			return self.ERR_WRONG_STATE
+		task.if_gain = new_gain
+		return self.ERR_OK
+
+	def getIfGain(self, t, current_gain):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		current_gain[0] = task.if_gain if isinstance(task.if_gain, int) else self.AVMU_GAIN_USE_DEFAULT
+		return self.ERR_OK
+
+	def setReceiver12dBPad(self, t, enable_12_db_pad):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		task.pad_12db = bool(enable_12_db_pad)
+		return self.ERR_OK
+
+	def getReceiver12dBPad(self, t, is_enabled_12_db_pad):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		is_enabled_12_db_pad[0] = task.pad_12db
+		return self.ERR_OK
+
+	def setSyncPulseMode(self, t, sync_mode):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		task.sync_mode = sync_mode
+		return self.ERR_OK
+
+	def getSyncPulseMode(self, t, sync_mode):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		sync_mode[0] = task.sync_mode if isinstance(task.sync_mode, int) else self.SYNC_IGNORE
+		return self.ERR_OK
+
+	def isSerialPortPresent(self, t, present):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		present[0] = bool(task.unit and task.unit.has_serial_port)
+		return self.ERR_OK
+
+	def setSerialPortFeature(self, t, enable, buffer_size):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if not (task.unit and task.unit.has_serial_port):
+			return self.ERR_FEATURE_NOT_PRESENT
+		task.serial_enabled = bool(enable)
+		task.serial_size    = buffer_size
+		return self.ERR_OK
+
+	def isShaftEncoderPresent(self, t, present):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		present[0] = bool(task.unit and task.unit.has_encoders)
+		return self.ERR_OK
+
+	def setShaftEncoderFeature(self, t, enable, reset_on_start):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if not (task.unit and task.unit.has_encoders):
+			return self.ERR_FEATURE_NOT_PRESENT
+		task.encoders_enabled = bool(enable)
+		return self.ERR_OK
+
+	def configureTddSettings(self, t, *args):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.unit is None or task.unit.switch_board_type != 'TDD_4_PORT_SWITCH':
+			return self.ERR_FEATURE_NOT_PRESENT
+		return self.ERR_OK
+
+	def setSendSweepTimer(self, t, send_timer):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_STOPPED':
+			return self.ERR_WRONG_STATE
+		task.send_timer = bool(send_timer)
+		return self.ERR_OK
+
+	def getSendSweepTimer(self, t, val):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		val[0] = task.send_timer
+		return self.ERR_OK
+
+	def setResetFrameCounterOnStart(self, t, do_reset):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_STOPPED':
+			return self.ERR_WRONG_STATE
+		task.reset_frame_cnt = bool(do_reset)
+		return self.ERR_OK
+
+	def getResetFrameCounterOnStart(self, t, val):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		val[0] = task.reset_frame_cnt
+		return self.ERR_OK
+
+	def addExclusionBand(self, t, start_freq, stop_freq):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_STOPPED':
+			return self.ERR_WRONG_STATE
+		if start_freq <= 0 or stop_freq <= start_freq:
+			return self.ERR_INVALID_PARAMETER
+		task.exclusion_bands.append((start_freq, stop_freq))
+		return self.ERR_OK
+
+	def clearExclusionBands(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_STOPPED':
+			return self.ERR_WRONG_STATE
+		task.exclusion_bands = []
+		return self.ERR_OK
+
+	def getExclusionBandCount(self, t, idx):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		idx[0] = len(task.exclusion_bands)
+		return self.ERR_OK
+
+	def getExclusionBand(self, t, idx, start_freq, stop_freq):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if not 0 <= idx < len(task.exclusion_bands):
+			return self.ERR_INDEX_OUT_OF_BOUNDS
+		start_freq[0], stop_freq[0] = task.exclusion_bands[idx]
+		return self.ERR_OK
+
+	def utilPingUnit(self, t, tries):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.ip is None:
+			return self.ERR_MISSING_IP
+		if not task.port:
+			return self.ERR_MISSING_PORT
+		return self.ERR_OK
+
+	def utilEnterLowPowerState(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state not in ('TASK_STARTED', 'TASK_STOPPED'):
+			return self.ERR_WRONG_STATE
+		return self.ERR_OK
+
+	#################################################################################
+	#        Acquisition
+	#################################################################################
+
+	def beginAsync(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.prog_type != 'PROG_ASYNC':
+			return self.ERR_WRONG_PROGRAM_TYPE
+		if task.state != 'TASK_STARTED':
+			return self.ERR_WRONG_STATE
+		task.state          = 'TASK_RUNNING'
+		task.async_t0       = time.perf_counter()
+		task.async_consumed = 0
+		return self.ERR_OK
+
+	def haltAsync(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state != 'TASK_RUNNING':
+			return self.ERR_WRONG_STATE
+		task.state    = 'TASK_STARTED'
+		task.async_t0 = None
+		return self.ERR_OK
+
+	def validateArrayTasks(self, handles, handle_count):
+		if not handle_count:
+			return self.ERR_TASK_ARRAY_INVALID
+		tasks = [self._task(handles[idx]) for idx in range(handle_count)]
+		if any(tmp is None for tmp in tasks):
+			return self.ERR_BAD_HANDLE
+		return self.ERR_OK
+
+	def broadcastBeginCommand(self, handles, handle_count):
+		if not handle_count:
+			return self.ERR_TASK_ARRAY_INVALID
+		tasks = [self._task(handles[idx]) for idx in range(handle_count)]
+		if any(tmp is None for tmp in tasks):
+			return self.ERR_BAD_HANDLE
+		if any(tmp.state != 'TASK_RUNNING' for tmp in tasks):
+			return self.ERR_WRONG_STATE
+		now = time.perf_counter()
+		for task in tasks:
+			task.async_t0       = now
+			task.async_consumed = 0
+		return self.ERR_OK
+
+	def interruptMeasurement(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if task.state not in ('TASK_STARTED', 'TASK_RUNNING'):
+			return self.ERR_WRONG_STATE
+		task.interrupt.set()
+		return self.ERR_OK
+
+	def measure(self, t):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if not task.paths:
+			return self.ERR_NO_PATHS_MEASURED
+
+		if task.prog_type == 'PROG_SYNC':
+			if task.state != 'TASK_STARTED':
+				return self.ERR_WRONG_STATE
+			if self._wait(task, task.frame_time):
+				return self.ERR_INTERRUPTED
+			self._capture_frame(task, time.perf_counter())
+			return self.ERR_OK
+
+		if task.state != 'TASK_RUNNING':
+			return self.ERR_WRONG_STATE
+
+		now       = time.perf_counter()
+		available = int((now - task.async_t0) / task.frame_time) - task.async_consumed
+		capacity  = max(SOCKET_BUFFER_BYTES // max(self._frame_bytes(task), 1), 1)
+
+		if available > capacity:
+			# The consumer fell behind and the socket buffer overflowed. Everything
+			# that was queued is lost, and the sweep counters skip ahead.
+			dropped = available - 1
+			task.async_consumed += dropped
+			task.frame_num      += dropped
+			task.sweep_num      += dropped * len(task.paths)
+			task.current_frame   = None
+			return self.ERR_BYTES
+
+		if available < 1:
+			due = task.async_t0 + (task.async_consumed + 1) * task.frame_time
+			if due - now > task.frame_time + task.timeout / 1000.0:
+				return self.ERR_NO_RESPONSE
+			if self._wait(task, due - now):
+				return self.ERR_INTERRUPTED
+
+		task.async_consumed += 1
+		frame_ts = task.async_t0 + task.async_consumed * task.frame_time
+		self._capture_frame(task, frame_ts)
+		return self.ERR_OK
+
+	def extractSweepData(self, t, data, tx_path, rx_path):
+		task = self._task(t)
+		if task is None:
+			return self.ERR_BAD_HANDLE
+		if (tx_path, rx_path) not in task.scene:
+			return self.ERR_BAD_PATH
+		frame = task.current_frame
+		if frame is None:
+			return self.ERR_PATH_HAS_NO_DATA
+
+		path_idx = task.paths.index((tx_path, rx_path))
+		npts     = task.freqs.shape[0]
+		resp     = task.scene[(tx_path, rx_path)] + task.noise_bank[frame['noise_idx']]
+		nbytes   = npts * 8
+
+		for rx_idx in range(self._receivers(task)):
+			scale = 1.0 / (1 + rx_idx)
+			self._ffi.memmove(data.points.I[rx_idx], (resp.real * scale).tobytes(), nbytes)
+			self._ffi.memmove(data.points.Q[rx_idx], (resp.imag * scale).tobytes(), nbytes)
+
+		sweep_ts = frame['timestamp'] + path_idx * (task.frame_time / len(task.paths))
+
+		data.shaft_encoder_left  = frame['encoder']
+		data.shaft_encoder_right = frame['encoder']
+		data.timestamp_ticks     = int(sweep_ts * TIMESTAMP_TICK_HZ) & 0xFFFFFFFF if task.send_timer else 0
+		data.timestamp_seconds   = 0.0
+		data.packet_num          = path_idx
+		data.sweep_number        = (frame['sweep_base'] + path_idx) & 0xFFFFFFFF
+		data.frame_num           = frame['frame_num'] & 0xFFFFFFFF
+
+		if task.serial_enabled and task.serial_size and data.serial_data_bytes != self._ffi.NULL:
+			data.serial_data_age = 1
+			payload = (b"SIM%08d" % frame['frame_num'])[:task.serial_size]
+			self._ffi.memmove(data.serial_data_bytes, payload, len(payload))
+		else:
+			data.serial_data_age = 0
+
+		return self.ERR_OK
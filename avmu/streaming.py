@@ -0,0 +1,339 @@
+'''
+# #########################################################################
+
+Background streaming acquisition for an :class:`~avmu.avmu_library.AvmuInterface`.
+
+An :class:`AvmuStream` runs the ``measure()``/extract loop on a dedicated thread,
+and stores each frame in a preallocated ring of frame buffers. The cffi calls
+release the GIL while they block, so the acquisition thread keeps draining the
+socket regardless of what the consumer is doing.
+
+# #########################################################################
+'''
+
+import logging
+import threading
+import time
+
+from . import avmu_exceptions
+
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+BLOCK       = 'block'
+
+STREAM_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class AvmuStream(object):
+	'''
+	Continuously acquire frames from an AVMU on a background thread.
+
+	Frames are stored in a bounded ring of ``capacity`` frames. Each frame is a 2-tuple of
+	``(data, meta)`` arrays, with the same layout as one frame from
+	:func:`~avmu.avmu_library.AvmuInterface.allocateFrameBuffer()` (i.e. ``data`` has the shape
+	``(paths, receivers, points)``, and ``meta`` is a structured array of shape ``(paths, )``).
+
+	When the ring is full, the behaviour depends on ``policy``:
+
+		- ``drop-oldest`` The oldest queued frame is discarded to make room for the new one.
+		- ``drop-newest`` The newly measured frame is discarded. ``measure()`` is still
+		  called, so the socket is still drained.
+		- ``block``       The acquisition thread waits for the consumer to make room. Note
+		  that in ``PROG_ASYNC`` mode, the hardware keeps sending data while the thread is
+		  waiting, so a slow consumer can overrun the socket receive buffer.
+
+	The interface must already be configured, and in the ``TASK_STARTED`` state. If the
+	measurement type is ``PROG_ASYNC``, :func:`start()` calls ``beginAsync()``, and
+	:func:`stop()` calls ``haltAsync()``.
+
+	While the stream is running, the acquisition thread owns the interface. Do not call
+	any other methods of the interface until the stream has been stopped.
+
+	``Avmu_Exception_Bytes`` returns from ``measure()`` are counted as overruns, and
+	``Avmu_Exception_No_Response`` returns as timeouts, and the acquisition continues.
+	Any other exception stops the stream, and is re-raised to the consumer by the next
+	:func:`get()` call once the queued frames have been consumed.
+
+	The stream can be iterated over (``for data, meta in stream:``). Iteration ends once the
+	stream has been stopped and every queued frame has been consumed.
+
+	Args:
+		interface (AvmuInterface): The configured interface to acquire from.
+		capacity (int): Number of frames the ring can hold.
+		policy (str): One of ``drop-oldest``, ``drop-newest`` or ``block``.
+	'''
+
+	def __init__(self, interface, capacity=64, policy=DROP_OLDEST):
+		assert capacity > 0, "Stream capacity must be at least one frame!"
+		assert policy in STREAM_POLICIES, "Invalid stream policy: '%s'. Must be one of %s" % (policy, STREAM_POLICIES)
+
+		self.log       = logging.getLogger("Main.Dll.Stream")
+		self.interface = interface
+		self.capacity  = capacity
+		self.policy    = policy
+
+		self.__cond   = threading.Condition()
+		self.__thread = None
+		self.__halt   = False
+		self.__error  = None
+		self.__async  = False
+
+		self.__data = None
+		self.__meta = None
+		self.__head  = 0
+		self.__count = 0
+
+		self.__frame_callback = None
+
+		self.__stats = {}
+		self.__reset_stats()
+
+	def __reset_stats(self):
+		self.__stats = {
+			'frames_acquired'  : 0,
+			'frames_delivered' : 0,
+			'frames_dropped'   : 0,
+			'overruns'         : 0,
+			'timeouts'         : 0,
+			'queue_high_water' : 0,
+			'started_at'       : None,
+		}
+
+	def __enter__(self):
+		self.start()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.stop()
+
+	def __iter__(self):
+		while True:
+			frame = self.get()
+			if frame is None:
+				return
+			yield frame
+
+	def start(self):
+		'''
+		Allocate the frame ring, and start the acquisition thread.
+
+		The frame ring is sized for the interface configuration at the time of the call.
+
+		Raises:
+			:class:`~avmu.avmu_exceptions.Avmu_Exception_Wrong_State` if the interface is not in the ``TASK_STARTED`` state.
+			Any exception that can be raised by ``beginAsync()``.
+		'''
+		assert self.__thread is None, "Stream is already running!"
+
+		state = self.interface.getState()
+		if state != 'TASK_STARTED':
+			raise avmu_exceptions.Avmu_Exception_Wrong_State("Streaming requires the task to be in the TASK_STARTED state. Current state: %s" % (state, ))
+
+		self.__data, self.__meta = self.interface.allocateFrameBuffer(self.capacity)
+		self.__head  = 0
+		self.__count = 0
+		self.__halt  = False
+		self.__error = None
+		self.__reset_stats()
+		self.__stats['started_at'] = time.time()
+
+		self.__async = self.interface.getMeasurementType() == 'PROG_ASYNC'
+		if self.__async:
+			self.interface.beginAsync()
+
+		self.__thread = threading.Thread(target=self.__acquisition_loop, name="AvmuStream", daemon=True)
+		self.__thread.start()
+
+	def stop(self):
+		'''
+		Stop the acquisition thread, and halt the async acquisition if :func:`start()` began it.
+
+		Frames that are already queued can still be retrieved with :func:`get()`
+		after the stream is stopped.
+		'''
+		if self.__thread is None:
+			return
+
+		with self.__cond:
+			self.__halt = True
+			self.__cond.notify_all()
+
+		# Wake the thread if it's blocked in measure().
+		try:
+			self.interface.interruptMeasurement()
+		except avmu_exceptions.Avmu_Exception:
+			pass
+
+		self.__thread.join()
+		self.__thread = None
+
+		if self.__async:
+			self.__async = False
+			self.interface.haltAsync()
+
+	def isRunning(self):
+		'''
+		Returns:
+			(bool) True if the acquisition thread is running, and has not stopped
+			(or been asked to stop).
+		'''
+		return self.__thread is not None and not self.__halt and self.__thread.is_alive()
+
+	def get(self, timeout=None):
+		'''
+		Get the oldest queued frame.
+
+		Blocks until a frame is available, the stream stops, or ``timeout`` expires.
+		The returned arrays are copies, and remain valid after the ring slot is reused.
+
+		Args:
+			timeout (float): Maximum time to wait in seconds, or ``None`` to wait indefinitely.
+
+		Returns:
+			2-tuple of ``(data, meta)`` arrays, or ``None`` if no frame arrived within the
+			timeout, or the stream is stopped and there are no queued frames left.
+
+		Raises:
+			The exception that stopped the acquisition thread, if any, once every frame
+			queued before it has been consumed.
+		'''
+		with self.__cond:
+			ok = self.__cond.wait_for(lambda: self.__count or self.__halt or self.__error, timeout)
+			if not ok or not self.__count:
+				if self.__error is not None:
+					err, self.__error = self.__error, None
+					raise err
+				return None
+
+			slot = self.__head
+			data = self.__data[slot].copy()
+			meta = self.__meta[slot].copy()
+
+			self.__head   = (self.__head + 1) % self.capacity
+			self.__count -= 1
+			self.__stats['frames_delivered'] += 1
+			self.__cond.notify_all()
+
+		return data, meta
+
+	def setFrameCallback(self, callback):
+		'''
+		Register a callable to be notified when frames are available.
+
+		``callback()`` is called with no arguments from the acquisition thread every time a
+		frame is queued, and once more when the acquisition thread exits. It must not block,
+		and must not call back into the interface. This is intended for waking
+		consumers that can't block in :func:`get()` (e.g. an event loop).
+
+		Args:
+			callback (callable): The callable, or ``None`` to remove the current callback.
+		'''
+		self.__frame_callback = callback
+
+	def getQueueDepth(self):
+		'''
+		Returns:
+			(int) Number of frames currently queued.
+		'''
+		return self.__count
+
+	def getStatistics(self):
+		'''
+		Get the acquisition counters.
+
+		Returns:
+			A dict containing:
+
+				- ``frames_acquired``   Frames successfully measured (including any dropped frames).
+				- ``frames_delivered``  Frames returned by :func:`get()`.
+				- ``frames_dropped``    Frames discarded because the ring was full.
+				- ``overruns``          ``Avmu_Exception_Bytes`` returns from ``measure()``.
+				- ``timeouts``          ``Avmu_Exception_No_Response`` returns from ``measure()``.
+				- ``queue_depth``       Frames currently queued.
+				- ``queue_high_water``  Highest number of frames that have been queued at once.
+				- ``policy``            The ring-full policy.
+				- ``capacity``          The ring capacity.
+				- ``elapsed``           Seconds since :func:`start()`, or ``None``.
+		'''
+		with self.__cond:
+			ret = dict(self.__stats)
+			ret['queue_depth'] = self.__count
+
+		started = ret.pop('started_at')
+		ret['policy']   = self.policy
+		ret['capacity'] = self.capacity
+		ret['elapsed']  = time.time() - started if started is not None else None
+		return ret
+
+	def __reserve_slot(self):
+		'''
+		Pick the ring slot the next frame should be written into, or None
+		if the frame should be measured and then discarded.
+		'''
+		with self.__cond:
+			if self.__count == self.capacity:
+				if self.policy == DROP_NEWEST:
+					return None
+				elif self.policy == DROP_OLDEST:
+					self.__head   = (self.__head + 1) % self.capacity
+					self.__count -= 1
+					self.__stats['frames_dropped'] += 1
+				else:
+					self.__cond.wait_for(lambda: self.__count < self.capacity or self.__halt)
+					if self.__halt:
+						return None
+
+			return (self.__head + self.__count) % self.capacity
+
+	def __acquisition_loop(self):
+		interface = self.interface
+		stats     = self.__stats
+		data      = self.__data
+		meta      = self.__meta
+
+		while not self.__halt:
+			slot = self.__reserve_slot()
+			if self.__halt:
+				break
+
+			try:
+				interface.measure()
+				if slot is not None:
+					interface.extractFramesInto(data, meta, slot)
+			except avmu_exceptions.Avmu_Exception_Bytes:
+				stats['overruns'] += 1
+				continue
+			except avmu_exceptions.Avmu_Exception_No_Response:
+				stats['timeouts'] += 1
+				continue
+			except Exception as e:
+				# stop() interrupts any in-progress measure(), so errors
+				# after a halt request are expected.
+				if self.__halt:
+					break
+				self.log.error("Stream acquisition failed: %s", e)
+				with self.__cond:
+					self.__error = e
+					self.__halt  = True
+					self.__cond.notify_all()
+				break
+
+			with self.__cond:
+				stats['frames_acquired'] += 1
+				if slot is None:
+					stats['frames_dropped'] += 1
+				else:
+					self.__count += 1
+					if self.__count > stats['queue_high_water']:
+						stats['queue_high_water'] = self.__count
+				self.__cond.notify_all()
+
+			if slot is not None and self.__frame_callback is not None:
+				self.__frame_callback()
+
+		with self.__cond:
+			self.__cond.notify_all()
+
+		if self.__frame_callback is not None:
+			self.__frame_callback()
@@ -0,0 +1,236 @@
+'''
+# #########################################################################
+
+Persistent cache of sweep plans.
+
+Generating a linear sweep has the DLL fix the sweep limits and snap every
+point to a generateable frequency, and the resulting frequencies then have to
+be read back. A :class:`SweepPlanCache` remembers the outcome, keyed by
+``(serial number, start, stop, points, exclusion bands)``, so switching to a
+known plan is a single ``setFrequencies()`` call with the cached array::
+
+	cache = avmu.sweep_cache.SweepPlanCache("sweep_plans.npz")
+	device.setSweepPlanCache(cache)
+	device.utilGenerateLinearSweep(startF_mhz=250, stopF_mhz=2100, points=1024)
+
+Each :class:`SweepPlan` holds the snapped frequencies (as a read-only numpy
+array), and the frame time measured for the plan with each hop rate and number
+of measured paths it has been run with. The fixed limits from
+``utilFixLinearSweepLimits()`` are cached separately, as they do not depend on
+the exclusion bands. With a ``path``, the cache is loaded from, and
+written back to, a numpy ``.npz`` file, so it persists across runs (and can be
+shared by every unit in a fleet, as the key includes the serial number).
+
+# #########################################################################
+'''
+
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+
+SWEEP_CACHE_FORMAT_VERSION = 2
+
+# Older formats that can still be loaded. Version 1 keyed frame times by hop rate
+# alone, so its frame times are dropped.
+SWEEP_CACHE_COMPATIBLE_VERSIONS = (1, 2)
+
+
+def sweep_plan_key(serial_number, start_mhz, stop_mhz, points, exclusion_bands=()):
+	'''
+	Build the cache key for a linear sweep.
+
+	Returns:
+		Hashable tuple of ``(serial_number, start_mhz, stop_mhz, points, exclusion_bands)``.
+	'''
+	bands = tuple((float(start), float(stop)) for start, stop in exclusion_bands)
+	return (int(serial_number), float(start_mhz), float(stop_mhz), int(points), bands)
+
+
+class SweepPlan(object):
+	'''
+	A cached sweep plan.
+
+	Attributes:
+		key (tuple): The plan's key (see :func:`sweep_plan_key()`).
+		frequencies (numpy array): The snapped frequencies, in MHz, as returned by
+		                           :func:`~avmu.avmu_library.AvmuInterface.getFrequencies()`.
+		                           Read-only.
+		limits (tuple): The first and last snapped frequency, in MHz.
+		frame_times (dict): ``(hop rate name, measured paths)`` -> measured frame time, in seconds.
+	'''
+
+	def __init__(self, key, frequencies, frame_times=None):
+		frequencies = np.array(frequencies, dtype=np.float64)
+		frequencies.setflags(write=False)
+		self.key         = key
+		self.frequencies = frequencies
+		self.limits      = (float(frequencies[0]), float(frequencies[-1])) if len(frequencies) else (None, None)
+		self.frame_times = dict(frame_times or {})
+
+	def frameTime(self, hop_rate, paths):
+		'''
+		Args:
+			hop_rate (str): Hop rate name, e.g. ``'HOP_45K'``.
+			paths (int): Number of measured paths, as the frame time grows with it.
+
+		Returns:
+			The frame time measured for the plan with ``hop_rate`` and ``paths``, in seconds, or
+			``None`` if the plan has not been run that way.
+		'''
+		return self.frame_times.get((hop_rate, int(paths)))
+
+	def __repr__(self):
+		return "<SweepPlan serial %s, %s - %s MHz, %s points, %s exclusion band(s)>" % (
+				self.key[0], self.key[1], self.key[2], self.key[3], len(self.key[4]))
+
+
+class SweepPlanCache(object):
+	'''
+	Thread-safe store of :class:`SweepPlan` objects, and of fixed sweep limits.
+
+	Args:
+		path (str): File to load the cache from (if it exists) and save it to. ``None`` keeps the
+		            cache in memory only.
+		autosave (bool): If True (and ``path`` is set), save the cache whenever it changes.
+	'''
+
+	def __init__(self, path=None, autosave=True):
+		self.log = logging.getLogger("Main.Dll.SweepCache")
+		self.path     = path
+		self.autosave = autosave
+
+		self.__lock      = threading.Lock()
+		self.__save_lock = threading.Lock()
+		self.__plans     = {}
+		self.__limits    = {}
+
+		if path is not None and os.path.exists(path):
+			self.load(path)
+
+	def __len__(self):
+		return len(self.__plans)
+
+	def get(self, key):
+		'''
+		Returns:
+			The :class:`SweepPlan` for ``key``, or ``None``.
+		'''
+		with self.__lock:
+			return self.__plans.get(key)
+
+	def put(self, key, frequencies):
+		'''
+		Store the snapped frequencies for ``key``, replacing any existing plan (and its frame times).
+
+		Returns:
+			The new :class:`SweepPlan`.
+		'''
+		plan = SweepPlan(key, frequencies)
+		with self.__lock:
+			self.__plans[key] = plan
+		self.__changed()
+		return plan
+
+	def getLimits(self, serial_number, start_mhz, stop_mhz, points):
+		'''
+		Returns:
+			The cached fixed ``(start, stop)`` limits for a linear sweep, or ``None``.
+		'''
+		with self.__lock:
+			return self.__limits.get(sweep_plan_key(serial_number, start_mhz, stop_mhz, points)[:4])
+
+	def putLimits(self, serial_number, start_mhz, stop_mhz, points, limits):
+		'''
+		Store the fixed ``(start, stop)`` limits for a linear sweep.
+		'''
+		key = sweep_plan_key(serial_number, start_mhz, stop_mhz, points)[:4]
+		limits = (float(limits[0]), float(limits[1]))
+		with self.__lock:
+			if self.__limits.get(key) == limits:
+				return
+			self.__limits[key] = limits
+		self.__changed()
+
+	def setFrameTime(self, key, hop_rate, paths, frame_time):
+		'''
+		Record the frame time measured for plan ``key`` with ``hop_rate`` and ``paths`` measured
+		paths. Does nothing if the plan is not in the cache.
+		'''
+		time_key = (hop_rate, int(paths))
+		with self.__lock:
+			plan = self.__plans.get(key)
+			if plan is None or plan.frame_times.get(time_key) == frame_time:
+				return
+			plan.frame_times[time_key] = frame_time
+		self.__changed()
+
+	def clear(self):
+		with self.__lock:
+			self.__plans.clear()
+			self.__limits.clear()
+		self.__changed()
+
+	def __changed(self):
+		if self.autosave and self.path is not None:
+			self.save()
+
+	def save(self, path=None):
+		'''
+		Write the cache to ``path`` (default: the cache's own ``path``), in the numpy ``.npz`` format.
+		The file is written to a temporary name and renamed into place, so a concurrent reader never
+		sees a partial file.
+		'''
+		path = path or self.path
+		assert path is not None, "No path to save the sweep plan cache to!"
+
+		# Saves are serialized, so they share the temporary file safely, and
+		# a save never replaces the file with an older snapshot.
+		with self.__save_lock:
+			with self.__lock:
+				plans  = [(plan, list(plan.frame_times.items())) for plan in self.__plans.values()]
+				limits = list(self.__limits.items())
+
+			header = {
+				'version' : SWEEP_CACHE_FORMAT_VERSION,
+				'plans'   : [{'key' : plan.key, 'frame_times' : [[hop, paths, value] for (hop, paths), value in frame_times]}
+				             for plan, frame_times in plans],
+				'limits'  : [[key, value] for key, value in limits],
+			}
+			arrays = {'freqs_%s' % (idx, ) : plan.frequencies for idx, (plan, dummy_times) in enumerate(plans)}
+
+			tmp_path = "%s.%s.tmp" % (path, os.getpid())
+			with open(tmp_path, "wb") as fp:
+				np.savez(fp, header=np.array(json.dumps(header)), **arrays)
+			os.replace(tmp_path, path)
+
+	def load(self, path):
+		'''
+		Merge the plans saved in ``path`` into the cache.
+		'''
+		def to_key(value):
+			serial, start, stop, points = value[:4]
+			return sweep_plan_key(serial, start, stop, points, value[4] if len(value) > 4 else ())
+
+		with np.load(path) as npz:
+			header = json.loads(str(npz['header']))
+			version = header.get('version')
+			if version not in SWEEP_CACHE_COMPATIBLE_VERSIONS:
+				self.log.warning("Ignoring sweep plan cache '%s' with unknown format version %s", path, version)
+				return
+			plans = []
+			for idx, entry in enumerate(header['plans']):
+				frame_times = {}
+				if version >= 2:
+					frame_times = {(hop, int(paths)) : value for hop, paths, value in entry['frame_times']}
+				plans.append(SweepPlan(to_key(entry['key']), npz['freqs_%s' % (idx, )], frame_times))
+
+		with self.__lock:
+			for plan in plans:
+				self.__plans[plan.key] = plan
+			for key, value in header['limits']:
+				self.__limits[to_key(key)[:4]] = tuple(value)
+		self.log.info("Loaded %s sweep plans from '%s'", len(plans), path)
@@ -0,0 +1,224 @@
+'''
+# #########################################################################
+
+Acquisition health counters for an :class:`~avmu.avmu_library.AvmuInterface`.
+
+Data loss on an AVMU shows up in only a few ways: ``Avmu_Exception_Bytes``,
+``Avmu_Exception_No_Response``, or a jump in the ``sweep_number`` counter. An
+:class:`AcquisitionTelemetry` instance counts all of these as the interface runs,
+along with rolling timing statistics, so a unit that is falling behind its
+socket can be spotted before it starts dropping data.
+
+# #########################################################################
+'''
+
+import time
+
+
+class AcquisitionTelemetry(object):
+	'''
+	Counters and rolling statistics for one task.
+
+	Every :class:`~avmu.avmu_library.AvmuInterface` owns one of these (as ``telemetry``),
+	and updates it from ``measure()`` and the extraction calls. The recording methods only
+	do a handful of arithmetic operations, so they are always enabled.
+
+	Rolling means are exponentially weighted, with the weight ``alpha`` given to the newest sample.
+
+	Args:
+		err_ok (int): The DLL's ``ERR_OK`` code.
+		err_bytes (int): The DLL's ``ERR_BYTES`` code.
+		err_no_response (int): The DLL's ``ERR_NO_RESPONSE`` code.
+		alpha (float): Weight for the rolling means.
+	'''
+
+	SWEEP_COUNTER_MODULUS = 2 ** 32
+
+	def __init__(self, err_ok, err_bytes, err_no_response, alpha=0.05):
+		assert 0 < alpha <= 1, "alpha must be in the range (0, 1]!"
+		self.err_ok          = err_ok
+		self.err_bytes       = err_bytes
+		self.err_no_response = err_no_response
+		self.alpha           = alpha
+		self.reset()
+
+	def reset(self):
+		'''
+		Zero every counter and rolling statistic.
+		'''
+		self.started_at     = time.time()
+
+		self.frames         = 0
+		self.byte_errors    = 0
+		self.timeouts       = 0
+		self.other_errors   = 0
+		self.dropped_sweeps = 0
+		self.gap_events     = 0
+
+		self.wait_mean      = None
+		self.wait_max       = 0.0
+		self.cycle_mean     = None
+		self.cycle_max      = 0.0
+		self.extract_mean   = None
+		self.extract_max    = 0.0
+		self.extract_total  = 0.0
+
+		self.last_sweep_number = None
+
+		self.__last_measure_end = None
+		self.__frame_base       = None
+		self.__new_frame        = False
+		self.__frame_extract    = 0.0
+
+	def __ewma(self, mean, sample):
+		if mean is None:
+			return sample
+		return mean + self.alpha * (sample - mean)
+
+	def recordMeasure(self, start, end, ret):
+		'''
+		Record a ``measure()`` call.
+
+		Args:
+			start (float): ``time.perf_counter()`` before the DLL call.
+			end (float): ``time.perf_counter()`` after the DLL call.
+			ret (int): The DLL return code.
+		'''
+		if ret != self.err_ok:
+			if ret == self.err_bytes:
+				self.byte_errors += 1
+			elif ret == self.err_no_response:
+				self.timeouts += 1
+			else:
+				self.other_errors += 1
+			return
+
+		self.frames += 1
+
+		wait = end - start
+		self.wait_mean = self.__ewma(self.wait_mean, wait)
+		if wait > self.wait_max:
+			self.wait_max = wait
+
+		if self.__last_measure_end is not None:
+			cycle = end - self.__last_measure_end
+			self.cycle_mean = self.__ewma(self.cycle_mean, cycle)
+			if cycle > self.cycle_max:
+				self.cycle_max = cycle
+		self.__last_measure_end = end
+
+		# Extraction time is accumulated per frame, and committed once the next frame arrives.
+		if self.__frame_extract:
+			self.extract_mean = self.__ewma(self.extract_mean, self.__frame_extract)
+			if self.__frame_extract > self.extract_max:
+				self.extract_max = self.__frame_extract
+			self.__frame_extract = 0.0
+
+		self.__new_frame = True
+
+	def recordRestart(self):
+		'''
+		Record that the acquisition was (re)started, so the idle time before the
+		restart isn't counted as a cycle, and the sweep counter isn't compared
+		across it.
+		'''
+		self.__last_measure_end = None
+		self.__frame_base       = None
+		self.__new_frame        = False
+		self.__frame_extract    = 0.0
+
+	def recordExtraction(self, seconds):
+		'''
+		Record time spent extracting data for the current frame.
+		'''
+		self.__frame_extract += seconds
+		self.extract_total   += seconds
+
+	def recordSweepNumber(self, sweep_number, path_idx, path_count):
+		'''
+		Check the sweep number of an extracted path for dropped sweeps.
+
+		Only the first path extracted after each ``measure()`` is checked. Its sweep
+		number, less its position in the measured path list, gives the sweep number of
+		the start of the frame, which should advance by ``path_count`` every frame.
+
+		Args:
+			sweep_number (int): The path's ``sweep_number``.
+			path_idx (int): Position of the path in the measured path list.
+			path_count (int): Number of measured paths.
+		'''
+		self.last_sweep_number = sweep_number
+		if not self.__new_frame:
+			return
+		self.__new_frame = False
+
+		base = sweep_number - path_idx
+		if self.__frame_base is not None:
+			step = (base - self.__frame_base) % self.SWEEP_COUNTER_MODULUS
+			# Steps that go backwards (e.g. after a restart) are not gaps.
+			if path_count < step < self.SWEEP_COUNTER_MODULUS // 2:
+				self.dropped_sweeps += step - path_count
+				self.gap_events     += 1
+		self.__frame_base = base
+
+	def snapshot(self, frame_time=None):
+		'''
+		Get the current counters and statistics.
+
+		Args:
+			frame_time (float): The task's frame time from ``getPreciseTimePerFrame()``,
+			                    used to normalize the timing figures. Optional.
+
+		Returns:
+			A dict containing:
+
+				- ``frames``           Successful ``measure()`` calls.
+				- ``byte_errors``      ``measure()`` calls that returned ``ERR_BYTES``.
+				- ``timeouts``         ``measure()`` calls that returned ``ERR_NO_RESPONSE``.
+				- ``other_errors``     ``measure()`` calls that returned any other error.
+				- ``dropped_sweeps``   Sweeps missing from the ``sweep_number`` sequence.
+				- ``gap_events``       Number of discontinuities in the ``sweep_number`` sequence.
+				- ``last_sweep_number`` Sweep number of the most recently extracted path.
+				- ``wait_mean``, ``wait_max``  Time spent blocked in ``measure()`` (seconds).
+				- ``cycle_mean``, ``cycle_max`` Time between successive ``measure()`` returns (seconds).
+				- ``extract_mean``, ``extract_max`` Extraction time per frame (seconds).
+				- ``extract_total``    Total extraction time (seconds).
+				- ``frame_time``       The ``frame_time`` argument.
+				- ``wait_ratio``       ``wait_mean / frame_time``. In ``PROG_ASYNC`` mode, this tends
+				  towards zero as data queues up in the socket buffer.
+				- ``load``             Time per cycle spent outside ``measure()``, as a fraction of
+				  ``frame_time``. Values approaching 1 mean the application is barely keeping up with
+				  the hardware, and values over 1 mean the socket buffer is filling.
+				- ``elapsed``          Seconds since the counters were last reset.
+
+			The normalized values are ``None`` if ``frame_time`` is not available, and the rolling
+			values are ``None`` until enough frames have been acquired.
+		'''
+		ret = {
+			'frames'            : self.frames,
+			'byte_errors'       : self.byte_errors,
+			'timeouts'          : self.timeouts,
+			'other_errors'      : self.other_errors,
+			'dropped_sweeps'    : self.dropped_sweeps,
+			'gap_events'        : self.gap_events,
+			'last_sweep_number' : self.last_sweep_number,
+			'wait_mean'         : self.wait_mean,
+			'wait_max'          : self.wait_max,
+			'cycle_mean'        : self.cycle_mean,
+			'cycle_max'         : self.cycle_max,
+			'extract_mean'      : self.extract_mean,
+			'extract_max'       : self.extract_max,
+			'extract_total'     : self.extract_total,
+			'frame_time'        : frame_time,
+			'wait_ratio'        : None,
+			'load'              : None,
+			'elapsed'           : time.time() - self.started_at,
+		}
+
+		if frame_time and frame_time > 0:
+			if self.wait_mean is not None:
+				ret['wait_ratio'] = self.wait_mean / frame_time
+			if self.wait_mean is not None and self.cycle_mean is not None:
+				ret['load'] = max(self.cycle_mean - self.wait_mean, 0.0) / frame_time
+
+		return ret
@@ -0,0 +1,305 @@
+'''
+# #########################################################################
+
+Timeline tracing, exported in the Chrome Trace Event format.
+
+A :class:`Tracer` records begin/end spans into a fixed-size ring buffer per
+thread, and :func:`Tracer.dump()` writes them as a Chrome Trace Event JSON
+file, which can be opened in ``chrome://tracing`` or https://ui.perfetto.dev .
+
+DLL calls are traced by installing the tracer on an interface with
+:func:`~avmu.avmu_library.AvmuInterface.enableTracing()`. Application stages
+(DSP, disk writes, etc...) are traced with :func:`span()`::
+
+	tracer = avmu.tracing.enable()
+	device.enableTracing()
+	...
+	with avmu.tracing.span("fft"):
+		process(frame)
+	...
+	tracer.dump("capture.trace.json")
+
+When tracing is not enabled, :func:`span()` returns a shared no-op context
+manager, and the DLL calls are not wrapped.
+
+# #########################################################################
+'''
+
+import json
+import os
+import threading
+import time
+
+
+if hasattr(time, 'perf_counter_ns'):
+	_now_ns = time.perf_counter_ns
+else:
+	def _now_ns():
+		return int(time.perf_counter() * 1e9)
+
+
+class _NullSpan(object):
+	__slots__ = ()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+	__slots__ = ('ring', 'name', 'cat', 'args', 'start')
+
+	def __init__(self, ring, name, cat, args):
+		self.ring = ring
+		self.name = name
+		self.cat  = cat
+		self.args = args
+
+	def __enter__(self):
+		self.start = _now_ns()
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.ring.add(self.name, self.cat, self.start, _now_ns(), self.args)
+		return False
+
+
+class _ThreadRing(object):
+	'''
+	Fixed-size ring of events recorded by one thread. Only the owning
+	thread writes to it, so no locking is needed.
+	'''
+	__slots__ = ('events', 'capacity', 'index', 'wrapped', 'tid', 'thread_name')
+
+	def __init__(self, capacity):
+		thread = threading.current_thread()
+		self.events      = [None] * capacity
+		self.capacity    = capacity
+		self.index       = 0
+		self.wrapped     = False
+		self.tid         = threading.get_ident()
+		self.thread_name = thread.name
+
+	def add(self, name, cat, start, end, args):
+		self.events[self.index] = (name, cat, start, end, args)
+		self.index += 1
+		if self.index == self.capacity:
+			self.index   = 0
+			self.wrapped = True
+
+	def ordered(self):
+		if self.wrapped:
+			return self.events[self.index:] + self.events[:self.index]
+		return self.events[:self.index]
+
+	def clear(self):
+		self.events  = [None] * self.capacity
+		self.index   = 0
+		self.wrapped = False
+
+
+class Tracer(object):
+	'''
+	Records spans from any number of threads.
+
+	Each thread records into its own ring of ``capacity`` events. Once a thread's ring is
+	full, its oldest events are overwritten, so a tracer can be left running indefinitely,
+	and the dump will contain the most recent activity.
+
+	Args:
+		capacity (int): Number of events kept per thread.
+	'''
+
+	def __init__(self, capacity=65536):
+		assert capacity > 0, "Tracer capacity must be at least one event!"
+		self.capacity = capacity
+		self.enabled  = True
+
+		self.__local = threading.local()
+		self.__lock  = threading.Lock()
+		self.__rings = []
+		self.__pid   = os.getpid()
+		self.__t0    = _now_ns()
+
+	def __get_ring(self):
+		ring = getattr(self.__local, 'ring', None)
+		if ring is None:
+			ring = _ThreadRing(self.capacity)
+			self.__local.ring = ring
+			with self.__lock:
+				self.__rings.append(ring)
+		return ring
+
+	def span(self, name, cat='stage', **args):
+		'''
+		Context manager that records a span covering its body.
+
+		Args:
+			name (str): Span name.
+			cat (str): Span category.
+			**args: Extra values shown with the span in the trace viewer.
+		'''
+		if not self.enabled:
+			return _NULL_SPAN
+		return _Span(self.__get_ring(), name, cat, args or None)
+
+	def instant(self, name, cat='stage', **args):
+		'''
+		Record a zero-length event.
+		'''
+		if not self.enabled:
+			return
+		now = _now_ns()
+		self.__get_ring().add(name, cat, now, None, args or None)
+
+	def record(self, name, cat, start_ns, end_ns, args=None):
+		'''
+		Record a span from explicit ``_now_ns()``-style timestamps.
+		'''
+		if not self.enabled:
+			return
+		self.__get_ring().add(name, cat, start_ns, end_ns, args)
+
+	def wrapper(self, args=None):
+		'''
+		Get a :class:`~avmu.dll_loader.TaskBinding` wrapper that records a span
+		(category ``dll``) for every DLL call.
+
+		Args:
+			args (dict): Values attached to every span (e.g. the unit the call is for).
+		'''
+		get_ring = self.__get_ring
+		local    = self.__local
+		tracer   = self
+
+		def wrap(name, func):
+			def traced(*call_args):
+				if not tracer.enabled:
+					return func(*call_args)
+				start = _now_ns()
+				ret = func(*call_args)
+				end = _now_ns()
+				ring = getattr(local, 'ring', None) or get_ring()
+				ring.add(name, 'dll', start, end, args)
+				return ret
+			return traced
+		return wrap
+
+	def clear(self):
+		'''
+		Discard every recorded event.
+		'''
+		with self.__lock:
+			rings = list(self.__rings)
+		for ring in rings:
+			ring.clear()
+
+	def events(self):
+		'''
+		Get the recorded events as Chrome Trace Event dicts.
+
+		Returns:
+			List of event dicts, including thread-name metadata events.
+		'''
+		with self.__lock:
+			rings = list(self.__rings)
+
+		t0  = self.__t0
+		pid = self.__pid
+		ret = []
+		for ring in rings:
+			ret.append({
+				'name' : 'thread_name',
+				'ph'   : 'M',
+				'pid'  : pid,
+				'tid'  : ring.tid,
+				'args' : {'name' : ring.thread_name},
+			})
+			for name, cat, start, end, args in ring.ordered():
+				event = {
+					'name' : name,
+					'cat'  : cat,
+					'pid'  : pid,
+					'tid'  : ring.tid,
+					'ts'   : (start - t0) / 1000.0,
+				}
+				if end is None:
+					event['ph'] = 'i'
+					event['s']  = 't'
+				else:
+					event['ph']  = 'X'
+					event['dur'] = (end - start) / 1000.0
+				if args:
+					event['args'] = args
+				ret.append(event)
+		return ret
+
+	def dump(self, path):
+		'''
+		Write the recorded events to a Chrome Trace Event JSON file.
+
+		Args:
+			path (str): Output file path, or a writable file-like object.
+		'''
+		content = {
+			'traceEvents'     : self.events(),
+			'displayTimeUnit' : 'ms',
+		}
+		if hasattr(path, 'write'):
+			json.dump(content, path, default=str)
+		else:
+			with open(path, "w") as fp:
+				json.dump(content, fp, default=str)
+
+
+_default_tracer = None
+
+
+def enable(capacity=65536):
+	'''
+	Create (if needed) and enable the default tracer used by :func:`span()` and
+	:func:`~avmu.avmu_library.AvmuInterface.enableTracing()`.
+
+	Returns:
+		The default :class:`Tracer`.
+	'''
+	global _default_tracer
+	if _default_tracer is None:
+		_default_tracer = Tracer(capacity)
+	_default_tracer.enabled = True
+	return _default_tracer
+
+
+def disable():
+	'''
+	Stop recording into the default tracer. Recorded events are kept.
+	'''
+	if _default_tracer is not None:
+		_default_tracer.enabled = False
+
+
+def get_tracer():
+	'''
+	Returns:
+		The default :class:`Tracer`, or ``None`` if :func:`enable()` has not been called.
+	'''
+	return _default_tracer
+
+
+def span(name, cat='stage', **args):
+	'''
+	Record a user-defined stage on the default tracer::
+
+		with avmu.tracing.span("write", frames=len(batch)):
+			writer.append(batch)
+
+	Returns a no-op context manager if tracing is not enabled.
+	'''
+	if _default_tracer is None or not _default_tracer.enabled:
+		return _NULL_SPAN
+	return _default_tracer.span(name, cat, **args)
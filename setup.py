@@ -18,7 +18,7 @@ with open("README.md", "r") as fh:
 
 setuptools.setup(
     name                          = "avmu",
-    version                       = "0.1.1",
+    version                       = "0.2.0",
     author                        = "Connor Wolf, Akela Inc",
     author_email                  = "cwolf@akelainc.com",
     description                   = "Control interface and API for running Akela Vector Measurement Units.",
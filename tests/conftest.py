@@ -0,0 +1,95 @@
+'''
+# #########################################################################
+
+Test configuration.
+
+The tests run against the simulated backend (see :mod:`avmu.sim_backend`), so
+they need neither hardware nor the native DLL. The backend is fixed once it has
+been loaded, so it is selected here, before any test imports the library.
+
+# #########################################################################
+'''
+
+import warnings
+
+import pytest
+
+from avmu import dll_loader
+
+if dll_loader.STATIC_LIB is None:
+	dll_loader.select_backend("sim")
+
+# Load the header now, so cffi's parser warnings don't end up attached to the first test.
+with warnings.catch_warnings():
+	warnings.simplefilter("ignore")
+	dll_loader.load_ffi_interface()
+
+import avmu
+from avmu import replay
+
+
+TEST_PATHS = (
+		("AVMU_TX_PATH_0", "AVMU_RX_PATH_1"),
+		("AVMU_TX_PATH_1", "AVMU_RX_PATH_2"),
+	)
+
+
+def configure(interface, ip_address="10.0.0.1", points=64, hop_rate="HOP_90K",
+		measurement_type="PROG_ASYNC", paths=TEST_PATHS):
+	'''
+	Configure ``interface`` for a short linear sweep over ``paths``.
+
+	Returns:
+		``interface``.
+	'''
+	interface.setIPAddress(ip_address)
+	interface.setIPPort(1027)
+	interface.setTimeout(500)
+	interface.setMeasurementType(measurement_type)
+	interface.initialize()
+	interface.setHopRate(hop_rate)
+	for tx_path, rx_path in paths:
+		interface.addPathToMeasure(tx_path, rx_path)
+	interface.utilGenerateLinearSweep(startF_mhz=250, stopF_mhz=2100, points=points)
+	return interface
+
+
+@pytest.fixture
+def make_interface():
+	'''
+	Factory for configured :class:`~avmu.avmu_library.AvmuInterface` instances, which are
+	stopped again at the end of the test.
+	'''
+	made = []
+
+	def make(**kwargs):
+		interface = configure(avmu.AvmuInterface(), **kwargs)
+		made.append(interface)
+		return interface
+
+	yield make
+
+	for interface in made:
+		state = interface.getState()
+		if state == 'TASK_RUNNING':
+			interface.haltAsync()
+			state = 'TASK_STARTED'
+		if state == 'TASK_STARTED':
+			interface.stop()
+
+
+@pytest.fixture
+def replay_backend(monkeypatch):
+	'''
+	Factory swapping the loaded backend for a :class:`~avmu.replay.ReplayAvmuDll` replaying a
+	recording, for the rest of the test. Interfaces created after the call use it.
+	'''
+	def load(path, **kwargs):
+		ffi, dummy_lib = dll_loader.load_ffi_interface()
+		kwargs.setdefault('pacing', 'fast')
+		lib = replay.ReplayAvmuDll(ffi, path=path, **kwargs)
+		monkeypatch.setattr(dll_loader, "STATIC_LIB", lib)
+		monkeypatch.setattr(dll_loader, "STATIC_BACKEND", "replay")
+		return lib
+
+	return load
@@ -0,0 +1,130 @@
+'''
+# #########################################################################
+
+FrameAligner gap and restart handling tests.
+
+# #########################################################################
+'''
+
+import time
+
+import numpy as np
+import pytest
+
+from avmu.alignment import FrameAligner
+from avmu.avmu_library import sweep_meta_dtype
+
+
+PATHS = 3
+
+
+def frame(frame_num, counter_bits=32):
+	meta = np.zeros(PATHS, dtype=sweep_meta_dtype())
+	meta['frame_num']    = frame_num % 2 ** counter_bits
+	meta['sweep_number'] = (np.arange(PATHS) + frame_num * PATHS) % 2 ** counter_bits
+	return np.zeros((PATHS, 1, 8), dtype=np.complex128), meta
+
+
+def run(aligner, counters):
+	'''
+	Push frames round-robin. ``counters`` maps unit id -> list of raw frame counters.
+
+	Returns:
+		All the aligned frames, including those from the final flush.
+	'''
+	ret = []
+	for step in range(max(len(tmp) for tmp in counters.values())):
+		for uid, values in counters.items():
+			if step < len(values):
+				ret.extend(aligner.push(uid, *frame(values[step])))
+	ret.extend(aligner.flush())
+	return ret
+
+
+@pytest.mark.parametrize("key", ["frame_num", "sweep_number"])
+@pytest.mark.parametrize("gap_policy", ["drop", "fill"])
+def test_gaps_across_wrap(key, gap_policy):
+	aligner = FrameAligner([0, 1, 2], reorder_window=4, key=key, gap_policy=gap_policy, counter_bits=16)
+	start = 2 ** 16 - 10
+	drops = {0 : {70}, 1 : {10, 11, 50}, 2 : {30}}
+	counters = {uid : [start + idx for idx in range(100) if idx not in drops[uid]] for uid in drops}
+
+	out = run(aligner, counters)
+	indices = [tmp.index for tmp in out]
+	assert indices == sorted(indices)
+
+	stats = aligner.getStatistics()
+	assert stats['gap_frames'] == 5
+	assert stats['complete_frames'] == 95
+	assert stats['missing'] == {0 : 1, 1 : 3, 2 : 1}
+	assert stats['pending_frames'] == 0
+
+	if gap_policy == 'drop':
+		assert len(out) == 95
+		assert all(not tmp.missing for tmp in out)
+	else:
+		assert len(out) == 100
+		partial = [(tmp.index - out[0].index, tmp.missing) for tmp in out if tmp.missing]
+		assert partial == [(10, [1]), (11, [1]), (30, [2]), (50, [1]), (70, [0])]
+		filled = out[10].units[1]
+		assert np.isnan(filled[0]).all()
+		assert not filled[1]['frame_num'].any()
+
+
+def test_large_jump_is_skipped():
+	aligner = FrameAligner([0, 1], reorder_window=8)
+	jump = 10 ** 9
+	counters = {uid : list(range(5)) + list(range(jump, jump + 5)) for uid in (0, 1)}
+
+	started = time.perf_counter()
+	out = run(aligner, counters)
+	# Skipping the gap is a single step, not one per missing index.
+	assert time.perf_counter() - started < 1.0
+
+	assert [tmp.index for tmp in out] == list(range(5)) + list(range(jump, jump + 5))
+	stats = aligner.getStatistics()
+	assert stats['complete_frames'] == 10
+	assert stats['gap_frames'] == jump - 5
+	assert stats['missing'] == {0 : jump - 5, 1 : jump - 5}
+
+
+def test_restart_is_reseeded():
+	aligner = FrameAligner([0, 1], reorder_window=4)
+	# Unit 1 restarts after its 20th frame, and its counter starts again from zero.
+	counters = {
+		0 : list(range(40)),
+		1 : list(range(20)) + list(range(20)),
+	}
+	out = run(aligner, counters)
+
+	stats = aligner.getStatistics()
+	assert stats['restarts'] == {0 : 0, 1 : 1}
+	assert stats['complete_frames'] == 40
+	assert stats['gap_frames'] == 0
+	assert [tmp.index for tmp in out] == list(range(40))
+	for aligned in out:
+		raw = [int(meta[0]['frame_num']) for dummy_data, meta in aligned.units.values()]
+		assert raw[1] == aligned.index % 20
+
+
+def test_late_restart_skips_resolved_indices():
+	aligner = FrameAligner([0, 1], reorder_window=4, gap_policy='fill')
+	# Unit 1 goes quiet for a while and then restarts, by which point unit 0 has
+	# moved on. Its counter has to carry on from the oldest unresolved index,
+	# rather than from its own last frame, or its frames would all arrive late.
+	counters = {
+		0 : list(range(30)),
+		1 : list(range(10)) + [None] * 10 + list(range(10)),
+	}
+	out = []
+	for step in range(30):
+		for uid in (0, 1):
+			if counters[uid][step] is not None:
+				out.extend(aligner.push(uid, *frame(counters[uid][step])))
+	out.extend(aligner.flush())
+
+	stats = aligner.getStatistics()
+	assert stats['restarts'][1] == 1
+	assert stats['late_frames'] == 0
+	assert [tmp.index for tmp in out] == list(range(30))
+	assert stats['complete_frames'] + stats['gap_frames'] == 30
@@ -0,0 +1,95 @@
+'''
+# #########################################################################
+
+Range and Doppler processing tests.
+
+# #########################################################################
+'''
+
+import numpy as np
+import pytest
+
+from avmu import dsp
+
+
+FREQS = np.linspace(250, 2100, 256)
+
+
+@pytest.fixture
+def sweeps():
+	rng = np.random.RandomState(0)
+	shape = (6, 2, 1, len(FREQS))
+	return rng.standard_normal(shape) + 1j * rng.standard_normal(shape)
+
+
+def test_range_matches_ifft(sweeps):
+	processor = dsp.RangeProcessor(FREQS, cable_delay=1.3)
+	out = processor(sweeps)
+
+	# Reference: windowed sweep, zero padded from DC, through a plain iFFT.
+	step   = (FREQS[-1] - FREQS[0]) / (len(FREQS) - 1)
+	start  = int(round(FREQS[0] / step))
+	size   = processor.fft_size
+	padded = np.pad(sweeps[3, 1, 0] * np.hanning(len(FREQS)), (start, size - start - len(FREQS)))
+	expected = np.abs(np.fft.ifft(padded))[:size // 2]
+
+	np.testing.assert_allclose(out[3, 1, 0], expected, rtol=1e-9, atol=1e-12)
+	assert processor.time_axis[0] == pytest.approx(-1.3)
+
+
+def test_zoom_on_grid(sweeps):
+	full = dsp.RangeProcessor(FREQS, cable_delay=1.3, output='complex')
+	expected = full(sweeps)[..., 20:60].copy()
+
+	zoom = dsp.RangeProcessor(FREQS, cable_delay=1.3, output='complex',
+			zoom=(full.time_axis[20], full.time_axis[59]), bins=40)
+	np.testing.assert_allclose(zoom.time_axis, full.time_axis[20:60])
+	np.testing.assert_allclose(zoom(sweeps), expected, rtol=1e-7, atol=1e-9 * np.abs(expected).max())
+
+
+def test_zoom_matches_oversized_ifft(sweeps):
+	# Zooming to a fine time grid has to give the same values as an iFFT
+	# padded far enough to have bins at those times.
+	size = 2048 * 8
+	big  = dsp.RangeProcessor(FREQS, cable_delay=1.3, output='complex', fft_size=size)
+	expected = big(sweeps)[..., 400:721].copy()
+
+	zoom = dsp.RangeProcessor(FREQS, cable_delay=1.3, output='complex', fft_size=size,
+			zoom=(big.time_axis[400], big.time_axis[720]), bins=321)
+	np.testing.assert_allclose(zoom(sweeps), expected, rtol=1e-7, atol=1e-9 * np.abs(expected).max())
+
+
+def test_zoom_db_complex64(sweeps):
+	full = dsp.RangeProcessor(FREQS, output='magnitude')
+	expected = 20 * np.log10(full(sweeps)[..., 10:50])
+
+	zoom = dsp.RangeProcessor(FREQS, output='db', zoom=(full.time_axis[10], full.time_axis[49]),
+			bins=40, dtype=np.complex64)
+	out = zoom(sweeps.astype(np.complex64))
+	assert out.dtype == np.float32
+	np.testing.assert_allclose(out, expected, atol=1e-2)
+
+
+def test_doppler_maps():
+	frames, hop, bins = 16, 4, 8
+	frame_time = 1e-3
+	processor = dsp.DopplerProcessor(bins, frame_time, frames=frames, hop=hop, window=None, output='complex')
+
+	# A target in bin 5, moving at the Doppler frequency of map bin +3.
+	tone = 3.0 / (frames * frame_time)
+	profiles = np.zeros((40, bins), dtype=np.complex128)
+	profiles[:, 5] = np.exp(2j * np.pi * tone * frame_time * np.arange(40))
+
+	maps = [(processor.frames_written, rd_map.copy()) for rd_map in processor.push(profiles)]
+
+	# The first map is as soon as the buffer fills, then one every hop frames.
+	assert [written for written, dummy_map in maps] == [16, 20, 24, 28, 32, 36, 40]
+
+	peak = np.unravel_index(np.argmax(np.abs(maps[-1][1])), maps[-1][1].shape)
+	assert processor.doppler_axis[peak[0]] == pytest.approx(tone)
+	assert peak[1] == 5
+
+	# Each map is the FFT of the most recent frames, in time order.
+	for written, rd_map in maps:
+		expected = np.fft.fftshift(np.fft.fft(profiles[written - frames:written], axis=0), axes=0)
+		np.testing.assert_allclose(rd_map, expected, atol=1e-9)
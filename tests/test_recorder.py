@@ -0,0 +1,93 @@
+'''
+# #########################################################################
+
+SweepRecorder / RecordingReader round-trip tests.
+
+# #########################################################################
+'''
+
+import numpy as np
+import pytest
+
+from avmu import recorder
+
+from conftest import TEST_PATHS
+
+
+@pytest.fixture
+def captured(make_interface):
+	interface = make_interface(points=48, measurement_type="PROG_SYNC")
+	interface.start()
+	plan = recorder.sweep_plan(interface, note="test")
+	data, meta = interface.measureBatch(40)
+	return plan, data.copy(), meta.copy()
+
+
+def write(path, plan, data, meta, **kwargs):
+	with recorder.SweepRecorder(str(path), plan, **kwargs) as rec:
+		for frame in range(len(data)):
+			rec.append(data[frame], meta[frame])
+	return rec.getStatistics()
+
+
+def test_round_trip(tmp_path, captured):
+	plan, data, meta = captured
+	base = tmp_path / "capture"
+
+	# Small chunks and segments, so reads have to span both.
+	frame_bytes = data[0].size * np.dtype(np.complex128).itemsize
+	stats = write(base, plan, data, meta, segment_bytes=frame_bytes * 12, chunk_bytes=frame_bytes * 5)
+	assert stats['frames_written'] == len(data)
+	assert stats['segments'] > 1
+
+	reader = recorder.RecordingReader(str(base))
+	assert len(reader) == len(data)
+	np.testing.assert_array_equal(reader.getFrequencies(), plan['freqs'])
+
+	read_data, read_meta = reader.read()
+	np.testing.assert_array_equal(read_data, data)
+	np.testing.assert_array_equal(read_meta, meta)
+
+	read_data, read_meta = reader.read(3, 33, path=TEST_PATHS[1], receiver=plan['receivers'][0])
+	np.testing.assert_array_equal(read_data, data[3:33, 1, 0])
+	np.testing.assert_array_equal(read_meta, meta[3:33, 1])
+
+	# Paths can also be given as numpy integers, e.g. from np.argmax().
+	read_data, dummy_meta = reader.read(-5, path=np.int64(1))
+	np.testing.assert_array_equal(read_data, data[-5:, 1])
+
+	# The reopened reader uses the index cache, and must agree.
+	reader.close()
+	cached = recorder.RecordingReader(str(base))
+	np.testing.assert_array_equal(cached.read(10, 20)[0], data[10:20])
+	cached.close()
+
+
+def test_complex64_storage(tmp_path, captured):
+	plan, data, meta = captured
+	write(tmp_path / "capture", plan, data, meta, dtype=np.complex64)
+
+	reader = recorder.RecordingReader(str(tmp_path / "capture"))
+	read_data, dummy_meta = reader.read()
+	assert read_data.dtype == np.complex64
+	np.testing.assert_allclose(read_data, data, rtol=1e-6, atol=1e-6 * np.abs(data).max())
+	reader.close()
+
+
+def test_frame_times_across_restart(tmp_path, captured):
+	plan, data, meta = captured
+	plan['frame_time'] = 0.01
+
+	# Frames 0-19 are contiguous, then frame 25 (five dropped), then the
+	# unit restarts and its counter begins again from zero.
+	counters = list(range(20)) + [25] + list(range(19))
+	meta['frame_num'] = np.array(counters)[:, None]
+	write(tmp_path / "capture", plan, data, meta)
+
+	reader = recorder.RecordingReader(str(tmp_path / "capture"))
+	times = reader.frameTimes()
+	expected = np.concatenate([np.arange(20), [25], 26 + np.arange(19)]) * 0.01
+	np.testing.assert_allclose(times, expected)
+	assert reader.frameAtTime(0.25) == 20
+	assert np.all(np.diff(times) > 0)
+	reader.close()
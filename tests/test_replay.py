@@ -0,0 +1,143 @@
+'''
+# #########################################################################
+
+Session recording and replay tests.
+
+# #########################################################################
+'''
+
+import time
+
+import numpy as np
+import pytest
+
+import avmu
+from avmu import replay
+from avmu import sim_backend
+
+from conftest import configure, TEST_PATHS
+
+
+def record_session(path, frames, overrun_at=None):
+	'''
+	Record an async session of ``frames`` frames, started before ``initialize()``. If
+	``overrun_at`` is set, the consumer stalls before that frame, so it fails with
+	``ERR_BYTES``.
+
+	Returns:
+		List of the ``(data, meta)`` of every frame read, or ``None`` for the overrun.
+	'''
+	interface = avmu.AvmuInterface()
+	interface.setIPAddress("10.0.0.1")
+	interface.setIPPort(1027)
+	interface.setTimeout(500)
+	interface.setMeasurementType("PROG_ASYNC")
+	interface.setMetadataFormat('record')
+	interface.startRecording(path)
+	interface.initialize()
+	interface.setHopRate("HOP_90K")
+	for tx_path, rx_path in TEST_PATHS:
+		interface.addPathToMeasure(tx_path, rx_path)
+	interface.utilGenerateLinearSweep(startF_mhz=250, stopF_mhz=2100, points=32)
+	interface.start()
+	interface.beginAsync()
+
+	ret = []
+	try:
+		for frame in range(frames):
+			if frame == overrun_at:
+				time.sleep(0.25)
+				with pytest.raises(avmu.Avmu_Exception_Bytes):
+					interface.measure()
+				ret.append(None)
+				continue
+			interface.measure()
+			data, meta = interface.extractAllPaths()
+			ret.append((data.copy(), meta.copy()))
+	finally:
+		interface.haltAsync()
+		interface.stop()
+		interface.stopRecording()
+	return ret
+
+
+def replay_session(frames):
+	interface = avmu.AvmuInterface()
+	interface.setMetadataFormat('record')
+	configure(interface, points=32)
+	interface.start()
+	interface.beginAsync()
+	ret = []
+	for frame in range(frames):
+		try:
+			interface.measure()
+		except avmu.Avmu_Exception_Bytes:
+			ret.append(None)
+			continue
+		data, meta = interface.extractAllPaths()
+		ret.append((data, meta))
+	return interface, ret
+
+
+def assert_frames_equal(replayed, recorded):
+	assert len(replayed) == len(recorded)
+	for got, expected in zip(replayed, recorded):
+		if expected is None:
+			assert got is None
+			continue
+		np.testing.assert_array_equal(got[0], expected[0])
+		np.testing.assert_array_equal(got[1], expected[1])
+
+
+def test_replay_round_trip(tmp_path, replay_backend):
+	path = str(tmp_path / "session.avmurec")
+	recorded = record_session(path, 12)
+
+	replay_backend(path)
+	interface, replayed = replay_session(12)
+	assert_frames_equal(replayed, recorded)
+
+	# The hardware details come from the recording, not the uninitialized
+	# task the recording was started with.
+	assert interface.getHardwareDetails()['serial_number'] != 0
+
+	# The recording has run out.
+	with pytest.raises(avmu.Avmu_Exception_No_Response):
+		interface.measure()
+	interface.haltAsync()
+	interface.stop()
+
+
+def test_replay_error_codes(tmp_path, replay_backend, monkeypatch):
+	path = str(tmp_path / "session.avmurec")
+	with monkeypatch.context() as patch:
+		# A socket buffer that holds a few dozen frames (of 32 points, on two paths), so
+		# the stall overruns it, but scheduling jitter on the other frames does not.
+		patch.setattr(sim_backend, "SOCKET_BUFFER_BYTES", 32 * 2 * 32 * sim_backend.BYTES_PER_POINT)
+		recorded = record_session(path, 8, overrun_at=4)
+
+	# Return codes are recorded by name, not by value.
+	events = [event for event in replay.read_session(path) if event[0] == 'measure']
+	assert [event[3] for event in events].count('ERR_BYTES') == 1
+
+	# Give the replayed library different values for the codes, as a
+	# different DLL version could. The error must still be mapped by name.
+	lib = replay_backend(path)
+	lib.ERR_BYTES, lib.ERR_NO_RESPONSE = lib.ERR_NO_RESPONSE, lib.ERR_BYTES
+
+	interface, replayed = replay_session(8)
+	assert_frames_equal(replayed, recorded)
+	with pytest.raises(avmu.Avmu_Exception_No_Response):
+		interface.measure()
+	interface.haltAsync()
+	interface.stop()
+
+
+def test_replay_missing_recording(tmp_path, replay_backend):
+	replay_backend(str(tmp_path / "missing.avmurec"))
+	interface = avmu.AvmuInterface()
+	interface.setIPAddress("10.0.0.1")
+	interface.setIPPort(1027)
+	interface.setMeasurementType("PROG_ASYNC")
+	with pytest.raises((IOError, OSError)):
+		interface.initialize()
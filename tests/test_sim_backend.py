@@ -0,0 +1,85 @@
+'''
+# #########################################################################
+
+Task state machine tests, against the simulated backend.
+
+# #########################################################################
+'''
+
+import pytest
+
+import avmu
+from avmu import profiles
+
+from conftest import TEST_PATHS
+
+
+def test_async_state_machine(make_interface):
+	interface = make_interface()
+	assert interface.getState() == 'TASK_STOPPED'
+
+	interface.start()
+	assert interface.getState() == 'TASK_STARTED'
+
+	interface.beginAsync()
+	assert interface.getState() == 'TASK_RUNNING'
+
+	# A running task has to be halted before it can be stopped.
+	with pytest.raises(avmu.Avmu_Exception_Wrong_State):
+		interface.stop()
+	assert interface.getState() == 'TASK_RUNNING'
+
+	interface.measure()
+	assert len(interface.extractAllPaths()) == len(TEST_PATHS)
+
+	interface.haltAsync()
+	assert interface.getState() == 'TASK_STARTED'
+	interface.stop()
+	assert interface.getState() == 'TASK_STOPPED'
+
+	with pytest.raises(avmu.Avmu_Exception_Wrong_State):
+		interface.stop()
+
+
+def test_uninitialized_task():
+	interface = avmu.AvmuInterface()
+	assert interface.getState() == 'TASK_UNINITIALIZED'
+	with pytest.raises(avmu.Avmu_Exception_Wrong_State):
+		interface.start()
+
+
+def test_sync_measure(make_interface):
+	interface = make_interface(measurement_type="PROG_SYNC", points=32)
+	interface.start()
+
+	# Sync tasks are measured from TASK_STARTED, and never run asynchronously.
+	with pytest.raises(avmu.Avmu_Exception_Wrong_Program_Type):
+		interface.beginAsync()
+
+	data, meta = interface.measureBatch(3)
+	assert data.shape == (3, len(TEST_PATHS), 1, 32)
+	assert meta.shape == (3, len(TEST_PATHS))
+	assert list(meta['frame_num'][:, 0]) == sorted(meta['frame_num'][:, 0])
+
+
+@pytest.mark.parametrize("measurement_type", ["PROG_ASYNC", "PROG_SYNC"])
+def test_profile_set_close(measurement_type):
+	path = [("AVMU_TX_PATH_0", "AVMU_RX_PATH_1")]
+	profile_set = profiles.ProfileSet("10.0.0.5", 1030, {
+			'wide' : dict(start_mhz=250,  stop_mhz=2100, points=64, hop_rate='HOP_90K', paths=path),
+			'fine' : dict(start_mhz=1000, stop_mhz=1200, points=32, hop_rate='HOP_90K', paths=path),
+		}, measurement_type=measurement_type)
+	interfaces = list(profile_set.interfaces.values())
+
+	with profile_set:
+		profile_set.build()
+		for name in ('wide', 'fine', 'wide'):
+			profile_set.activate(name)
+			profile_set.active.measure()
+			profile_set.active.extractAllPaths()
+		if measurement_type == 'PROG_ASYNC':
+			assert profile_set.active.getState() == 'TASK_RUNNING'
+
+	# Closing halts the running task before stopping it, rather than raising.
+	assert [interface.getState() for interface in interfaces] == ['TASK_STOPPED', 'TASK_STOPPED']
+	assert not profile_set.interfaces